@@ -0,0 +1,84 @@
+"""Compare nearest-palette-pair selection with and without the color lookup table.
+
+For every lookup table size the selection is timed in approximate mode (pure
+table gather) and exact mode (ambiguous cells refined), next to the exact search
+over all pixels. The mismatch rate is the fraction of pixels whose two closest
+palette indices differ from the exact search.
+
+Usage:
+    python -m benchmarks.color_lut_benchmark [--sizes 1920x2560] [--bits 5 6] [--repeat 3]
+"""
+
+import argparse
+import time
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from models.color_lookup_table import ColorLookupTable
+from processing.color_palette import ColorPalette
+from processing.color_transformer import ColorTransformer
+
+
+def time_selection(transformer: ColorTransformer, pixels, color_palette, repeat: int):
+    times = []
+    for _ in range(repeat):
+        rng = np.random.default_rng(0)
+        start = time.perf_counter()
+        indices = transformer._select_dot_cluster_color_indices(
+            pixels, color_palette, rng
+        )
+        times.append(time.perf_counter() - start)
+    return min(times), indices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["480x640", "1920x2560"])
+    parser.add_argument("--bits", nargs="+", type=int, default=[5, 6])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'size':>12} {'mode':>14} {'build (s)':>10} {'select (s)':>11} "
+        f"{'speedup':>8} {'ambiguous':>10} {'mismatch':>9}"
+    )
+    for size in args.sizes:
+        height, width = (int(value) for value in size.split("x"))
+        img = generate_synthetic_image(height, width)
+        color_palette = ColorPalette(
+            PointillismConfig(palette_engine="histogram", seed=0)
+        ).compute_pointillism_color_palette(img)
+        pixels = img.reshape(-1, 3)
+
+        exact_time, exact_indices = time_selection(
+            ColorTransformer(PointillismConfig()), pixels, color_palette, args.repeat
+        )
+        print(
+            f"{size:>12} {'exact':>14} {0:>10.4f} {exact_time:>11.4f} "
+            f"{1:>8.2f} {'-':>10} {0:>9.4%}"
+        )
+
+        for bits in args.bits:
+            start = time.perf_counter()
+            table = ColorLookupTable(color_palette, bits)
+            build_time = time.perf_counter() - start
+            ambiguous = table.lookup(pixels)[1].mean()
+
+            for exact in (False, True):
+                transformer = ColorTransformer(
+                    PointillismConfig(color_lut_bits=bits, color_lut_exact=exact)
+                )
+                transformer._color_lookup_table = table
+                elapsed, indices = time_selection(
+                    transformer, pixels, color_palette, args.repeat
+                )
+                mismatch = np.any(indices[:, :2] != exact_indices[:, :2], axis=1).mean()
+                mode = f"lut{bits}{'-exact' if exact else ''}"
+                print(
+                    f"{size:>12} {mode:>14} {build_time:>10.4f} {elapsed:>11.4f} "
+                    f"{exact_time / elapsed:>8.2f} {ambiguous:>10.2%} {mismatch:>9.4%}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare the palette engines of ColorPalette on time and palette quality.
+
+Quality is the distortion of the primary colors: the mean squared RGB distance
+between every pixel of the preprocessed image and its nearest primary color.
+
+Usage:
+    python -m benchmarks.palette_benchmark [--sizes 480x640 1920x2560] [--repeat 3]
+"""
+
+import argparse
+import time
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from processing.color_palette import ColorPalette
+from processing.preprocessor import PreProcessor
+
+
+def compute_distortion(img: np.ndarray, primary_colors: np.ndarray) -> float:
+    pixels = img.reshape(-1, 3).astype(np.float64)
+    colors = primary_colors.astype(np.float64)
+    distortion = 0.0
+    for start in range(0, len(pixels), 65536):
+        chunk = pixels[start : start + 65536]
+        distances = np.sum((chunk[:, None, :] - colors[None, :, :]) ** 2, axis=2)
+        distortion += np.min(distances, axis=1).sum()
+    return distortion / len(pixels)
+
+
+def benchmark_engine(engine: str, img: np.ndarray, repeat: int):
+    palette = ColorPalette(PointillismConfig(palette_engine=engine))
+    times, distortions = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        primary_colors = palette._compute_primary_colors(img, np.random.default_rng(0))
+        times.append(time.perf_counter() - start)
+        distortions.append(compute_distortion(img, primary_colors))
+    return min(times), float(np.mean(distortions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["480x640", "1920x2560"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--no-preprocess",
+        action="store_true",
+        help="run on the full-size image instead of the preprocessed one",
+    )
+    args = parser.parse_args()
+
+    print(f"{'size':>12} {'engine':>10} {'time (s)':>10} {'distortion':>12}")
+    for size in args.sizes:
+        height, width = (int(value) for value in size.split("x"))
+        img = generate_synthetic_image(height, width)
+        if not args.no_preprocess:
+            img = PreProcessor(PointillismConfig()).preprocess_image(img)
+        for engine in ColorPalette.PALETTE_ENGINES:
+            elapsed, distortion = benchmark_engine(engine, img, args.repeat)
+            print(f"{size:>12} {engine:>10} {elapsed:>10.4f} {distortion:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compare the nearest-color search over every palette color with the search index.
+
+For every palette size a palette of that many colors is drawn from the image's
+pixels, and the two closest palette colors of every pixel are searched once over
+the whole palette and once through a ColorSearchIndex. The mismatch rate counts the
+pixels whose nearest pair differs, excluding pairs at exactly equal distances.
+
+Usage:
+    python -m benchmarks.palette_search_benchmark [--sizes 480x640]
+        [--palette-sizes 16 64 256] [--space rgb] [--repeat 3]
+"""
+
+import argparse
+import time
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from models.color_search_index import ColorSearchIndex
+
+
+def brute_force_nearest_two(coordinates: np.ndarray, palette: np.ndarray):
+    indices = np.empty((len(coordinates), 2), dtype=np.intp)
+    for start in range(0, len(coordinates), ColorSearchIndex.CHUNK_SIZE):
+        chunk = coordinates[start : start + ColorSearchIndex.CHUNK_SIZE]
+        distances = np.sum((chunk[:, None, :] - palette[None, :, :]) ** 2, axis=2)
+        closest = np.argpartition(distances, 1, axis=1)[:, :2]
+        closest_distances = np.take_along_axis(distances, closest, axis=1)
+        order = np.argsort(closest_distances, axis=1, kind="stable")
+        indices[start : start + len(chunk)] = np.take_along_axis(closest, order, axis=1)
+    return indices
+
+
+def best_time(function, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["480x640"])
+    parser.add_argument(
+        "--palette-sizes", nargs="+", type=int, default=[16, 32, 64, 128, 256]
+    )
+    parser.add_argument("--space", default="rgb", choices=ColorSearchIndex.COLOR_SPACES)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'size':>10} {'colors':>6} {'build (s)':>10} {'full (s)':>9} "
+        f"{'index (s)':>10} {'speedup':>8} {'candidates':>11} {'mismatch':>9}"
+    )
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        height, width = (int(value) for value in size.split("x"))
+        pixels = generate_synthetic_image(height, width).reshape(-1, 3)
+        for palette_size in args.palette_sizes:
+            palette = np.unique(pixels, axis=0)
+            palette = palette[rng.choice(len(palette), palette_size, replace=False)]
+
+            start = time.perf_counter()
+            index = ColorSearchIndex(palette, args.space)
+            build_time = time.perf_counter() - start
+            full_time, expected = best_time(
+                lambda: brute_force_nearest_two(
+                    index.to_color_space(pixels), index.palette_coordinates
+                ),
+                args.repeat,
+            )
+            index_time, indices = best_time(
+                lambda: index.nearest_two(pixels), args.repeat
+            )
+
+            # Differing pairs only count when their distances differ too
+            coordinates = index.to_color_space(pixels)[:, None, :]
+            distances = [
+                np.sum((index.palette_coordinates[pair] - coordinates) ** 2, axis=2)
+                for pair in (expected, indices)
+            ]
+            mismatch = np.any(~np.isclose(distances[0], distances[1]), axis=1).mean()
+            candidates = index.num_candidates.mean()
+            print(
+                f"{size:>10} {palette_size:>6} {build_time:>10.4f} {full_time:>9.4f} "
+                f"{index_time:>10.4f} {full_time / index_time:>8.2f} "
+                f"{candidates:>11.1f} {mismatch:>9.4%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
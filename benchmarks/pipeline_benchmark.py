@@ -0,0 +1,227 @@
+"""Time every pipeline stage and the full Processor across image sizes and configs.
+
+Each case is a synthetic image size combined with a cluster_distance and a
+kernel_size. For every case the stages (preprocess, palette, inverses,
+transform, render) are timed on their own, on the outputs of the previous
+stages, together with end-to-end Processor.apply_pointillism. Times are taken
+over --repeat runs without tracing, then one extra traced run records the peak
+memory allocated with tracemalloc. Images, the palette and every random draw
+are seeded, so runs are comparable across machines and commits.
+
+Usage:
+    python -m benchmarks.pipeline_benchmark run [-o results.json] [--sizes 240x320 480x640]
+        [--cluster-distances 4 6] [--kernel-sizes 7 15] [--repeat 3]
+    python -m benchmarks.pipeline_benchmark compare baseline.json results.json
+        [--time-threshold 0.1] [--min-time-delta 0.005] [--memory-threshold 0.1]
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import cv2
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from processing.color_palette import ColorPalette
+from processing.color_transformer import ColorTransformer
+from processing.image_generator import ImageGenerator
+from processing.preprocessor import PreProcessor
+from processing.processor import Processor
+
+STAGES = ("preprocess", "palette", "inverses", "transform", "render", "end_to_end")
+
+
+def measure(function, repeat: int):
+    """Run function repeat times untraced and once under tracemalloc.
+
+    Returns:
+        Tuple of the run times in seconds, the peak traced memory in bytes and the
+        result of the last run
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return times, peak_memory, result
+
+
+def benchmark_case(
+    height: int, width: int, cluster_distance: int, kernel_size: int, repeat: int
+):
+    config = PointillismConfig(
+        cluster_distance=cluster_distance, kernel_size=kernel_size, seed=0
+    )
+    img = generate_synthetic_image(height, width)
+    preprocessor = PreProcessor(config)
+    color_palette = ColorPalette(config)
+    color_transformer = ColorTransformer(config)
+    image_generator = ImageGenerator(config)
+    processor = Processor(config)
+
+    outputs = {}
+    stage_functions = {
+        "preprocess": lambda: preprocessor.preprocess_image(img),
+        "palette": lambda: color_palette.compute_pointillism_color_palette(
+            outputs["preprocess"]
+        ),
+        "inverses": lambda: color_palette.compute_color_triple_inverses(
+            outputs["palette"]
+        ),
+        "transform": lambda: color_transformer.transform(
+            outputs["preprocess"], outputs["palette"], outputs["inverses"]
+        ),
+        "render": lambda: image_generator.generate(
+            outputs["transform"], outputs["preprocess"]
+        ),
+        "end_to_end": lambda: processor.apply_pointillism(img),
+    }
+
+    results = []
+    for stage in STAGES:
+        times, peak_memory, outputs[stage] = measure(stage_functions[stage], repeat)
+        results.append(
+            {
+                "case": f"{height}x{width}-cd{cluster_distance}-k{kernel_size}",
+                "height": height,
+                "width": width,
+                "cluster_distance": cluster_distance,
+                "kernel_size": kernel_size,
+                "stage": stage,
+                "time_min": min(times),
+                "time_median": statistics.median(times),
+                "peak_memory_bytes": peak_memory,
+            }
+        )
+        print(
+            f"{results[-1]['case']:>20} {stage:>11} {min(times):>10.4f}s "
+            f"{peak_memory / 2**20:>10.1f} MiB",
+            file=sys.stderr,
+        )
+    return results
+
+
+def run(args):
+    results = []
+    cases = itertools.product(args.sizes, args.cluster_distances, args.kernel_sizes)
+    for size, cluster_distance, kernel_size in cases:
+        height, width = (int(value) for value in size.split("x"))
+        results.extend(
+            benchmark_case(height, width, cluster_distance, kernel_size, args.repeat)
+        )
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+def compare(args):
+    """Print per-stage ratios against the baseline, exit with 1 on any regression."""
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    baseline_results = {
+        (result["case"], result["stage"]): result for result in baseline["results"]
+    }
+    regressions = 0
+    print(f"{'case':>20} {'stage':>11} {'time':>8} {'memory':>8}")
+    for result in current["results"]:
+        key = (result["case"], result["stage"])
+        if key not in baseline_results:
+            print(f"{key[0]:>20} {key[1]:>11} {'new':>8}")
+            continue
+        reference = baseline_results[key]
+        time_ratio = result["time_min"] / max(reference["time_min"], 1e-9)
+        memory_ratio = result["peak_memory_bytes"] / max(
+            reference["peak_memory_bytes"], 1
+        )
+        flags = []
+        time_delta = result["time_min"] - reference["time_min"]
+        if time_ratio > 1 + args.time_threshold and time_delta > args.min_time_delta:
+            flags.append("SLOWER")
+        if memory_ratio > 1 + args.memory_threshold:
+            flags.append("MORE MEMORY")
+        regressions += bool(flags)
+        print(
+            f"{key[0]:>20} {key[1]:>11} {time_ratio:>7.2f}x {memory_ratio:>7.2f}x "
+            f"{' '.join(flags)}"
+        )
+
+    if regressions:
+        print(f"{regressions} regression(s) against {args.baseline}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("-o", "--output", help="JSON file, stdout by default")
+    run_parser.add_argument("--sizes", nargs="+", default=["240x320", "480x640"])
+    run_parser.add_argument("--cluster-distances", nargs="+", type=int, default=[4, 6])
+    run_parser.add_argument("--kernel-sizes", nargs="+", type=int, default=[7, 15])
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.set_defaults(function=run)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="flag regressions against a saved baseline"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--time-threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown flagged as a regression",
+    )
+    compare_parser.add_argument(
+        "--min-time-delta",
+        type=float,
+        default=0.005,
+        help="slowdowns below this many seconds are timing noise, not regressions",
+    )
+    compare_parser.add_argument(
+        "--memory-threshold",
+        type=float,
+        default=0.1,
+        help="relative peak memory increase flagged as a regression",
+    )
+    compare_parser.set_defaults(function=compare)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
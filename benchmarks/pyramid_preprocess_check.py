@@ -0,0 +1,95 @@
+"""Compare the pyramid preprocess engine with the direct one over a parameter sweep.
+
+For every image size the source is preprocessed with each kernel_size and
+cluster_distance pair by both engines. The script prints the pyramid level used,
+the mean and 99.9th percentile absolute difference to the direct output and the
+time of both engines. The pyramid time includes hashing the source to look up
+its pyramid but not building the pyramid, which is reported once per source. It exits with status 1 when the mean difference
+exceeds --mean-tolerance or the 99.9th percentile exceeds --tail-tolerance.
+
+Usage:
+    python -m benchmarks.pyramid_preprocess_check [--sizes 480x640 1200x1600]
+        [--kernel-sizes 5 9 15 21 31] [--cluster-distances 2 4 6 8 12]
+        [--mean-tolerance 0.5] [--tail-tolerance 6]
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from processing.image_pyramid import ImagePyramid
+from processing.preprocessor import PreProcessor
+
+
+def timed_preprocess(config: PointillismConfig, img: np.ndarray):
+    preprocessor = PreProcessor(config)
+    start = time.perf_counter()
+    preprocessed_image = preprocessor.preprocess_image(img)
+    return preprocessed_image, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["480x640", "1200x1600"])
+    parser.add_argument(
+        "--kernel-sizes", nargs="+", type=int, default=[5, 9, 15, 21, 31]
+    )
+    parser.add_argument(
+        "--cluster-distances", nargs="+", type=int, default=[2, 4, 6, 8, 12]
+    )
+    parser.add_argument("--mean-tolerance", type=float, default=0.5)
+    parser.add_argument("--tail-tolerance", type=float, default=6)
+    args = parser.parse_args()
+
+    failures = 0
+    for size in args.sizes:
+        height, width = (int(value) for value in size.split("x"))
+        img = generate_synthetic_image(height, width)
+        start = time.perf_counter()
+        pyramid = ImagePyramid(img)
+        print(
+            f"{size}: {len(pyramid.levels)} pyramid levels built in "
+            f"{time.perf_counter() - start:.4f}s"
+        )
+        print(
+            f"{'kernel':>6} {'distance':>8} {'level':>5} {'mean diff':>9} "
+            f"{'p99.9 diff':>10} {'direct (s)':>10} {'pyramid (s)':>11} {'ok':>5}"
+        )
+        # Warm the pyramid cache, so the sweep only times serving from it
+        PreProcessor(PointillismConfig(preprocess_engine="pyramid")).preprocess_image(
+            img
+        )
+        for kernel_size in args.kernel_sizes:
+            for cluster_distance in args.cluster_distances:
+                config = PointillismConfig(
+                    kernel_size=kernel_size, cluster_distance=cluster_distance
+                )
+                direct, direct_time = timed_preprocess(config, img)
+                config.preprocess_engine = "pyramid"
+                served, pyramid_time = timed_preprocess(config, img)
+                sigma = 0.3 * ((kernel_size - 1) * 0.5 - 1) + 0.8
+                level = pyramid.select_level(sigma, cluster_distance)
+
+                difference = np.abs(direct.astype(np.int16) - served)
+                mean_difference = float(difference.mean())
+                tail_difference = float(np.percentile(difference, 99.9))
+                ok = (
+                    mean_difference <= args.mean_tolerance
+                    and tail_difference <= args.tail_tolerance
+                )
+                failures += not ok
+                print(
+                    f"{kernel_size:>6} {cluster_distance:>8} {level:>5} "
+                    f"{mean_difference:>9.3f} {tail_difference:>10.1f} "
+                    f"{direct_time:>10.4f} {pyramid_time:>11.4f} {str(ok):>5}"
+                )
+
+    if failures:
+        print(f"{failures} setting(s) exceed the tolerances")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
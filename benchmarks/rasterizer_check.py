@@ -0,0 +1,76 @@
+"""Check that every rasterizer backend renders pixel-identical images and time them.
+
+Each available backend renders the same synthetic images with the same seed for
+several brushstroke radii, with opaque dots as only those go through the
+rasterizer. The script exits with status 1 if any canvas differs from the
+reference backend's, so it can gate choosing a backend per deployment.
+
+Usage:
+    python -m benchmarks.rasterizer_check [--sizes 120x160 480x640] [--radii 1 2 3]
+        [--reference numpy]
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from processing.processor import Processor
+from processing.rasterizers import available_rasterizers
+
+
+def render(img: np.ndarray, radius: int, rasterizer: str):
+    # Translucent dots are composited without the rasterizer, so draw opaque ones
+    config = PointillismConfig(
+        seed=0, brushstroke_radius=radius, rasterizer=rasterizer, opacity=1.0
+    )
+    processor = Processor(config)
+    palette_rng, transform_rng, render_rng = processor.create_stage_rngs()
+    preprocessed_image, dot_clusters = processor._compute_dot_clusters(
+        img, palette_rng, transform_rng
+    )
+    start = time.perf_counter()
+    canvas = processor.image_generator.generate(
+        dot_clusters, preprocessed_image, render_rng
+    )
+    return canvas, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["120x160", "480x640"])
+    parser.add_argument("--radii", nargs="+", type=int, default=[1, 2, 3])
+    parser.add_argument("--reference", default="numpy")
+    args = parser.parse_args()
+
+    backends = available_rasterizers()
+    if args.reference not in backends:
+        parser.error(f"reference backend {args.reference} is not available")
+    print(f"available backends: {', '.join(backends)}")
+    print(
+        f"{'size':>10} {'radius':>6} {'backend':>8} {'render (s)':>11} {'identical':>9}"
+    )
+
+    mismatches = 0
+    for size in args.sizes:
+        height, width = (int(value) for value in size.split("x"))
+        img = generate_synthetic_image(height, width)
+        for radius in args.radii:
+            reference, _ = render(img, radius, args.reference)
+            for backend in backends:
+                canvas, elapsed = render(img, radius, backend)
+                identical = np.array_equal(canvas, reference)
+                mismatches += not identical
+                print(
+                    f"{size:>10} {radius:>6} {backend:>8} {elapsed:>11.4f} "
+                    f"{str(identical):>9}"
+                )
+
+    if mismatches:
+        print(f"{mismatches} render(s) differ from the {args.reference} backend")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
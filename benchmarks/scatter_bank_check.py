@@ -0,0 +1,104 @@
+"""Check that scatter-pattern-bank renders look like renders with sampled offsets.
+
+Renders with a pattern bank cannot match sampled renders pixel for pixel, since
+the dot offsets come from a different random stream. Instead every canvas is
+blurred at the scale of the cluster spacing, and the mean absolute difference
+of the blurred bank render to a sampled render is compared with the difference
+between two sampled renders with different seeds, the noise floor. The script
+exits with status 1 when a bank render differs by more than --tolerance times
+the noise floor.
+
+Usage:
+    python -m benchmarks.scatter_bank_check [--sizes 480x640] [--bank-sizes 256 2048]
+        [--opacities 1 0.5] [--tolerance 1.5]
+"""
+
+import argparse
+import dataclasses
+import sys
+import time
+import cv2
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from processing.image_generator import ImageGenerator
+from processing.processor import Processor
+
+
+def blurred_difference(canvas: np.ndarray, reference: np.ndarray, sigma: float):
+    blurred = [
+        cv2.GaussianBlur(image.astype(np.float32), (0, 0), sigma)
+        for image in (canvas, reference)
+    ]
+    return float(np.abs(blurred[0] - blurred[1]).mean())
+
+
+def timed_render(generator: ImageGenerator, dot_clusters, preprocessed_image, seed):
+    start = time.perf_counter()
+    canvas = generator.generate(
+        dot_clusters, preprocessed_image, np.random.default_rng(seed)
+    )
+    return canvas, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["480x640"])
+    parser.add_argument("--bank-sizes", nargs="+", type=int, default=[256, 2048])
+    parser.add_argument("--opacities", nargs="+", type=float, default=[1, 0.5])
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    args = parser.parse_args()
+
+    print(
+        f"{'size':>10} {'opacity':>7} {'bank':>6} {'build (s)':>10} "
+        f"{'render (s)':>11} {'difference':>11} {'noise floor':>12} {'ok':>5}"
+    )
+    failures = 0
+    for size in args.sizes:
+        height, width = (int(value) for value in size.split("x"))
+        img = generate_synthetic_image(height, width)
+        for opacity in args.opacities:
+            config = PointillismConfig(seed=0, opacity=opacity)
+            processor = Processor(config)
+            palette_rng, transform_rng, _ = processor.create_stage_rngs()
+            preprocessed_image, dot_clusters = processor._compute_dot_clusters(
+                img, palette_rng, transform_rng
+            )
+            sigma = config.cluster_distance
+            reference, render_time = timed_render(
+                processor.image_generator, dot_clusters, preprocessed_image, 1
+            )
+            resampled, _ = timed_render(
+                processor.image_generator, dot_clusters, preprocessed_image, 2
+            )
+            noise_floor = blurred_difference(resampled, reference, sigma)
+            print(
+                f"{size:>10} {opacity:>7} {'-':>6} {0:>10.3f} {render_time:>11.3f} "
+                f"{noise_floor:>11.3f} {noise_floor:>12.3f} {'-':>5}"
+            )
+
+            for bank_size in args.bank_sizes:
+                start = time.perf_counter()
+                generator = ImageGenerator(
+                    dataclasses.replace(config, scatter_pattern_bank_size=bank_size)
+                )
+                build_time = time.perf_counter() - start
+                canvas, render_time = timed_render(
+                    generator, dot_clusters, preprocessed_image, 1
+                )
+                difference = blurred_difference(canvas, reference, sigma)
+                ok = difference <= args.tolerance * noise_floor
+                failures += not ok
+                print(
+                    f"{size:>10} {opacity:>7} {bank_size:>6} {build_time:>10.3f} "
+                    f"{render_time:>11.3f} {difference:>11.3f} {noise_floor:>12.3f} "
+                    f"{str(ok):>5}"
+                )
+
+    if failures:
+        print(f"{failures} bank render(s) exceed {args.tolerance}x the noise floor")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Drive the render service with concurrent requests and report its latency.
+
+Without --url a RenderService is started in-process on a free local port. Every
+client thread sends the same synthetic PNG in a loop until --requests have been
+sent in total, pausing for --backoff seconds after a 503. The script prints the throughput, the client-side latency
+percentiles of successful requests, the share of requests rejected with 503 and
+the service's own /stats.
+
+Usage:
+    python -m benchmarks.service_load_test [--size 240x320] [--concurrency 8]
+        [--requests 64] [--workers 2] [--max-queue 4] [--url http://127.0.0.1:8080]
+"""
+
+import argparse
+import io
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from PIL import Image
+from processing.render_service import RenderService, create_server
+
+
+def send_request(url: str, body: bytes):
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/octet-stream"}
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        error.read()
+        return error.code
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--url", default=None, help="running service, e.g. http://host:port"
+    )
+    parser.add_argument("--size", default="240x320")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-queue", type=int, default=4)
+    parser.add_argument("--query", default="seed=0", help="config overrides to send")
+    parser.add_argument(
+        "--backoff", type=float, default=0.05, help="seconds to wait after a 503"
+    )
+    args = parser.parse_args()
+
+    server = service = None
+    base_url = args.url
+    if base_url is None:
+        service = RenderService(PointillismConfig(), args.workers, args.max_queue)
+        server = create_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_port}"
+    render_url = f"{base_url}/render?{args.query}"
+
+    height, width = (int(value) for value in args.size.split("x"))
+    encoded = io.BytesIO()
+    Image.fromarray(generate_synthetic_image(height, width)).save(encoded, "PNG")
+    body = encoded.getvalue()
+
+    request_numbers = itertools.count()
+    lock = threading.Lock()
+    statuses = Counter()
+    latencies = []
+
+    def client():
+        while next(request_numbers) < args.requests:
+            start = time.perf_counter()
+            status = send_request(render_url, body)
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] += 1
+                if status == 200:
+                    latencies.append(elapsed)
+            if status == 503:
+                time.sleep(args.backoff)
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.requests} requests in {elapsed:.2f}s from {args.concurrency} clients")
+    print(f"status codes: {dict(sorted(statuses.items()))}")
+    print(f"throughput: {statuses[200] / elapsed:.2f} renders/s")
+    print(f"rejected (503): {statuses[503] / args.requests:.1%}")
+    if latencies:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print(f"latency p50 {p50:.3f}s p90 {p90:.3f}s p99 {p99:.3f}s")
+    with urllib.request.urlopen(f"{base_url}/stats") as response:
+        print(f"service stats: {json.dumps(json.load(response))}")
+
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
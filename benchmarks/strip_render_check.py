@@ -0,0 +1,95 @@
+"""Check that strip-wise rendering to a file matches the in-memory render.
+
+Every synthetic image is rendered once with apply_pointillism and once with
+render_to_file for each output format and strip height, both seeded alike. The
+script prints the render time and the peak traced memory of both paths and exits
+with status 1 if any written image differs from the in-memory canvas.
+
+Usage:
+    python -m benchmarks.strip_render_check [--sizes 480x640] [--strip-heights 64 512]
+        [--opacities 0.5 1]
+"""
+
+import argparse
+import dataclasses
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from PIL import Image
+from processing.processor import Processor
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def read_output(path: str) -> np.ndarray:
+    if path.endswith(".npy"):
+        return np.load(path)
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["480x640"])
+    parser.add_argument("--strip-heights", nargs="+", type=int, default=[64, 512])
+    parser.add_argument("--opacities", nargs="+", type=float, default=[0.5, 1])
+    parser.add_argument("--formats", nargs="+", default=["png", "npy"])
+    args = parser.parse_args()
+
+    print(
+        f"{'size':>10} {'opacity':>7} {'mode':>12} {'render (s)':>11} "
+        f"{'peak (MB)':>10} {'identical':>9}"
+    )
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            height, width = (int(value) for value in size.split("x"))
+            img = generate_synthetic_image(height, width)
+            for opacity in args.opacities:
+                config = PointillismConfig(seed=0, opacity=opacity)
+                reference, elapsed, peak = measure(
+                    lambda: Processor(config).apply_pointillism(img)
+                )
+                print(
+                    f"{size:>10} {opacity:>7} {'in memory':>12} {elapsed:>11.4f} "
+                    f"{peak / 2**20:>10.1f} {'-':>9}"
+                )
+                for strip_height in args.strip_heights:
+                    processor = Processor(
+                        dataclasses.replace(config, render_strip_height=strip_height)
+                    )
+                    for image_format in args.formats:
+                        path = os.path.join(directory, f"output.{image_format}")
+                        _, elapsed, peak = measure(
+                            lambda: processor.render_to_file(img, path)
+                        )
+                        identical = np.array_equal(read_output(path), reference)
+                        mismatches += not identical
+                        mode = f"{image_format} {strip_height}"
+                        print(
+                            f"{size:>10} {opacity:>7} {mode:>12} {elapsed:>11.4f} "
+                            f"{peak / 2**20:>10.1f} {str(identical):>9}"
+                        )
+
+    if mismatches:
+        print(f"{mismatches} strip render(s) differ from the in-memory render")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Time a parameter sweep run config by config against Processor.sweep.
+
+Every config of the sweep is a seeded default config with one grid point of
+--radii x --opacities x --kernel-sizes, so configs share preprocessing when they
+agree on the kernel size and share everything before rendering when they only
+differ in render fields. The script prints both times, the stage cache counts of
+the sweep and whether every sweep result equals the config-by-config one.
+
+Usage:
+    python -m benchmarks.sweep_benchmark [--size 480x640] [--radii 1 2 3]
+        [--opacities 0.5 1] [--kernel-sizes 15] [--max-workers 4]
+"""
+
+import argparse
+import itertools
+import time
+import numpy as np
+from benchmarks.synthetic_images import generate_synthetic_image
+from configs.config import PointillismConfig
+from processing.processor import Processor
+from processing.stage_cache import StageCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="480x640")
+    parser.add_argument("--radii", nargs="+", type=int, default=[1, 2, 3])
+    parser.add_argument("--opacities", nargs="+", type=float, default=[0.5, 1])
+    parser.add_argument("--kernel-sizes", nargs="+", type=int, default=[15])
+    parser.add_argument("--max-workers", type=int, default=None)
+    args = parser.parse_args()
+
+    height, width = (int(value) for value in args.size.split("x"))
+    img = generate_synthetic_image(height, width)
+    configs = [
+        PointillismConfig(
+            seed=0, brushstroke_radius=radius, opacity=opacity, kernel_size=kernel
+        )
+        for radius, opacity, kernel in itertools.product(
+            args.radii, args.opacities, args.kernel_sizes
+        )
+    ]
+
+    start = time.perf_counter()
+    expected = [Processor(config).apply_pointillism(img) for config in configs]
+    sequential_time = time.perf_counter() - start
+
+    processor = Processor(stage_cache=StageCache())
+    start = time.perf_counter()
+    canvases = processor.sweep(img, configs, args.max_workers)
+    sweep_time = time.perf_counter() - start
+
+    identical = all(
+        np.array_equal(canvas, reference)
+        for canvas, reference in zip(canvases, expected)
+    )
+    print(f"{len(configs)} configs on a {args.size} image")
+    print(f"config by config: {sequential_time:.2f}s")
+    print(f"sweep:            {sweep_time:.2f}s ({sequential_time / sweep_time:.2f}x)")
+    print(f"stage cache: {processor.stage_cache.stats}")
+    print(f"identical results: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+def generate_synthetic_image(height: int, width: int, seed: int = 0) -> np.ndarray:
+    """Generate a deterministic RGB test image of shape (height, width, 3).
+
+    The image mixes smooth color gradients, a few flat color blobs and mild noise,
+    so it has both large uniform regions and fine detail like a photograph.
+
+    Args:
+        height: Image height in pixels
+        width: Image width in pixels
+        seed: Seed of the noise and blob layout
+
+    Returns:
+        uint8 RGB image
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    y /= max(height - 1, 1)
+    x /= max(width - 1, 1)
+
+    image = np.stack(
+        (
+            255 * x,
+            255 * (0.5 + 0.5 * np.sin(2 * np.pi * (x + y))),
+            255 * (1 - y),
+        ),
+        axis=-1,
+    )
+    for _ in range(6):
+        center_y, center_x = rng.uniform(0, 1, size=2)
+        radius = rng.uniform(0.05, 0.25)
+        inside = (y - center_y) ** 2 + (x - center_x) ** 2 < radius**2
+        image[inside] = rng.uniform(0, 255, size=3)
+
+    image += rng.normal(0, 8, size=image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
@@ -9,9 +10,40 @@ class PointillismConfig:
     cluster_distance: int = 6
     intensity_alpha: int = 100
     gamma_distortion: float = 1.8
-    scatter_distribution_mean = 6  # mu
-    scatter_distribution_std = 6  # sigma
-    brushstroke_radius = 2
-    opacity = 0.5
+    # Source rows per preprocessing strip, 0 preprocesses the whole image in memory
+    preprocess_strip_height: int = 0
+    # "direct" or "pyramid", which serves every kernel_size and cluster_distance
+    # from one image pyramid per source, close to but not exactly like "direct"
+    preprocess_engine: str = "direct"
+    # Color palette parameters
+    palette_size: int = 16  # half primary colors, half complementary colors
+    palette_engine: str = "kmeans"  # "kmeans" or "histogram"
+    palette_histogram_bits: int = 5  # bits per channel of the histogram engine
+    palette_cache_dir: Optional[str] = None  # on-disk palette cache, None disables it
+    palette_cache_size: int = 256  # max cached palettes, least recently used evicted
+    # Bits per channel of the nearest-color lookup table, 0 searches every pixel
+    color_lut_bits: int = 0
+    # Refine pixels of ambiguous lookup table cells with an exact search
+    color_lut_exact: bool = True
+    # Space the nearest palette colors are searched in: "rgb" or "lab"
+    color_search_space: str = "rgb"
+    scatter_distribution_mean: float = 6  # mu
+    scatter_distribution_std: float = 6  # sigma
+    # Precomputed scatter patterns dots are taken from, 0 samples every dot offset
+    scatter_pattern_bank_size: int = 0
+    brushstroke_radius: int = 2
+    opacity: float = 0.5  # dot opacity in (0, 1], 1 draws opaque dots
+    # Canvas rows per strip when streaming the output to a file, 0 renders in memory
+    render_strip_height: int = 0
+    # Dot drawing backend: "auto", "numba", "numpy" or "opencv"
+    rasterizer: str = "auto"
+    # Random seed of every stage, None draws fresh entropy on every run
+    seed: Optional[int] = None
+    # On-disk cache of rendered images, used for seeded runs only, None disables it
+    render_cache_dir: Optional[str] = None
+    render_cache_size: int = 64  # max cached renders, least recently used evicted
     # Debug mode
     debug_mode: bool = False
+    debug_output_dir: str = "images/output"  # where debug artifacts are saved
+    debug_format: str = "jpg"  # "png", "jpg" or "npy"
+    debug_queue_size: int = 8  # artifacts waiting to be saved, more are dropped
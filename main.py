@@ -1,37 +1,93 @@
+import argparse
+import sys
+import time
 from configs import PointillismConfig
-from PIL import Image
-import numpy as np
-from processing.processor import Processor
+from processing.batch_runner import BatchRunner
 
 
 def main():
-    # Initialize configuration
-    config = PointillismConfig(debug_mode=True, kernel_size=15)
-
-    # Initialize all required classes
-    processor = Processor(config)
-
-    # Load and convert image to numpy array
-    beach = "images/beach.jpg"
-    brandon = "images/brandon.png"
-    coffee = "images/coffee.jpeg"
-    forest = "images/forest.jpeg"
-    group = "images/group.JPG"
+    parser = argparse.ArgumentParser(
+        description="Apply the pointillism filter to a batch of images."
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="input image paths or glob patterns, e.g. 'images/*.jpg'",
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default="images/output", help="directory for the results"
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--format", default="png", help="output image format extension (default: png)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="process inputs whose output is up to date"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="random seed, the same seed always gives the same output",
+    )
+    parser.add_argument(
+        "--strip-height",
+        type=int,
+        default=0,
+        help="render png/npy outputs in strips of this many rows, bounding memory "
+        "use on large outputs (default: 0, render in memory)",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        help="append per-stage timings and counts to this JSON Lines file",
+    )
+    parser.add_argument("--debug", action="store_true", help="enable debug output")
+    parser.add_argument(
+        "--debug-dir",
+        default="images/output",
+        help="directory for debug artifacts (default: images/output)",
+    )
+    parser.add_argument(
+        "--debug-format",
+        default="jpg",
+        choices=("png", "jpg", "npy"),
+        help="format of debug artifacts (default: jpg)",
+    )
+    args = parser.parse_args()
 
-    image = Image.open(beach)
-    print("Original pillow size:", image.size)
-
-    numpy_array = np.array(image)
-    print("Original numpy shape:", numpy_array.shape)
-
-    # Save the image
-    if config.debug_mode:
-        img = Image.fromarray(numpy_array)
-        print("after pillow size:", img.size)
-        img.save("images/output/initial.jpg")
+    # Initialize configuration
+    config = PointillismConfig(
+        debug_mode=args.debug,
+        debug_output_dir=args.debug_dir,
+        debug_format=args.debug_format,
+        kernel_size=15,
+        seed=args.seed,
+        render_strip_height=args.strip_height,
+    )
 
-    processor.apply_pointillism(numpy_array)
+    runner = BatchRunner(
+        config,
+        workers=args.workers,
+        output_extension="." + args.format.lstrip("."),
+        force=args.force,
+        metrics_path=args.metrics,
+    )
+    start = time.perf_counter()
+    results = runner.run(args.inputs, args.output_dir)
+    failures = [result for result in results if result["error"] is not None]
+    print(
+        f"Processed {len(results) - len(failures)} images, {len(failures)} failed, "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return 1 if failures else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,3 +1,14 @@
 from .dot_cluster import DotCluster
+from .dot_cluster_batch import DotClusterBatch, DotClusterView
+from .color_lookup_table import ColorLookupTable
+from .color_search_index import ColorSearchIndex
+from .color_triple_inverses import ColorTripleInverses
 
-__all__ = ["DotCluster"]
+__all__ = [
+    "DotCluster",
+    "DotClusterBatch",
+    "DotClusterView",
+    "ColorLookupTable",
+    "ColorSearchIndex",
+    "ColorTripleInverses",
+]
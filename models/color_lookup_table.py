@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class ColorLookupTable:
+    """Table of the two nearest palette colors for every cell of a quantized RGB cube.
+
+    Every channel is cut into 2**bits equal intervals, giving (2**bits)**3 cells of
+    side 2**(8 - bits) values. For every cell the two palette colors nearest to the
+    cell center are stored, closest first, so selecting the nearest pair for a pixel
+    is a single gather.
+
+    A pixel can sit up to `half_diagonal` away from its cell center, which moves its
+    distance to any palette color by at most as much. A cell is flagged `ambiguous`
+    when the gap between its nearest and second nearest color, or between its
+    second and third nearest color, is at most twice that: some pixels of the cell
+    may then have a different nearest pair than the center. In every other cell the
+    stored pair is exact for all pixels.
+    """
+
+    CHUNK_SIZE = 65536  # cells per distance matrix chunk
+    GAP_TOLERANCE = 1e-6
+
+    def __init__(self, color_palette: np.ndarray, bits: int):
+        if not isinstance(color_palette, np.ndarray) or color_palette.ndim != 2:
+            raise ValueError("color_palette must be a numpy array of shape (m, 3)")
+        if color_palette.shape[1] != 3 or len(color_palette) < 3:
+            raise ValueError(
+                "color_palette must be a numpy array of shape (m, 3), m >= 3"
+            )
+        if not 1 <= bits <= 8:
+            raise ValueError("bits must be between 1 and 8")
+
+        self.color_palette = color_palette
+        self.bits = bits
+        cell_size = 1 << (8 - bits)
+        self.half_diagonal = np.sqrt(3) * (cell_size - 1) / 2
+
+        # Cell centers, cells numbered by (r_cell << 2 * bits) | (g_cell << bits) | b_cell
+        cells_per_axis = 1 << bits
+        axis_centers = np.arange(cells_per_axis) * cell_size + (cell_size - 1) / 2
+        r, g, b = np.meshgrid(axis_centers, axis_centers, axis_centers, indexing="ij")
+        centers = np.stack((r.ravel(), g.ravel(), b.ravel()), axis=1)
+
+        num_cells = len(centers)
+        palette = color_palette.astype(np.float64)
+        self.closest = np.empty(
+            (num_cells, 2), dtype=np.uint8 if len(palette) <= 256 else np.intp
+        )
+        self.ambiguous = np.empty(num_cells, dtype=bool)
+        for start in range(0, num_cells, self.CHUNK_SIZE):
+            chunk = centers[start : start + self.CHUNK_SIZE]
+            distances = np.sqrt(
+                np.sum((chunk[:, None, :] - palette[None, :, :]) ** 2, axis=2)
+            )
+            nearest = np.argpartition(distances, 2, axis=1)[:, :3]
+            nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+            order = np.argsort(nearest_distances, axis=1, kind="stable")
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+
+            stop = start + len(chunk)
+            self.closest[start:stop] = nearest[:, :2]
+            gaps = np.diff(nearest_distances, axis=1)
+            # The tolerance keeps rounding errors from hiding exact ties at cell corners
+            self.ambiguous[start:stop] = np.any(
+                gaps <= 2 * self.half_diagonal + self.GAP_TOLERANCE, axis=1
+            )
+
+    def matches(self, color_palette: np.ndarray) -> bool:
+        """Whether the table was built for color_palette."""
+        return np.array_equal(self.color_palette, color_palette)
+
+    def lookup(self, pixels: np.ndarray):
+        """Gather the nearest palette pair of an (n, 3) array of uint8 RGB pixels.
+
+        Returns:
+            Tuple of the (n, 2) palette indices, closest first, and an (n,) boolean
+            array marking pixels in ambiguous cells
+        """
+        shift = 8 - self.bits
+        cells = pixels.astype(np.intp) >> shift
+        flat_indices = (
+            (cells[:, 0] << (2 * self.bits)) | (cells[:, 1] << self.bits) | cells[:, 2]
+        )
+        return self.closest[flat_indices], self.ambiguous[flat_indices]
@@ -0,0 +1,134 @@
+import numpy as np
+from utils.color_space import rgb_to_lab
+
+
+class ColorSearchIndex:
+    """Grid-bucket index of the two palette colors nearest to a pixel.
+
+    The color space is cut into a grid of box-shaped cells. For every cell the index
+    keeps the palette colors that can be nearest or second nearest to some point of
+    the cell: every point of the cell is at most the second smallest of the
+    colors' farthest-point distances away from its second nearest color, so colors
+    whose closest-point distance to the cell exceeds that bound are never among its
+    two nearest. A pixel is then only compared with the candidates of its cell,
+    usually a handful even for palettes of hundreds of colors, so the search cost
+    grows far slower than the palette size.
+
+    Distances are measured in RGB or in CIE L*a*b*. The result matches a search over
+    the whole palette, up to the order of colors at exactly equal distances.
+    """
+
+    COLOR_SPACES = ("rgb", "lab")
+    CHUNK_SIZE = 65536  # pixels (or cells while building) per distance matrix chunk
+    # L*a*b* bounds of all 8-bit sRGB colors, rounded outwards
+    LAB_GAMUT_LOW = np.array([0.0, -86.5, -108.0])
+    LAB_GAMUT_HIGH = np.array([100.5, 98.5, 94.5])
+
+    def __init__(
+        self, color_palette: np.ndarray, color_space: str = "rgb", cells_per_axis=16
+    ):
+        if not isinstance(color_palette, np.ndarray) or color_palette.ndim != 2:
+            raise ValueError("color_palette must be a numpy array of shape (m, 3)")
+        if color_palette.shape[1] != 3 or len(color_palette) < 2:
+            raise ValueError(
+                "color_palette must be a numpy array of shape (m, 3), m >= 2"
+            )
+        if color_space not in self.COLOR_SPACES:
+            raise ValueError(
+                f"Unknown color space: {color_space}. Expected one of {self.COLOR_SPACES}"
+            )
+        self.color_palette = color_palette
+        self.color_space = color_space
+        self.palette_coordinates = self.to_color_space(color_palette)
+
+        # Grid bounds cover every 8-bit RGB color in the search space
+        if color_space == "rgb":
+            self.low, self.high = np.zeros(3), np.full(3, 255.0)
+        else:
+            self.low, self.high = self.LAB_GAMUT_LOW, self.LAB_GAMUT_HIGH
+        self.cells_per_axis = cells_per_axis
+        self.cell_size = (self.high - self.low) / cells_per_axis
+
+        # Box of every cell, cells numbered in row-major (axis 0, 1, 2) order
+        steps = np.arange(cells_per_axis)
+        grid = np.stack(
+            [axis.ravel() for axis in np.meshgrid(steps, steps, steps, indexing="ij")],
+            axis=1,
+        )
+        cell_low = self.low + grid * self.cell_size
+        cell_high = cell_low + self.cell_size
+
+        candidate_lists = []
+        for start in range(0, len(grid), self.CHUNK_SIZE):
+            low = cell_low[start : start + self.CHUNK_SIZE, None, :]
+            high = cell_high[start : start + self.CHUNK_SIZE, None, :]
+            colors = self.palette_coordinates[None, :, :]
+            nearest_offsets = np.maximum(np.maximum(low - colors, colors - high), 0)
+            farthest_offsets = np.maximum(np.abs(colors - low), np.abs(colors - high))
+            min_distances = np.sum(nearest_offsets**2, axis=2)
+            max_distances = np.sum(farthest_offsets**2, axis=2)
+            bounds = np.partition(max_distances, 1, axis=1)[:, 1]
+            # Slack for rounding, extra candidates never change the result
+            candidate_lists.append(min_distances <= bounds[:, None] * (1 + 1e-9))
+        is_candidate = np.concatenate(candidate_lists)
+
+        # Candidates per cell, padded with -1 to the largest count
+        self.num_candidates = is_candidate.sum(axis=1)
+        self.candidates = np.full(
+            (len(grid), self.num_candidates.max()), -1, dtype=np.intp
+        )
+        cells, colors = np.nonzero(is_candidate)
+        ranks = np.arange(len(cells)) - np.repeat(
+            np.cumsum(self.num_candidates) - self.num_candidates, self.num_candidates
+        )
+        self.candidates[cells, ranks] = colors
+
+    def to_color_space(self, rgb: np.ndarray) -> np.ndarray:
+        """Coordinates of RGB colors in the search space, as float64."""
+        if self.color_space == "lab":
+            return rgb_to_lab(rgb)
+        return np.asarray(rgb, dtype=np.float64)
+
+    def matches(self, color_palette: np.ndarray, color_space: str) -> bool:
+        return color_space == self.color_space and np.array_equal(
+            color_palette, self.color_palette
+        )
+
+    def nearest_two(self, pixels: np.ndarray) -> np.ndarray:
+        """Indices of the two palette colors nearest to every RGB pixel.
+
+        Returns:
+            np.ndarray: Palette indices of shape (n, 2), closest first
+        """
+        indices = np.empty((len(pixels), 2), dtype=np.intp)
+        for start in range(0, len(pixels), self.CHUNK_SIZE):
+            chunk = self.to_color_space(pixels[start : start + self.CHUNK_SIZE])
+            indices[start : start + len(chunk)] = self._nearest_two(chunk)
+        return indices
+
+    def _nearest_two(self, coordinates: np.ndarray) -> np.ndarray:
+        axis_cells = np.floor((coordinates - self.low) / self.cell_size).astype(np.intp)
+        np.clip(axis_cells, 0, self.cells_per_axis - 1, out=axis_cells)
+        cells = (
+            axis_cells[:, 0] * self.cells_per_axis + axis_cells[:, 1]
+        ) * self.cells_per_axis + axis_cells[:, 2]
+
+        # Pixels are grouped by their cell's candidate count rounded up to a power
+        # of two, so each group pads only its own candidate lists
+        counts = self.num_candidates[cells]
+        widths = 1 << np.ceil(np.log2(np.maximum(counts, 2))).astype(np.intp)
+        widths = np.minimum(widths, self.candidates.shape[1])
+        indices = np.empty((len(coordinates), 2), dtype=np.intp)
+        for width in np.unique(widths):
+            group = np.flatnonzero(widths == width)
+            candidates = self.candidates[cells[group], :width]
+            offsets = self.palette_coordinates[candidates] - coordinates[group, None, :]
+            distances = np.sum(offsets**2, axis=2)
+            distances[candidates < 0] = np.inf
+            closest = np.argpartition(distances, 1, axis=1)[:, :2]
+            closest_distances = np.take_along_axis(distances, closest, axis=1)
+            order = np.argsort(closest_distances, axis=1, kind="stable")
+            indices[group] = np.take_along_axis(
+                np.take_along_axis(candidates, closest, axis=1), order, axis=1
+            )
+        return indices
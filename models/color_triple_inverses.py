@@ -0,0 +1,63 @@
+import numpy as np
+
+
+class ColorTripleInverses:
+    """Table of inverse color matrices for every ordered triple of palette colors.
+
+    A dot cluster's color weights solve Q = C^-1 · P, where the rows of C are the
+    three selected palette colors. The palette is fixed for the whole image, so the
+    inverses are computed once per palette and weight computation becomes a gather
+    plus a matmul per pixel.
+
+    Triples whose matrix is singular or near-singular (condition number above
+    MAX_CONDITION_NUMBER, e.g. repeated or collinear colors) are flagged in
+    `singular` and store the Moore-Penrose pseudo-inverse instead, so their weights
+    are the least-squares solution rather than raising LinAlgError.
+    """
+
+    MAX_CONDITION_NUMBER = 1e8
+
+    def __init__(self, color_palette: np.ndarray):
+        if not isinstance(color_palette, np.ndarray) or color_palette.ndim != 2:
+            raise ValueError("color_palette must be a numpy array of shape (m, 3)")
+        if color_palette.shape[1] != 3:
+            raise ValueError("color_palette must be a numpy array of shape (m, 3)")
+
+        self.num_colors = len(color_palette)
+        i, j, k = np.meshgrid(*[np.arange(self.num_colors)] * 3, indexing="ij")
+        triples = np.stack((i.ravel(), j.ravel(), k.ravel()), axis=1)
+        matrices = color_palette[triples].astype(np.float64)
+        self.inverses, self.singular = self.compute_inverses(matrices)
+
+    @classmethod
+    def compute_inverses(cls, matrices: np.ndarray):
+        """Invert a stack of 3x3 color matrices, falling back to the pseudo-inverse.
+
+        Args:
+            matrices: Array of shape (n, 3, 3)
+
+        Returns:
+            Tuple of the (n, 3, 3) inverses and an (n,) boolean array marking the
+            singular or near-singular matrices that got a pseudo-inverse
+        """
+        with np.errstate(divide="ignore", invalid="ignore"):
+            condition_numbers = np.linalg.cond(matrices)
+        singular = ~(condition_numbers <= cls.MAX_CONDITION_NUMBER)
+
+        inverses = np.empty_like(matrices, dtype=np.float64)
+        inverses[~singular] = np.linalg.inv(matrices[~singular])
+        if np.any(singular):
+            inverses[singular] = np.linalg.pinv(matrices[singular])
+        return inverses, singular
+
+    def lookup(self, color_indices: np.ndarray):
+        """Gather the inverse matrices for an (n, 3) array of palette index triples.
+
+        Returns:
+            Tuple of the (n, 3, 3) inverses and the (n,) singular flags
+        """
+        m = self.num_colors
+        flat_indices = (
+            color_indices[:, 0] * m * m + color_indices[:, 1] * m + color_indices[:, 2]
+        )
+        return self.inverses[flat_indices], self.singular[flat_indices]
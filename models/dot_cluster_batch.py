@@ -0,0 +1,231 @@
+import numpy as np
+from models.color_triple_inverses import ColorTripleInverses
+
+
+class DotClusterBatch:
+    """Struct-of-arrays collection of dot clusters.
+
+    Holds the data of every dot cluster of an image as contiguous NumPy arrays,
+    so weights and dot counts are computed with a handful of batched operations
+    instead of one DotCluster object per pixel. Index the batch (or iterate over
+    it) to get a DotClusterView of a single cluster for debugging.
+    """
+
+    # Per-cluster arrays, all indexed by cluster along the first axis
+    _CLUSTER_ARRAYS = (
+        "positions",
+        "pixel_colors",
+        "color_indices",
+        "intensities",
+        "color_weights",
+        "singular",
+        "dot_counts",
+    )
+    # Weight sums closer to zero than this count as cancelled out, see
+    # _compute_color_dot_counts
+    WEIGHT_SUM_EPSILON = 1e-6
+
+    def __init__(
+        self,
+        positions,
+        pixel_colors,
+        color_palette,
+        color_indices,
+        alpha,
+        intensities,
+        color_triple_inverses: ColorTripleInverses = None,
+    ):
+        positions = np.asarray(positions)
+        intensities = np.asarray(intensities).reshape(-1)
+        color_indices = np.asarray(color_indices)
+
+        # Validate pixel colors are valid RGB arrays with values between 0-255
+        if not isinstance(pixel_colors, np.ndarray) or pixel_colors.ndim != 2:
+            raise ValueError("pixel_colors must be a numpy array of shape (n, 3)")
+        if pixel_colors.shape[1] != 3:
+            raise ValueError("pixel_colors must be a numpy array of shape (n, 3)")
+        if not np.issubdtype(pixel_colors.dtype, np.integer):
+            raise ValueError("pixel_colors must contain integer values")
+        if np.any(pixel_colors < 0) or np.any(pixel_colors > 255):
+            raise ValueError("pixel_colors values must be between 0 and 255")
+
+        # Validate the palette the selected colors are taken from
+        if not isinstance(color_palette, np.ndarray) or color_palette.ndim != 2:
+            raise ValueError("color_palette must be a numpy array of shape (m, 3)")
+        if color_palette.shape[1] != 3:
+            raise ValueError("color_palette must be a numpy array of shape (m, 3)")
+        if not np.issubdtype(color_palette.dtype, np.integer):
+            raise ValueError("Selected colors must contain integer values")
+        if np.any(color_palette < 0) or np.any(color_palette > 255):
+            raise ValueError("Selected color values must be between 0 and 255")
+
+        # Validate every cluster selects 3 colors from the palette
+        num_clusters = len(pixel_colors)
+        if color_indices.shape != (num_clusters, 3):
+            raise ValueError("color_indices must be an array of shape (n, 3)")
+        if not np.issubdtype(color_indices.dtype, np.integer):
+            raise ValueError("color_indices must contain integer values")
+        if np.any(color_indices < 0) or np.any(color_indices >= len(color_palette)):
+            raise ValueError("color_indices must index into the color palette")
+        if positions.shape != (num_clusters, 2):
+            raise ValueError("positions must be an array of shape (n, 2)")
+        if intensities.shape != (num_clusters,):
+            raise ValueError("intensities must contain one value per cluster")
+
+        self.positions = np.ascontiguousarray(positions)
+        self.pixel_colors = np.ascontiguousarray(pixel_colors)
+        self.color_palette = color_palette
+        self.color_indices = np.ascontiguousarray(color_indices)
+        self.alpha = alpha
+        self.intensities = np.ascontiguousarray(intensities)
+        self.color_weights, self.singular = self._compute_color_weights(
+            color_triple_inverses
+        )
+        self.dot_counts = self._compute_color_dot_counts()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index: int) -> "DotClusterView":
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("DotClusterBatch index out of range")
+        return DotClusterView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield DotClusterView(self, index)
+
+    def __str__(self):
+        return f"DotClusterBatch(num_clusters={len(self)}, num_colors={len(self.color_palette)})"
+
+    @property
+    def selected_colors(self) -> np.ndarray:
+        """RGB values of the selected colors, shape (n, 3, 3)."""
+        return self.color_palette[self.color_indices]
+
+    def select(self, indices: np.ndarray) -> "DotClusterBatch":
+        """Return a new batch holding the clusters at `indices`, in that order.
+
+        Weights and dot counts are copied rather than recomputed.
+        """
+        batch = DotClusterBatch.__new__(DotClusterBatch)
+        batch.color_palette = self.color_palette
+        batch.alpha = self.alpha
+        for name in self._CLUSTER_ARRAYS:
+            setattr(batch, name, getattr(self, name)[indices])
+        return batch
+
+    def replace(self, indices: np.ndarray, other: "DotClusterBatch"):
+        """Overwrite the clusters at `indices` in place with the clusters of `other`.
+
+        Both batches must share the same color palette and alpha.
+
+        Raises:
+            ValueError: If `other` does not hold one cluster per index or uses a
+                different palette or alpha
+        """
+        if len(other) != len(indices):
+            raise ValueError("other must hold one cluster per index")
+        if other.alpha != self.alpha or not np.array_equal(
+            other.color_palette, self.color_palette
+        ):
+            raise ValueError("other must use the same color palette and alpha")
+        for name in self._CLUSTER_ARRAYS:
+            getattr(self, name)[indices] = getattr(other, name)
+
+    def _compute_color_weights(self, color_triple_inverses: ColorTripleInverses):
+        """
+        Compute the weights (Q) for the selected colors of every cluster.
+        Solves the equation Q = C^-1 · P per cluster where:
+        - C is a 3x3 matrix containing the RGB values of the three selected colors
+        - P is a 3x1 matrix containing the RGB values of the original pixel
+        - Q is a 3x1 matrix of weights for each selected color
+
+        C^-1 is gathered from the precomputed color_triple_inverses table when given,
+        otherwise it is computed once per distinct color triple in the batch.
+        Singular triples use the pseudo-inverse (see ColorTripleInverses).
+
+        Returns:
+            Tuple of an (n, 3) array of weights for each selected color and an (n,)
+            boolean array marking clusters whose color matrix was singular
+        """
+        if color_triple_inverses is not None:
+            C_inv, singular = color_triple_inverses.lookup(self.color_indices)
+        else:
+            triples, inverse_indices = np.unique(
+                self.color_indices, axis=0, return_inverse=True
+            )
+            inverse_indices = inverse_indices.reshape(-1)
+            C = self.color_palette[triples].astype(np.float64)
+            triple_inverses, triple_singular = ColorTripleInverses.compute_inverses(C)
+            C_inv = triple_inverses[inverse_indices]
+            singular = triple_singular[inverse_indices]
+
+        P = self.pixel_colors.astype(np.float64)[:, :, None]
+        Q = np.matmul(C_inv, P)
+        return Q[:, :, 0], singular
+
+    def _compute_color_dot_counts(self) -> np.ndarray:
+        """
+        Compute the number of dots for each selected color based on the color weights and intensity.
+
+        Returns:
+            np.ndarray: An (n, 3) array containing the number of dots for each selected color
+        """
+        # Same arithmetic as DotCluster: alpha * intensity stays in the intensity dtype
+        weight_sums = np.sum(self.color_weights, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rhs = (self.alpha * self.intensities) / weight_sums
+        dot_counts = self.color_weights * rhs[:, None]
+        # Clusters whose weights cancel out (e.g. black pixels) get no dots, also when
+        # rounding leaves a tiny sum that would blow the counts up
+        cancelled = ~np.isfinite(rhs) | (np.abs(weight_sums) < self.WEIGHT_SUM_EPSILON)
+        dot_counts[cancelled] = 0
+        return dot_counts
+
+
+class DotClusterView:
+    """Read-only view of a single cluster in a DotClusterBatch.
+
+    Exposes the same attributes as DotCluster without copying the batch data.
+    """
+
+    __slots__ = ("_batch", "_index")
+
+    def __init__(self, batch: DotClusterBatch, index: int):
+        self._batch = batch
+        self._index = index
+
+    def __str__(self):
+        return f"DotCluster(pos={self.position}, pixel_color={self.pixel_color}, selected_colors={self.selected_colors}, color_weights={self.color_weights})"
+
+    @property
+    def position(self):
+        x, y = self._batch.positions[self._index]
+        return (x, y)
+
+    @property
+    def pixel_color(self) -> np.ndarray:
+        return self._batch.pixel_colors[self._index]
+
+    @property
+    def selected_colors(self) -> np.ndarray:
+        return self._batch.color_palette[self._batch.color_indices[self._index]]
+
+    @property
+    def alpha(self):
+        return self._batch.alpha
+
+    @property
+    def intensity(self):
+        return self._batch.intensities[self._index]
+
+    @property
+    def color_weights(self) -> np.ndarray:
+        return self._batch.color_weights[self._index]
+
+    @property
+    def dot_counts(self) -> np.ndarray:
+        return self._batch.dot_counts[self._index]
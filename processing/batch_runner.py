@@ -0,0 +1,307 @@
+import glob
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+from configs.config import PointillismConfig
+from PIL import Image
+from processing.image_source import open_image_source
+from processing.instrumentation import JsonLinesMetricsSink
+from processing.processor import Processor
+from processing.strip_writers import STRIP_WRITERS
+
+
+class BatchRunner:
+    """Applies the pointillism filter to many images on a pool of worker processes.
+
+    Every worker keeps one warm Processor for all of its files. Inside a worker a
+    decoder thread and an encoder thread run next to the render loop, connected by
+    bounded queues, so reading the next image and writing the previous result
+    overlap with rendering. Outputs newer than their input are skipped. With
+    config.render_strip_height > 0, PNG and .npy outputs are rendered and written
+    strip by strip instead, without holding the full canvas in memory.
+
+    When a worker process dies, e.g. killed for running out of memory, the jobs it
+    had taken are reported as failed and the other workers carry on.
+    """
+
+    # Seconds to wait for a result before checking whether workers died
+    POLL_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        config: PointillismConfig = None,
+        workers: int = None,
+        output_extension: str = ".png",
+        force: bool = False,
+        queue_size: int = 2,
+        metrics_path: str = None,
+    ):
+        self.config = config or PointillismConfig()
+        self.workers = workers or os.cpu_count() or 1
+        if self.workers < 1:
+            raise ValueError("workers must be a positive integer.")
+        if queue_size < 1:
+            raise ValueError("queue_size must be a positive integer.")
+        self.output_extension = output_extension
+        self.force = force
+        self.queue_size = queue_size
+        # JSON Lines file every worker appends its per-stage metrics to, None disables them
+        self.metrics_path = metrics_path
+
+    def collect_jobs(
+        self, input_patterns: Sequence[str], output_dir: str
+    ) -> Tuple[List[Tuple[str, str]], List[str]]:
+        """Expand the input globs into (input path, output path) jobs.
+
+        Returns:
+            Tuple of the jobs to run and the input paths skipped as up to date
+
+        Raises:
+            ValueError: If two inputs would write the same output file
+        """
+        input_paths = []
+        for pattern in input_patterns:
+            matches = sorted(glob.glob(pattern, recursive=True))
+            input_paths.extend(path for path in matches if os.path.isfile(path))
+        input_paths = list(dict.fromkeys(input_paths))
+
+        jobs, skipped, outputs = [], [], {}
+        for input_path in input_paths:
+            stem = os.path.splitext(os.path.basename(input_path))[0]
+            output_path = os.path.join(output_dir, stem + self.output_extension)
+            if output_path in outputs:
+                raise ValueError(
+                    f"{input_path} and {outputs[output_path]} both write {output_path}"
+                )
+            outputs[output_path] = input_path
+            if not self.force and self._is_up_to_date(input_path, output_path):
+                skipped.append(input_path)
+            else:
+                jobs.append((input_path, output_path))
+        return jobs, skipped
+
+    def run(self, input_patterns: Sequence[str], output_dir: str) -> List[Dict]:
+        """Process every image matching input_patterns into output_dir.
+
+        Returns:
+            One result dict per processed file with its input and output paths,
+            decode/render/encode/total times in seconds and an error message or None
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        jobs, skipped = self.collect_jobs(input_patterns, output_dir)
+        for input_path in skipped:
+            print(f"skipped {input_path} (up to date)")
+        if not jobs:
+            return []
+
+        workers = min(self.workers, len(jobs))
+        task_queue = multiprocessing.Queue()
+        result_queue = multiprocessing.Queue()
+        for index, job in enumerate(jobs):
+            task_queue.put((index, *job))
+        for _ in range(workers):
+            task_queue.put(None)
+
+        processes = [
+            multiprocessing.Process(
+                target=_run_batch_worker,
+                args=(
+                    worker,
+                    self.config,
+                    task_queue,
+                    result_queue,
+                    self.queue_size,
+                    self.metrics_path,
+                ),
+                daemon=True,
+            )
+            for worker in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        results = []
+        pending = set(range(len(jobs)))
+        # Worker holding every job taken but not yet reported
+        claims = {}
+
+        def fail(index: int, reason: str):
+            result = _new_result(*jobs[index])
+            result["error"] = reason
+            pending.discard(index)
+            claims.pop(index, None)
+            results.append(result)
+            self._report(result, len(results), len(jobs))
+
+        try:
+            while pending:
+                try:
+                    kind, worker, index, result = result_queue.get(
+                        timeout=self.POLL_INTERVAL
+                    )
+                except queue.Empty:
+                    # Everything sent so far is read, so jobs still claimed by a
+                    # dead worker will never be reported
+                    for index, worker in list(claims.items()):
+                        exitcode = processes[worker].exitcode
+                        if exitcode is not None:
+                            fail(index, f"worker process exited with code {exitcode}")
+                    if not any(process.is_alive() for process in processes):
+                        for index in sorted(pending):
+                            fail(index, "no worker process left to run the job")
+                    continue
+                if kind == "claim":
+                    claims[index] = worker
+                    continue
+                pending.discard(index)
+                claims.pop(index, None)
+                results.append(result)
+                self._report(result, len(results), len(jobs))
+        finally:
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+        return results
+
+    @staticmethod
+    def _is_up_to_date(input_path: str, output_path: str) -> bool:
+        try:
+            return os.path.getmtime(output_path) >= os.path.getmtime(input_path)
+        except OSError:
+            return False
+
+    @staticmethod
+    def _report(result: Dict, done: int, total: int):
+        if result["error"] is not None:
+            print(f"[{done}/{total}] {result['input']} failed: {result['error']}")
+            return
+        print(
+            f"[{done}/{total}] {result['input']} -> {result['output']} "
+            f"decode {result['decode_time']:.2f}s render {result['render_time']:.2f}s "
+            f"encode {result['encode_time']:.2f}s total {result['total_time']:.2f}s"
+        )
+
+
+def _run_batch_worker(
+    worker, config, task_queue, result_queue, queue_size, metrics_path
+):
+    """Worker process: decode, render and encode jobs until a None job arrives.
+
+    Every job is announced as ("claim", worker, job index, None) when it is taken
+    and reported as ("result", worker, job index, result dict) when it is done.
+    """
+    metrics_sink = None
+    if metrics_path is not None:
+        metrics_sink = JsonLinesMetricsSink(metrics_path)
+    processor = Processor(config, metrics_sink=metrics_sink)
+    decoded = queue.Queue(maxsize=queue_size)
+    rendered = queue.Queue(maxsize=queue_size)
+
+    def decode():
+        while True:
+            job = task_queue.get()
+            if job is None:
+                decoded.put(None)
+                return
+            index, input_path, output_path = job
+            result_queue.put(("claim", worker, index, None))
+            start = time.perf_counter()
+            result = _new_result(input_path, output_path)
+            try:
+                image = open_image_source(input_path)
+            except Exception as error:
+                image = None
+                result["error"] = f"{type(error).__name__}: {error}"
+            result["decode_time"] = time.perf_counter() - start
+            decoded.put((index, image, result, start))
+
+    def encode():
+        while True:
+            item = rendered.get()
+            if item is None:
+                return
+            index, canvas, result, job_start = item
+            if canvas is not None:
+                start = time.perf_counter()
+                try:
+                    _save_image(canvas, result["output"])
+                except Exception as error:
+                    result["error"] = f"{type(error).__name__}: {error}"
+                result["encode_time"] = time.perf_counter() - start
+            result["total_time"] = time.perf_counter() - job_start
+            result_queue.put(("result", worker, index, result))
+
+    decoder = threading.Thread(target=decode, daemon=True)
+    encoder = threading.Thread(target=encode, daemon=True)
+    decoder.start()
+    encoder.start()
+
+    while True:
+        item = decoded.get()
+        if item is None:
+            break
+        index, image, result, job_start = item
+        canvas = None
+        if image is not None:
+            start = time.perf_counter()
+            extension = os.path.splitext(result["output"])[1].lower()
+            try:
+                if config.render_strip_height > 0 and extension in STRIP_WRITERS:
+                    # Strips are encoded as they are rendered, no canvas to hand over
+                    _replace_atomically(
+                        result["output"],
+                        lambda path: processor.render_to_file(image, path, extension),
+                    )
+                else:
+                    canvas = processor.apply_pointillism(image)
+            except Exception as error:
+                result["error"] = f"{type(error).__name__}: {error}"
+            result["render_time"] = time.perf_counter() - start
+        del image
+        rendered.put((index, canvas, result, job_start))
+
+    rendered.put(None)
+    encoder.join()
+    # Worker processes skip atexit handlers, so save pending debug artifacts here
+    if processor.debug_writer is not None:
+        processor.debug_writer.close()
+
+
+def _new_result(input_path: str, output_path: str) -> Dict:
+    return {
+        "input": input_path,
+        "output": output_path,
+        "decode_time": 0.0,
+        "render_time": 0.0,
+        "encode_time": 0.0,
+        "total_time": 0.0,
+        "error": None,
+    }
+
+
+def _save_image(canvas, output_path: str):
+    image_format = Image.registered_extensions().get(
+        os.path.splitext(output_path)[1].lower()
+    )
+    _replace_atomically(
+        output_path,
+        lambda path: Image.fromarray(canvas, "RGB").save(path, format=image_format),
+    )
+
+
+def _replace_atomically(output_path: str, write):
+    """Call write with a path next to output_path and rename the file into place,
+    so an interrupted run never leaves a partial file that looks up to date."""
+    directory, name = os.path.split(output_path)
+    temporary_path = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    try:
+        write(temporary_path)
+        os.replace(temporary_path, output_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
@@ -1,45 +1,106 @@
-import colorsys
 from typing import List, Tuple
 import cv2
 import numpy as np
 from configs.config import PointillismConfig
+from processing.disk_cache import content_hash
+from utils.color_space import hsv_to_rgb, rgb_to_hsv
+from models.color_triple_inverses import ColorTripleInverses
 from PIL import Image
 
 
 class ColorPalette:
-    COLOR_PALETTE_LENGTH = 16  # 8 primary colors + 8 complementary colors
+    PALETTE_ENGINES = ("kmeans", "histogram")
+    HISTOGRAM_KMEANS_ATTEMPTS = 10
+    HISTOGRAM_KMEANS_MAX_ITER = 10
+    HISTOGRAM_KMEANS_EPS = 1.0
+    # Config fields that change the computed palette, part of the palette cache key
+    CACHE_KEY_FIELDS = (
+        "palette_size",
+        "palette_engine",
+        "palette_histogram_bits",
+        "seed",
+    )
+    # Largest palette whose m**3 color triple inverses are precomputed
+    MAX_TRIPLE_TABLE_COLORS = 64
 
     def __init__(self, config: PointillismConfig = None):
         self.config = config or PointillismConfig()
 
-    def compute_pointillism_color_palette(self, img: np.ndarray) -> np.ndarray:
+    def compute_pointillism_color_palette(
+        self, img: np.ndarray, rng: np.random.Generator = None
+    ) -> np.ndarray:
         """
         Select color palette for pointillism image by applying k-means clustering, color transformation, and adding complementary colors
         Args:
             img: Input image as numpy array (height, width, channels)
+            rng: Random generator of every random draw, seeded from config.seed when omitted
 
         Returns:
-            List of 16 colors (8 primary + 8 complementary)
+            List of config.palette_size colors, the primary colors followed by as
+            many complementary colors
         """
         if self.config.debug_mode:
             print("--Generating Color Palette--")
-        primary_colors = self._compute_primary_colors(img)
+        self._validate_palette_size()
+        if rng is None:
+            rng = np.random.default_rng(self.config.seed)
+        primary_colors = self._compute_primary_colors(img, rng)
         enhanced_primary_colors = self._enhance_color_palette(primary_colors)
         complementary_colors = self._compute_complementary_colors(
-            enhanced_primary_colors
+            enhanced_primary_colors, rng
         )
-        print(np.vstack((enhanced_primary_colors, complementary_colors)))
         if self.config.debug_mode:
+            print(np.vstack((enhanced_primary_colors, complementary_colors)))
             print("--Finished Generating Color Palette--")
         # Combine primary and complementary colors into a single list
         color_palette = np.vstack((enhanced_primary_colors, complementary_colors))
         self.validate_color_palette(color_palette)
         return np.vstack((enhanced_primary_colors, complementary_colors))
 
-    def _compute_primary_colors(self, img: np.ndarray) -> np.ndarray:
+    def cache_key(self, img: np.ndarray) -> str:
+        """Palette cache key of an image: its content hash plus the CACHE_KEY_FIELDS
+        Args:
+            img: Preprocessed image as numpy array (height, width, channels)
+
+        Returns:
+            Hex digest identifying the palette computed for img with this config
+        """
+        fields = ",".join(
+            f"{field}={getattr(self.config, field)!r}"
+            for field in self.CACHE_KEY_FIELDS
+        )
+        return content_hash(img, np.frombuffer(fields.encode(), dtype=np.uint8))
+
+    def _compute_primary_colors(
+        self, img: np.ndarray, rng: np.random.Generator
+    ) -> np.ndarray:
+        """Extract num_colors primary colors with the configured palette engine
+        Args:
+            img: Input image as numpy array (height, width, channels)
+            rng: Random generator of the k-means seeding
+
+        Returns:
+            List of num_colors RGB primary colors
+        """
+        if self.config.palette_engine not in self.PALETTE_ENGINES:
+            raise ValueError(
+                f"Unknown palette engine: {self.config.palette_engine}. "
+                f"Expected one of {self.PALETTE_ENGINES}"
+            )
+        if self.config.palette_engine == "histogram":
+            return self._compute_primary_colors_histogram(img, rng)
+        return self._compute_primary_colors_kmeans(img, rng)
+
+    def _compute_primary_colors_kmeans(
+        self, img: np.ndarray, rng: np.random.Generator
+    ) -> np.ndarray:
         """Apply k-means clustering to extract num_colors primary colors
+
+        cv2.kmeans draws its random centers from OpenCV's global RNG, which is
+        seeded from rng first so the result only depends on rng.
         Args:
             img: Input image as numpy array (height, width, channels)
+            rng: Random generator the OpenCV RNG seed is drawn from
 
         Returns:
             List of num_colors RGB primary colors
@@ -49,12 +110,125 @@ class ColorPalette:
         flattened_img = img.reshape((-1, 3))  # reshape pixels to a (h*w,3) shape
         flattened_img = np.float32(flattened_img)
         criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+        cv2.setRNGSeed(int(rng.integers(2**31)))
         _, labels, centers = cv2.kmeans(
-            flattened_img, 8, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS
+            flattened_img,
+            self.config.palette_size // 2,
+            None,
+            criteria,
+            10,
+            cv2.KMEANS_RANDOM_CENTERS,
         )
         primary_colors = np.uint8(centers)
         return np.uint8(primary_colors)
 
+    def _compute_primary_colors_histogram(
+        self, img: np.ndarray, rng: np.random.Generator
+    ) -> np.ndarray:
+        """Extract num_colors primary colors with k-means over a quantized color histogram
+
+        Pixels are binned into a 3-D histogram with palette_histogram_bits bits per
+        channel. Weighted k-means (k-means++ seeding) then runs on the mean colors of
+        the occupied bins, weighted by their pixel counts, so the cost depends on the
+        number of distinct colors rather than on the number of pixels.
+
+        Args:
+            img: Input image as numpy array (height, width, channels)
+            rng: Random generator of the k-means++ seeding
+
+        Returns:
+            List of num_colors RGB primary colors
+        """
+        bits = self.config.palette_histogram_bits
+        if not 1 <= bits <= 8:
+            raise ValueError("palette_histogram_bits must be between 1 and 8")
+        if self.config.debug_mode:
+            print(f"Computing primary colors from a {bits}-bit color histogram")
+
+        pixels = img.reshape((-1, 3))
+        quantized = (pixels >> (8 - bits)).astype(np.int64)
+        bin_indices = (quantized[:, 0] << (2 * bits)) | (quantized[:, 1] << bits)
+        bin_indices |= quantized[:, 2]
+        num_bins = 1 << (3 * bits)
+        counts = np.bincount(bin_indices, minlength=num_bins)
+        occupied = np.nonzero(counts)[0]
+        weights = counts[occupied].astype(np.float64)
+        # Represent every occupied bin by the mean color of its pixels
+        colors = np.column_stack(
+            [
+                np.bincount(
+                    bin_indices, weights=pixels[:, channel], minlength=num_bins
+                )[occupied]
+                for channel in range(3)
+            ]
+        )
+        colors /= weights[:, None]
+
+        best_centers, best_distortion = None, np.inf
+        for _ in range(self.HISTOGRAM_KMEANS_ATTEMPTS):
+            centers, distortion = self._weighted_kmeans(
+                colors, weights, self.config.palette_size // 2, rng
+            )
+            if distortion < best_distortion:
+                best_centers, best_distortion = centers, distortion
+        return np.uint8(best_centers)
+
+    def _weighted_kmeans(
+        self,
+        points: np.ndarray,
+        weights: np.ndarray,
+        k: int,
+        rng: np.random.Generator,
+    ):
+        """Weighted k-means with k-means++ seeding
+
+        Args:
+            points: Array of shape (n, 3)
+            weights: Array of shape (n,) with the weight of every point
+            k: Number of clusters
+            rng: Random generator of the seeding
+
+        Returns:
+            Tuple of the (k, 3) centers and the weighted sum of squared distances
+        """
+        # k-means++ seeding: sample each new center proportional to weight * D^2
+        centers = np.empty((k, points.shape[1]))
+        centers[0] = points[rng.choice(len(points), p=weights / weights.sum())]
+        closest_distances = np.sum((points - centers[0]) ** 2, axis=1)
+        for i in range(1, k):
+            probabilities = weights * closest_distances
+            total = probabilities.sum()
+            if total > 0:
+                index = rng.choice(len(points), p=probabilities / total)
+            else:
+                index = rng.integers(len(points))
+            centers[i] = points[index]
+            closest_distances = np.minimum(
+                closest_distances, np.sum((points - centers[i]) ** 2, axis=1)
+            )
+
+        for _ in range(self.HISTOGRAM_KMEANS_MAX_ITER):
+            distances = np.sum((points[:, None, :] - centers[None, :, :]) ** 2, axis=2)
+            labels = np.argmin(distances, axis=1)
+            cluster_weights = np.bincount(labels, weights=weights, minlength=k)
+            new_centers = centers.copy()
+            non_empty = cluster_weights > 0
+            for channel in range(points.shape[1]):
+                sums = np.bincount(
+                    labels, weights=weights * points[:, channel], minlength=k
+                )
+                new_centers[non_empty, channel] = (
+                    sums[non_empty] / cluster_weights[non_empty]
+                )
+            shift = np.max(np.sqrt(np.sum((new_centers - centers) ** 2, axis=1)))
+            centers = new_centers
+            if shift <= self.HISTOGRAM_KMEANS_EPS:
+                break
+
+        distances = np.sum((points[:, None, :] - centers[None, :, :]) ** 2, axis=2)
+        distortion = np.sum(weights * np.min(distances, axis=1))
+        return centers, distortion
+
     def _enhance_color_palette(self, rgb_colors: np.ndarray) -> np.ndarray:
         """
         Convert RGB color to HSV and apply color enhancements. (Hard code saturation and brightness boost for now)
@@ -67,57 +241,73 @@ class ColorPalette:
         if self.config.debug_mode:
             print("Computing HSV colors and applying color saturation")
         # Convert RGB colors to HSV
-        normalized_rgb = rgb_colors.astype(float) / 255.0
-        hsv_colors = np.array(
-            [colorsys.rgb_to_hsv(r, g, b) for r, g, b in normalized_rgb]
-        )
+        hsv_colors = rgb_to_hsv(rgb_colors)
         # Apply saturation Snew = (S)^.75 + .05
         hsv_colors[:, 1] = np.power(hsv_colors[:, 1], 0.75) + 0.05
         # Apply saturation Vnew = (V)^.75 + .05
         hsv_colors[:, 2] = np.power(hsv_colors[:, 2], 0.75) + 0.05
 
         # TODO: double check this
-        # Convert HSV back to RGB
-        rgb_colors = np.array(
-            [colorsys.hsv_to_rgb(h, s, v) for h, s, v in hsv_colors]
-        )  # Scale back to 0-255 range
-        rgb_colors = np.uint8(rgb_colors * 255)
+        # Convert HSV back to RGB, scaled back to 0-255 range
+        rgb_colors = np.uint8(hsv_to_rgb(hsv_colors))
         return rgb_colors
 
-    def _compute_complementary_colors(self, primary_colors: np.ndarray) -> np.ndarray:
-        """Generate a list of 8 complementary colors given a list of 8 primary_colors
+    def _compute_complementary_colors(
+        self, primary_colors: np.ndarray, rng: np.random.Generator
+    ) -> np.ndarray:
+        """Generate one complementary color for every primary color
         Args:
-            primary_colors: List of 8 RGB primary colors
+            primary_colors: List of RGB primary colors
+            rng: Random generator of the hue shifts
 
         Returns:
-            List of 8 complementary_colors
+            List of complementary_colors, as many as primary_colors
         """
         if self.config.debug_mode:
             print("Computing complementary colors")
 
-        complementary_colors = primary_colors.copy()
         # Convert RGB colors to HSV
-        normalized_rgb = complementary_colors.astype(float) / 255.0
-        complementary_colors = np.array(
-            [colorsys.rgb_to_hsv(r, g, b) for r, g, b in normalized_rgb]
-        )
+        complementary_colors = rgb_to_hsv(primary_colors)
         # Generate random shifts between 0 and 180 degrees
-        random_shifts = np.random.uniform(0, 180, size=len(primary_colors))
+        random_shifts = rng.uniform(0, 180, size=len(primary_colors))
         # Shift the hue values by the random amounts
         # Hue values in HSV are in range [0, 1], so we divide by 360
         complementary_colors[:, 0] = (
             complementary_colors[:, 0] + random_shifts / 360.0
         ) % 1.0
 
-        # Convert HSV back to RGB
-        rgb_colors = np.array(
-            [colorsys.hsv_to_rgb(h, s, v) for h, s, v in complementary_colors]
-        )
-        # Scale back to 0-255 range
-        complementary_colors = np.uint8(rgb_colors * 255)
+        # Convert HSV back to RGB, scaled back to 0-255 range
+        complementary_colors = np.uint8(hsv_to_rgb(complementary_colors))
 
         return complementary_colors
 
+    def compute_color_triple_inverses(
+        self, color_palette: np.ndarray
+    ) -> ColorTripleInverses:
+        """Precompute the inverse color matrix of every ordered triple of palette colors.
+
+        The table grows with the cube of the palette size, so it is skipped for
+        palettes of more than MAX_TRIPLE_TABLE_COLORS colors. The dot clusters then
+        invert only the triples they use.
+
+        Args:
+            color_palette: Array of RGB colors
+
+        Returns:
+            ColorTripleInverses table used to compute the dot cluster color weights,
+            or None for palettes too large to tabulate
+        """
+        if len(color_palette) > self.MAX_TRIPLE_TABLE_COLORS:
+            return None
+        if self.config.debug_mode:
+            print("Computing color triple inverses")
+        color_triple_inverses = ColorTripleInverses(color_palette)
+        if self.config.debug_mode:
+            print(
+                f"Found {np.count_nonzero(color_triple_inverses.singular)} singular color triples"
+            )
+        return color_triple_inverses
+
     def validate_color_palette(self, color_palette: np.ndarray):
         """Validates that the color palette meets requirements.
 
@@ -130,11 +320,19 @@ class ColorPalette:
         if not isinstance(color_palette, np.ndarray):
             raise ValueError("Color palette must be a NumPy array")
 
-        if color_palette.shape != (self.COLOR_PALETTE_LENGTH, 3):
-            raise ValueError("Color palette must contain exactly 16 RGB colors")
+        if color_palette.shape != (self.config.palette_size, 3):
+            raise ValueError(
+                f"Color palette must contain exactly {self.config.palette_size} RGB colors"
+            )
 
         if color_palette.dtype != np.uint8:
             raise ValueError("Color values must be uint8 (0-255)")
 
         if np.any(color_palette < 0) or np.any(color_palette > 255):
             raise ValueError("RGB values must be in range 0-255")
+
+    def _validate_palette_size(self):
+        """Raises ValueError unless config.palette_size is an even number >= 4."""
+        size = self.config.palette_size
+        if size < 4 or size % 2:
+            raise ValueError("palette_size must be an even number of at least 4")
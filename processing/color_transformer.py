@@ -1,27 +1,48 @@
-from typing import List
 import numpy as np
 from configs.config import PointillismConfig
-from models.dot_cluster import DotCluster
-from utils.rgb_hsv_utils import hsv_distance, rgb_to_hsv
+from models.color_lookup_table import ColorLookupTable
+from models.color_search_index import ColorSearchIndex
+from models.color_triple_inverses import ColorTripleInverses
+from models.dot_cluster_batch import DotClusterBatch
+from utils.color_space import rgb_to_lab
 
 
 class ColorTransformer:
+    SELECTION_CHUNK_SIZE = 65536  # pixels per distance matrix chunk
+    # Smallest palette searched through a ColorSearchIndex instead of every color
+    SEARCH_INDEX_MIN_COLORS = 32
 
     def __init__(self, config: PointillismConfig = None):
         self.config = config or PointillismConfig()
-
-    def transform(self, img: np.ndarray, color_palette: np.ndarray) -> List[DotCluster]:
-        """Transform an input image into a collection of dot clusters using a specified color palette.
+        self._color_lookup_table = None
+        self._color_search_index = None
+
+    def transform(
+        self,
+        img: np.ndarray,
+        color_palette: np.ndarray,
+        color_triple_inverses: ColorTripleInverses = None,
+        cluster_indices: np.ndarray = None,
+        rng: np.random.Generator = None,
+    ) -> DotClusterBatch:
+        """Transform an input image into a batch of dot clusters using a specified color palette.
 
         Args:
             img (np.ndarray): Input RGB image of shape (height, width, 3)
             color_palette (np.ndarray): Array of RGB colors to use for the dot clusters, shape (n, 3)
+            color_triple_inverses (ColorTripleInverses): Optional precomputed inverse
+                matrices of the palette color triples, see ColorPalette.compute_color_triple_inverses
+            cluster_indices (np.ndarray): Optional flat (row-major) indices of the pixels to
+                transform, in the order the clusters should appear in the batch. All pixels
+                are transformed when omitted.
+            rng (np.random.Generator): Random generator of the third color of every
+                cluster, seeded from config.seed when omitted
 
         Returns:
-            list[DotCluster]: List of dot clusters, where each cluster contains:
+            DotClusterBatch: Batch of dot clusters, holding for every cluster:
                 - Position (x, y) coordinates
                 - Original pixel color
-                - Selected colors from palette
+                - Indices of the selected colors in the palette
                 - Intensity value based on inverted grayscale
         """
         if self.config.debug_mode:
@@ -29,29 +50,38 @@ class ColorTransformer:
 
         # Get all pixels at once and reshape to 2D array of pixels
         pixels = img.reshape(-1, 3)
+        if cluster_indices is None:
+            cluster_indices = np.arange(pixels.shape[0])
+        else:
+            pixels = pixels[cluster_indices]
 
         # Get coordinates for all pixels
-        y_coords, x_coords = np.unravel_index(np.arange(pixels.shape[0]), img.shape[:2])
+        y_coords, x_coords = np.unravel_index(cluster_indices, img.shape[:2])
         coordinates = np.column_stack((x_coords, y_coords))
 
         if self.config.debug_mode:
             print("creating selected clusters")
         # Vectorized color selection for all pixels at once
-        selected_colors = np.array(
-            [self._select_dot_cluster_colors(pixel, color_palette) for pixel in pixels]
+        if rng is None:
+            rng = np.random.default_rng(self.config.seed)
+        selected_indices = self._select_dot_cluster_color_indices(
+            pixels, color_palette, rng
         )
 
         if self.config.debug_mode:
             print("creating dot clusters")
 
         inversed_grayscale_image = self._convert_image_to_inversed_grayscale(img)
-        inversed_grayscale_image = inversed_grayscale_image.reshape(-1, 1)
-        dot_clusters = [
-            DotCluster((x, y), pixel, color, self.config.intensity_alpha, intensity)
-            for (x, y), pixel, color, intensity in zip(
-                coordinates, pixels, selected_colors, inversed_grayscale_image
-            )
-        ]
+        inversed_grayscale_image = inversed_grayscale_image.reshape(-1)[cluster_indices]
+        dot_clusters = DotClusterBatch(
+            coordinates,
+            pixels,
+            color_palette,
+            selected_indices,
+            self.config.intensity_alpha,
+            inversed_grayscale_image,
+            color_triple_inverses,
+        )
 
         if self.config.debug_mode:
             print("--Finished transforming image to dot clusters--")
@@ -87,38 +117,120 @@ class ColorTransformer:
         inversed_grayscale_image = (gamma_corrected * 255).astype(np.uint8)
         return inversed_grayscale_image
 
-    def _select_dot_cluster_colors(self, pixel: np.ndarray, color_palette: np.ndarray):
-        """Select colors for a dot cluster based on the input pixel and color palette.
+    def _select_dot_cluster_color_indices(
+        self,
+        pixels: np.ndarray,
+        color_palette: np.ndarray,
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """Select palette indices for the dot clusters of a batch of pixels.
 
-        This method selects three colors for each dot cluster:
+        For every pixel three colors are selected:
         1. The two closest colors from the palette to the input pixel
         2. One random color from the remaining colors in the palette
 
-        The color selection is based on RGB color space distance to ensure
-        perceptually meaningful color matches.
+        With config.color_lut_bits set, the two closest colors are gathered from a
+        ColorLookupTable built once per palette. In color_lut_exact mode the pixels of
+        ambiguous table cells are refined with an exact search, which gives the same
+        indices as searching every pixel. Otherwise the closest colors are searched
+        for every pixel, see _find_closest_color_indices. The random third color is
+        drawn for all pixels at once.
 
         Args:
-            pixel (np.ndarray): Input RGB pixel of shape (3,)
-            color_palette (np.ndarray): Array of RGB colors to choose from, shape (n, 3)
+            pixels (np.ndarray): Input RGB pixels of shape (n, 3)
+            color_palette (np.ndarray): Array of RGB colors to choose from, shape (m, 3)
+            rng (np.random.Generator): Random generator of the third colors
 
         Returns:
-            list: List of three RGB colors, where the first two are the closest matches
-                  and the third is a random color from the remaining palette
+            np.ndarray: Palette indices of shape (n, 3), where the first two columns
+                  are the closest matches (closest first) and the third is a random
+                  color from the remaining palette
         """
-        # Calculate Euclidean distance between pixel and all colors in palette
-        distances = np.sqrt(np.sum((color_palette - pixel) ** 2, axis=1))
-        # Get indices of two closest colors
-        closest_indices = np.argsort(distances)[:2]
-        closest_colors = color_palette[closest_indices]
-
-        # Get remaining colors (excluding the two closest)
-        remaining_indices = np.setdiff1d(np.arange(len(color_palette)), closest_indices)
-        remaining_colors = color_palette[remaining_indices]
+        num_pixels = len(pixels)
+        num_colors = len(color_palette)
+        indices = np.empty((num_pixels, 3), dtype=np.intp)
+
+        if self.config.color_lut_bits:
+            if self.config.color_search_space != "rgb":
+                raise ValueError("The color lookup table only supports RGB search")
+            lookup_table = self._get_color_lookup_table(color_palette)
+            indices[:, :2], ambiguous = lookup_table.lookup(pixels)
+            if self.config.color_lut_exact and np.any(ambiguous):
+                indices[ambiguous, :2] = self._find_closest_color_indices(
+                    pixels[ambiguous], color_palette
+                )
+        else:
+            indices[:, :2] = self._find_closest_color_indices(pixels, color_palette)
+
+        # Draw uniformly from the remaining m - 2 colors by skipping over the
+        # two closest indices, which matches picking from np.setdiff1d(...)
+        lower = np.minimum(indices[:, 0], indices[:, 1])
+        upper = np.maximum(indices[:, 0], indices[:, 1])
+        random_indices = rng.integers(0, num_colors - 2, size=num_pixels)
+        random_indices += random_indices >= lower
+        random_indices += random_indices >= upper
+        indices[:, 2] = random_indices
+        return indices
+
+    def _find_closest_color_indices(
+        self, pixels: np.ndarray, color_palette: np.ndarray
+    ) -> np.ndarray:
+        """Exact search for the two palette colors closest to every pixel.
+
+        Distances are measured in config.color_search_space. Palettes of at least
+        SEARCH_INDEX_MIN_COLORS colors are searched through a ColorSearchIndex,
+        which only compares every pixel with the few colors that can be nearest to
+        it. For smaller palettes the pixel to palette distance matrix is computed
+        in chunks of SELECTION_CHUNK_SIZE pixels and the two closest colors are
+        found with a partial sort.
 
-        random_color = remaining_colors[np.random.randint(0, len(remaining_colors))]
-
-        # Combine all three colors
-        return [closest_colors[0], closest_colors[1], random_color]
+        Returns:
+            np.ndarray: Palette indices of shape (n, 2), closest first
+        """
+        if len(color_palette) >= self.SEARCH_INDEX_MIN_COLORS:
+            return self._get_color_search_index(color_palette).nearest_two(pixels)
+        if self.config.color_search_space == "lab":
+            palette = rgb_to_lab(color_palette)
+        else:
+            palette = color_palette.astype(np.int32)
+        indices = np.empty((len(pixels), 2), dtype=np.intp)
+        for start in range(0, len(pixels), self.SELECTION_CHUNK_SIZE):
+            chunk = pixels[start : start + self.SELECTION_CHUNK_SIZE]
+            if self.config.color_search_space == "lab":
+                chunk = rgb_to_lab(chunk)
+            else:
+                chunk = chunk.astype(np.int32)
+            # Squared Euclidean distance preserves the ordering of the distances
+            distances = np.sum((chunk[:, None, :] - palette[None, :, :]) ** 2, axis=2)
+            closest = np.argpartition(distances, 1, axis=1)[:, :2]
+            closest_distances = np.take_along_axis(distances, closest, axis=1)
+            order = np.argsort(closest_distances, axis=1, kind="stable")
+            indices[start : start + len(chunk)] = np.take_along_axis(
+                closest, order, axis=1
+            )
+        return indices
+
+    def _get_color_search_index(self, color_palette: np.ndarray) -> ColorSearchIndex:
+        """Search index of the palette, rebuilt only when the palette or space change."""
+        index = self._color_search_index
+        if index is None or not index.matches(
+            color_palette, self.config.color_search_space
+        ):
+            index = ColorSearchIndex(color_palette, self.config.color_search_space)
+            self._color_search_index = index
+        return index
+
+    def _get_color_lookup_table(self, color_palette: np.ndarray) -> ColorLookupTable:
+        """Lookup table of the palette, rebuilt only when the palette or bits change."""
+        table = self._color_lookup_table
+        if (
+            table is None
+            or table.bits != self.config.color_lut_bits
+            or not table.matches(color_palette)
+        ):
+            table = ColorLookupTable(color_palette, self.config.color_lut_bits)
+            self._color_lookup_table = table
+        return table
 
 
 """
@@ -0,0 +1,179 @@
+import numpy as np
+from processing.rasterizers import compute_disc_offsets
+
+
+class AlphaCompositor:
+    """Composites translucent dots of a fixed opacity onto a canvas in bulk.
+
+    Dots are blended back to front, each one "over" everything drawn before it,
+    like drawing them one by one with alpha blending. With opacity a, a pixel
+    covered by m dots of colors c_1..c_m (in drawing order) over a background b
+    ends up as
+
+        sum_k a * (1 - a)^(m - k) * c_k  +  (1 - a)^m * b
+
+    so instead of blending dot by dot, every batch of dots is reduced per pixel
+    into float32 buffers: the premultiplied color of the dots and their
+    transmittance (1 - a)^m, the uncovered share of the background. Earlier
+    batches are attenuated by the transmittance of later ones. The canvas is
+    resolved to uint8 once, in resolve().
+
+    j consecutive dots of one color over a pixel add up to a single layer of
+    weight 1 - (1 - a)^j, so their order does not matter. Dots come in runs of one
+    color around a cluster center, and within a batch the pixels of every run are
+    counted with one bincount over the run's bounding box, which leaves far fewer
+    (pixel, run) pairs than (pixel, dot) pairs to sort into drawing order.
+    """
+
+    # Largest bounding box of a run in pixels, longer runs are split into pieces
+    RUN_BOX_LIMIT = 128 * 128
+    RUN_SPLIT_LENGTHS = (64, 1)  # dots per piece, tried in order
+
+    def __init__(self, canvas: np.ndarray, radius: int, opacity: float):
+        """
+        Args:
+            canvas: RGB uint8 canvas holding the background, written by resolve()
+            radius: Brushstroke radius of the dots
+            opacity: Dot opacity in (0, 1]
+        """
+        if not 0 < opacity <= 1:
+            raise ValueError("opacity must be in (0, 1].")
+        self.canvas = canvas
+        self.radius = radius
+        self.opacity = opacity
+        self._disc_offsets = compute_disc_offsets(radius)
+        height, width = canvas.shape[:2]
+        self._color = np.zeros((height * width, 3), dtype=np.float32)
+        self._transmittance = np.ones(height * width, dtype=np.float32)
+
+    def add_dots(self, points: np.ndarray, colors: np.ndarray):
+        """Composite a batch of dots over everything added before.
+
+        Args:
+            points: (n, 2) int array of (x, y) dot centers, in drawing order
+            colors: (n, 3) uint8 array of dot colors
+        """
+        num_dots = len(points)
+        if num_dots == 0:
+            return
+        height, width = self.canvas.shape[:2]
+        run_starts, box_low, box_width, box_height = self._find_runs(points, colors)
+        run_lengths = np.diff(np.r_[run_starts, num_dots])
+        box_areas = box_width * box_height
+        box_bases = np.cumsum(box_areas) - box_areas
+
+        # Count how many dots of every run cover every pixel of its bounding box
+        num_bins = int(box_bases[-1] + box_areas[-1])
+        key_type = np.int32 if num_bins < 2**31 else np.int64
+        runs = np.repeat(np.arange(len(run_starts)), run_lengths)
+        widths = box_width[runs].astype(key_type)
+        centers = (
+            box_bases[runs]
+            + (points[:, 1] - box_low[runs, 1]) * widths
+            + (points[:, 0] - box_low[runs, 0])
+        ).astype(key_type)
+        del runs
+        offset_y, offset_x = self._disc_offsets
+        keys = offset_y.astype(key_type)[None, :] * widths[:, None]
+        keys += offset_x.astype(key_type)
+        keys += centers[:, None]
+        del centers, widths
+        counts = np.bincount(keys.reshape(-1), minlength=num_bins)
+        del keys
+
+        # (pixel, run) pairs in run order, then grouped by pixel keeping run order
+        entries = np.flatnonzero(counts)
+        counts = counts[entries]
+        runs = np.searchsorted(box_bases, entries, side="right") - 1
+        ys, xs = np.divmod(entries - box_bases[runs], box_width[runs])
+        ys += box_low[runs, 1]
+        xs += box_low[runs, 0]
+        inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+        if not inside.any():
+            return
+        pixels = (ys * width + xs)[inside]
+        runs, counts = runs[inside], counts[inside]
+        order = np.argsort(pixels << len(run_starts).bit_length() | runs)
+        pixels, runs, counts = pixels[order], runs[order], counts[order]
+
+        # Merge consecutive runs of one color over a pixel into one layer, so the
+        # result does not depend on where runs were split
+        run_colors = colors[run_starts]
+        packed_colors = run_colors.astype(np.int32) @ np.array([1 << 16, 1 << 8, 1])
+        run_colors_of_pairs = packed_colors[runs]
+        new_pixel = np.r_[True, pixels[1:] != pixels[:-1]]
+        new_layer = new_pixel.copy()
+        new_layer[1:] |= run_colors_of_pairs[1:] != run_colors_of_pairs[:-1]
+        del run_colors_of_pairs
+        layer_starts = np.flatnonzero(new_layer)
+        layer_counts = np.add.reduceat(counts, layer_starts)
+        layer_colors = run_colors[runs[layer_starts]].astype(np.float32)
+        layer_pixels = pixels[layer_starts]
+        del pixels, runs, counts
+
+        group_starts = np.flatnonzero(new_pixel[layer_starts])
+        group_ends = np.r_[group_starts[1:], len(layer_starts)]
+        # Number of later dots of the same batch over every layer
+        cumulative_counts = np.cumsum(layer_counts)
+        group_counts = (
+            cumulative_counts[group_ends - 1]
+            - np.r_[0, cumulative_counts[group_ends[:-1] - 1]]
+        )
+        dots_above = (
+            np.repeat(cumulative_counts[group_ends - 1], group_ends - group_starts)
+            - cumulative_counts
+        )
+
+        transparency = np.float32(1 - self.opacity)
+        powers = np.power(
+            transparency, np.arange(group_counts.max() + 1), dtype=np.float32
+        )
+        weights = (np.float32(1) - powers[layer_counts]) * powers[dots_above]
+        layer_colors *= weights[:, None]
+        batch_colors = np.add.reduceat(layer_colors, group_starts, axis=0)
+        batch_transmittance = powers[group_counts]
+
+        pixels = layer_pixels[group_starts]
+        self._color[pixels] *= batch_transmittance[:, None]
+        self._color[pixels] += batch_colors
+        self._transmittance[pixels] *= batch_transmittance
+
+    def _find_runs(self, points: np.ndarray, colors: np.ndarray):
+        """Split the dots into runs of consecutive dots of one color whose bounding
+        boxes, grown by the radius, hold at most RUN_BOX_LIMIT pixels.
+
+        Returns:
+            Tuple of the run start indices, the (x, y) low corners of the boxes and
+            the box widths and heights
+        """
+        radius = self.radius
+        run_starts = np.flatnonzero(
+            np.r_[True, np.any(colors[1:] != colors[:-1], axis=1)]
+        )
+        for split_length in (None,) + self.RUN_SPLIT_LENGTHS:
+            if split_length is not None:
+                # Split every oversized run into pieces of split_length dots
+                run_lengths = np.diff(np.r_[run_starts, len(points)])
+                pieces = np.where(oversized, -(-run_lengths // split_length), 1)
+                piece_offsets = np.arange(pieces.sum()) - np.repeat(
+                    np.cumsum(pieces) - pieces, pieces
+                )
+                run_starts = (
+                    np.repeat(run_starts, pieces) + piece_offsets * split_length
+                )
+            low = np.minimum.reduceat(points, run_starts, axis=0) - radius
+            high = np.maximum.reduceat(points, run_starts, axis=0) + radius
+            box_width = high[:, 0] - low[:, 0] + 1
+            box_height = high[:, 1] - low[:, 1] + 1
+            oversized = box_width * box_height > self.RUN_BOX_LIMIT
+            if not oversized.any():
+                break
+        return run_starts, low, box_width, box_height
+
+    def resolve(self) -> np.ndarray:
+        """Blend the composited dots over the background and write the canvas."""
+        flat_canvas = self.canvas.reshape(-1, 3)
+        result = self._color + self._transmittance[:, None] * flat_canvas
+        np.rint(result, out=result)
+        flat_canvas[:] = np.clip(result, 0, 255)
+        return self.canvas
@@ -0,0 +1,112 @@
+import atexit
+import os
+import queue
+import threading
+import numpy as np
+from configs.config import PointillismConfig
+from PIL import Image
+
+
+class DebugArtifactWriter:
+    """Saves debug images on a background thread.
+
+    write() copies the array onto a bounded queue and returns immediately, so
+    encoding and disk I/O stay off the rendering path. When the queue is full the
+    artifact is dropped and counted in `dropped` rather than stalling the pipeline.
+    Artifacts are saved as <directory>/<name>.<image_format>; "npy" stores the raw
+    array with np.save.
+    """
+
+    FORMATS = ("png", "jpg", "npy")
+
+    def __init__(
+        self,
+        directory: str = "images/output",
+        image_format: str = "jpg",
+        queue_size: int = 8,
+    ):
+        image_format = image_format.lower().lstrip(".")
+        if image_format == "jpeg":
+            image_format = "jpg"
+        if image_format not in self.FORMATS:
+            raise ValueError(
+                f"Unknown debug format: {image_format}. Expected one of {self.FORMATS}"
+            )
+        if queue_size < 1:
+            raise ValueError("queue_size must be a positive integer.")
+        self.directory = directory
+        self.image_format = image_format
+        self.dropped = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: PointillismConfig) -> "DebugArtifactWriter":
+        return cls(
+            config.debug_output_dir, config.debug_format, config.debug_queue_size
+        )
+
+    def path(self, name: str) -> str:
+        """Path the artifact called name is saved to."""
+        return os.path.join(self.directory, f"{name}.{self.image_format}")
+
+    def write(self, name: str, array: np.ndarray) -> bool:
+        """Queue an RGB uint8 image (or any array for the npy format) for saving.
+
+        Returns:
+            False if the queue was full and the artifact was dropped
+        """
+        self._start()
+        try:
+            self._queue.put_nowait((name, np.array(array)))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self):
+        """Block until every queued artifact is saved."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Save the queued artifacts and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+        atexit.unregister(self.close)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            # Finish pending writes when the interpreter exits
+            atexit.register(self.close)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._save(*item)
+            except Exception as error:
+                self.errors += 1
+                print(f"Failed to save debug artifact {item[0]}: {error}")
+            finally:
+                self._queue.task_done()
+
+    def _save(self, name: str, array: np.ndarray):
+        path = self.path(name)
+        if self.image_format == "npy":
+            np.save(path, array, allow_pickle=False)
+        else:
+            Image.fromarray(array, "RGB").save(path)
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import tempfile
+from typing import Optional
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+
+def content_hash(*arrays: np.ndarray) -> str:
+    """Fast content hash of one or more arrays, including their shapes and dtypes."""
+    digest = hashlib.blake2b(digest_size=20)
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.shape}{array.dtype.str}".encode())
+        digest.update(memoryview(array).cast("B"))
+    return digest.hexdigest()
+
+
+class DiskArrayCache:
+    """On-disk cache of NumPy arrays with a size cap and LRU eviction.
+
+    Every entry is one .npy file named after its key. Entries are written to a
+    temporary file and renamed into place, so readers in other processes never see
+    a partial file. Reads refresh the file's modification time, which is the LRU
+    order used when more than max_entries files are stored. Eviction holds an
+    exclusive lock on the cache directory, where fcntl is available.
+    """
+
+    LOCK_FILE_NAME = ".lock"
+
+    def __init__(self, directory: str, max_entries: int = 256):
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(self.directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the array stored under key, or None on a cache miss."""
+        path = self._path(key)
+        try:
+            array = np.load(path, allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Unreadable entry, e.g. a file truncated by a full disk
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass  # evicted by another process since it was read
+        return array
+
+    def put(self, key: str, array: np.ndarray):
+        """Store array under key, evicting the least recently used entries."""
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=self.directory, suffix=".tmp"
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as file:
+                np.save(file, array, allow_pickle=False)
+            os.replace(temporary_path, self._path(key))
+        except BaseException:
+            self._remove(temporary_path)
+            raise
+        self._evict()
+
+    def _evict(self):
+        with open(os.path.join(self.directory, self.LOCK_FILE_NAME), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".npy"):
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+            entries.sort()
+            for _, path in entries[: max(0, len(entries) - self.max_entries)]:
+                self._remove(path)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npy")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -1,21 +1,94 @@
-import random
-from typing import List
+import copy
+import dataclasses
+import itertools
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
 import cv2
 import numpy as np
 from configs.config import PointillismConfig
-from models.dot_cluster import DotCluster
-from PIL import Image
+from models.dot_cluster_batch import DotClusterBatch
+from processing.compositing import AlphaCompositor
+from processing.debug_writer import DebugArtifactWriter
+from processing.rasterizers import (
+    compute_disc_offsets,
+    create_rasterizer,
+    paint_topmost,
+)
+from processing.scatter_patterns import ScatterPatternBank
 
 
 class ImageGenerator:
-    def __init__(self, config: PointillismConfig = None):
+    # Disc pixels of the dots generated and drawn per batch, so the per-batch arrays
+    # of covered pixels stay bounded whatever the brushstroke radius
+    DOT_CHUNK_PIXELS = 1 << 24
+    TILES_PER_WORKER = 4  # horizontal canvas tiles per worker process
+    DOT_REACH_STDS = 4  # scatter standard deviations covered by compute_dot_reach
+    # Dots drawn per color of a cluster at most, per canvas pixel of the cluster cell
+    MAX_DOTS_PER_PIXEL = 16
+    # (canvas scale divisor, fraction of the dots drawn) of every preview pass
+    PREVIEW_PASSES = ((4, 0.0625), (2, 0.25))
+
+    def __init__(
+        self,
+        config: PointillismConfig = None,
+        workers: int = 1,
+        debug_writer: DebugArtifactWriter = None,
+        scatter_patterns: ScatterPatternBank = None,
+    ):
+        """
+        Args:
+            config: Pipeline config
+            workers: Number of processes rendering tiles of the canvas
+            debug_writer: Writer of the debug artifacts, from config when omitted
+            scatter_patterns: Scatter pattern bank to draw the dot offsets from, built
+                from config when omitted
+        """
         self.config = config or PointillismConfig()
+        if debug_writer is None and self.config.debug_mode:
+            debug_writer = DebugArtifactWriter.from_config(self.config)
+        self.debug_writer = debug_writer
+        if workers < 1:
+            raise ValueError("workers must be a positive integer.")
+        self.workers = workers
+        self.rasterizer = create_rasterizer(
+            self.config.rasterizer, self.config.brushstroke_radius
+        )
+        disc_area = len(compute_disc_offsets(self.config.brushstroke_radius)[0])
+        # Dots generated and drawn per batch
+        self.dot_chunk_size = max(1, self.DOT_CHUNK_PIXELS // disc_area)
+        # Precomputed dot offsets replacing per-dot sampling, None samples every dot
+        self.scatter_patterns = scatter_patterns
+        if scatter_patterns is None and self.config.scatter_pattern_bank_size > 0:
+            self.scatter_patterns = ScatterPatternBank(
+                self.config.scatter_pattern_bank_size,
+                self.config.scatter_distribution_mean,
+                self.config.scatter_distribution_std,
+                self.config.brushstroke_radius,
+                self.config.seed,
+            )
+
+    def generate(
+        self,
+        dot_clusters: DotClusterBatch,
+        preprocessed_image: np.ndarray,
+        rng: np.random.Generator = None,
+    ):
+        """Render the dot clusters onto a white canvas.
 
-    def generate(self, dot_clusters: List[DotCluster], preprocessed_image: np.ndarray):
+        Args:
+            dot_clusters: Clusters of the preprocessed image
+            preprocessed_image: Image the clusters were computed from
+            rng: Random generator of the dot offsets, seeded from config.seed when
+                omitted. The canvas does not depend on the worker count.
+        """
         self._validate_cluster_and_image(dot_clusters, preprocessed_image)
+        if rng is None:
+            rng = np.random.default_rng(self.config.seed)
 
         height, width, channels = preprocessed_image.shape
-        print(preprocessed_image.shape)
+        if self.config.debug_mode:
+            print(preprocessed_image.shape)
         scaled_height = self.config.cluster_distance * height
         scaled_width = self.config.cluster_distance * width
 
@@ -23,84 +96,551 @@ class ImageGenerator:
         canvas = np.full(
             (int(scaled_height), int(scaled_width), 3), 255, dtype=np.uint8
         )
-        print(canvas.shape)
-        for cluster in dot_clusters:
-            self._draw_cluster(canvas, cluster)
         if self.config.debug_mode:
-            debug_image = Image.fromarray(canvas, "RGB")
-            debug_image.save("images/output/canvas.jpg")
+            print(canvas.shape)
+        if self.workers > 1:
+            canvas = self._render_tiles_parallel(dot_clusters, canvas, rng)
+        else:
+            self.render_region(dot_clusters, canvas, 0, 0, rng)
+        if self.config.debug_mode:
+            self.debug_writer.write("canvas", canvas)
 
         return canvas
 
-    def _draw_cluster(self, canvas: np.ndarray, cluster: DotCluster):
-        center_x = int(cluster.position[0] * self.config.cluster_distance)
-        center_y = int(cluster.position[1] * self.config.cluster_distance)
-        center = (center_x, center_y)
+    def generate_progressive(
+        self,
+        dot_clusters: DotClusterBatch,
+        preprocessed_image: np.ndarray,
+        rng: np.random.Generator = None,
+        preview_passes=None,
+        preview_rng: np.random.Generator = None,
+    ):
+        """Render the dot clusters in passes of increasing detail.
 
-        # Create a temporary layer for all dots
-        temp_layer = np.zeros_like(canvas)
+        Every preview pass draws a fraction of each cluster's dots onto a canvas
+        shrunk by its scale divisor, with the cluster spacing, scatter and
+        brushstroke radius shrunk to match, and is scaled back up to the full canvas
+        size. Drawing a fraction f of the dots at divisor s costs roughly f / s**2 of
+        a full render. The last pass is a normal render, identical to generate()
+        with the same rng. Passes are only rendered when the next canvas is
+        requested, so the caller can stop refining at any time.
 
-        # Generate points for all three colors
-        color1_points = self._generate_dot_points(center, int(cluster.dot_counts[0]))
-        color2_points = self._generate_dot_points(center, int(cluster.dot_counts[1]))
-        color3_points = self._generate_dot_points(center, int(cluster.dot_counts[2]))
+        Args:
+            dot_clusters: Clusters of the preprocessed image
+            preprocessed_image: Image the clusters were computed from
+            rng: Random generator of the final render, see generate
+            preview_passes: (scale divisor, dot fraction) pairs, PREVIEW_PASSES by
+                default
+            preview_rng: Random generator of the preview dot offsets, fresh entropy
+                when omitted. It is kept apart from rng so the final render does not
+                depend on the previews.
 
-        # Draw all dots for each color
-        for x, y in color1_points:
-            cv2.circle(
-                canvas,
-                (int(x), int(y)),
-                self.config.brushstroke_radius,
-                tuple(map(int, cluster.selected_colors[0][::-1])),
-                -1,
+        Yields:
+            RGB canvases of the final shape, one per preview pass and then the final
+            render
+        """
+        self._validate_cluster_and_image(dot_clusters, preprocessed_image)
+        if preview_passes is None:
+            preview_passes = self.PREVIEW_PASSES
+        if preview_rng is None:
+            preview_rng = np.random.default_rng()
+        height, width = preprocessed_image.shape[:2]
+        cluster_distance = self.config.cluster_distance
+        canvas_size = (width * cluster_distance, height * cluster_distance)
+
+        for scale, dot_fraction in preview_passes:
+            if scale < 1 or not 0 < dot_fraction <= 1:
+                raise ValueError(
+                    "Preview passes need a scale >= 1 and a dot fraction in (0, 1]."
+                )
+            preview_generator = ImageGenerator(
+                dataclasses.replace(
+                    self.config,
+                    cluster_distance=cluster_distance / scale,
+                    scatter_distribution_mean=self.config.scatter_distribution_mean
+                    / scale,
+                    scatter_distribution_std=self.config.scatter_distribution_std
+                    / scale,
+                    brushstroke_radius=int(
+                        round(self.config.brushstroke_radius / scale)
+                    ),
+                    scatter_pattern_bank_size=0,
+                    debug_mode=False,
+                )
+            )
+            preview_clusters = copy.copy(dot_clusters)
+            preview_clusters.dot_counts = dot_clusters.dot_counts * dot_fraction
+            preview = np.full(
+                (
+                    int(height * cluster_distance / scale),
+                    int(width * cluster_distance / scale),
+                    3,
+                ),
+                255,
+                dtype=np.uint8,
             )
+            preview_generator.render_region(
+                preview_clusters, preview, 0, 0, preview_rng
+            )
+            yield cv2.resize(preview, canvas_size, interpolation=cv2.INTER_NEAREST)
 
-        for x, y in color2_points:
-            cv2.circle(
-                canvas,
-                (int(x), int(y)),
-                self.config.brushstroke_radius,
-                tuple(map(int, cluster.selected_colors[1][::-1])),
-                -1,
+        yield self.generate(dot_clusters, preprocessed_image, rng)
+
+    def generate_strips(
+        self,
+        dot_clusters: DotClusterBatch,
+        preprocessed_image: np.ndarray,
+        rng: np.random.Generator = None,
+        strip_height: int = None,
+    ):
+        """Render the canvas in horizontal strips, top to bottom, without ever
+        allocating it whole.
+
+        A first pass draws every dot offset once, only to record the generator state
+        before each chunk of dots and the rows the chunk's dots land on. Every strip
+        then replays just the chunks whose dots reach it, dropping the dots that
+        cannot touch it, so peak memory is bounded by the strip height and the chunk
+        size rather than the canvas size. The strips are rendered in the calling
+        process, whatever the worker count. They are pixel-identical to the rows of
+        generate() with the same rng, translucent dots included, and rng is left in
+        the same state.
+
+        Args:
+            dot_clusters: Clusters of the preprocessed image
+            preprocessed_image: Image the clusters were computed from
+            rng: Random generator of the dot offsets, see generate
+            strip_height: Canvas rows per strip, config.render_strip_height by default
+
+        Yields:
+            Tuples of the canvas row of the strip's first row and the RGB strip
+        """
+        self._validate_cluster_and_image(dot_clusters, preprocessed_image)
+        if rng is None:
+            rng = np.random.default_rng(self.config.seed)
+        if strip_height is None:
+            strip_height = self.config.render_strip_height
+        if strip_height < 1:
+            raise ValueError("strip_height must be a positive integer.")
+        height, width = preprocessed_image.shape[:2]
+        canvas_height = int(self.config.cluster_distance * height)
+        canvas_width = int(self.config.cluster_distance * width)
+
+        chunk_states, chunk_rows = self._record_dot_chunks(dot_clusters, rng)
+        for top in range(0, canvas_height, strip_height):
+            bottom = min(top + strip_height, canvas_height)
+            strip = np.full((bottom - top, canvas_width, 3), 255, dtype=np.uint8)
+            self._replay_dot_chunks(dot_clusters, strip, top, chunk_states, chunk_rows)
+            yield top, strip
+
+    def _record_dot_chunks(self, dot_clusters: DotClusterBatch, rng):
+        """
+        Draw every dot offset once, only to record the generator state before each
+        chunk of dots and the rows the chunk's dots land on, see _replay_dot_chunks.
+
+        Returns:
+            Tuple of the list of generator states, one per chunk, and an (n, 2) int64
+            array of the first and last canvas row of every chunk's dot centers
+        """
+        chunk_states = []
+        chunk_rows = []
+        dot_chunks = self._generate_dot_points(dot_clusters, rng)
+        while True:
+            state = rng.bit_generator.state
+            chunk = next(dot_chunks, None)
+            if chunk is None:
+                break
+            rows = chunk[0][:, 1]
+            chunk_states.append(state)
+            chunk_rows.append((rows.min(), rows.max()))
+        return chunk_states, np.array(chunk_rows, dtype=np.int64).reshape(-1, 2)
+
+    def _replay_dot_chunks(
+        self,
+        dot_clusters: DotClusterBatch,
+        region: np.ndarray,
+        top: int,
+        chunk_states,
+        chunk_rows: np.ndarray,
+    ):
+        """
+        Draw the dots reaching a band of full canvas rows starting at row top into
+        region, in place, by replaying the chunks recorded by _record_dot_chunks.
+        The band gets the same pixels as the same rows of a whole canvas render.
+        """
+        bottom = top + region.shape[0]
+        radius = self.config.brushstroke_radius
+        reaching = np.flatnonzero(
+            (chunk_rows[:, 0] - radius < bottom) & (chunk_rows[:, 1] + radius >= top)
+        )
+        if not len(reaching):
+            return
+        first_chunk, last_chunk = reaching[0], reaching[-1]
+        state = chunk_states[first_chunk]
+        rng = np.random.Generator(getattr(np.random, state["bit_generator"])())
+        rng.bit_generator.state = state
+        num_chunks = last_chunk - first_chunk + 1
+        if self.scatter_patterns is not None and self.config.opacity >= 1:
+            self._stamp_dot_runs(
+                dot_clusters,
+                region,
+                top,
+                0,
+                rng,
+                first_chunk=first_chunk,
+                num_chunks=num_chunks,
             )
+            return
+        dot_chunks = itertools.islice(
+            self._generate_dot_points(dot_clusters, rng, first_chunk=first_chunk),
+            num_chunks,
+        )
+        self._draw_dot_chunks(
+            region, self._clip_dot_rows(dot_chunks, top, bottom, radius)
+        )
 
-        for x, y in color3_points:
-            cv2.circle(
-                canvas,
-                (int(x), int(y)),
-                self.config.brushstroke_radius,
-                tuple(map(int, cluster.selected_colors[2][::-1])),
-                -1,
+    @staticmethod
+    def _clip_dot_rows(dot_chunks, top: int, bottom: int, margin: int):
+        """
+        Keep the dots centered within margin rows of canvas rows [top, bottom), in
+        order, shifted so row top becomes row 0.
+        """
+        for points, colors in dot_chunks:
+            rows = points[:, 1]
+            keep = (rows >= top - margin) & (rows < bottom + margin)
+            points, colors = points[keep], colors[keep]
+            points[:, 1] -= top
+            yield points, colors
+
+    def _render_tiles_parallel(
+        self,
+        dot_clusters: DotClusterBatch,
+        canvas: np.ndarray,
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """
+        Render the canvas in horizontal tiles on `workers` processes.
+
+        The dot chunks are recorded once, see _record_dot_chunks, and every tile
+        replays the chunks whose dots reach it, writing only its own rows of a canvas
+        held in shared memory. The workers get the scatter pattern bank of this
+        generator rather than building their own. Every dot is thus drawn the same
+        way by every tile it reaches, and the output is identical to a single-worker
+        render with the same rng.
+        """
+        canvas_height = canvas.shape[0]
+        num_tiles = min(self.workers * self.TILES_PER_WORKER, canvas_height)
+        tile_bounds = np.linspace(0, canvas_height, num_tiles + 1).astype(int)
+        chunk_states, chunk_rows = self._record_dot_chunks(dot_clusters, rng)
+        tasks = list(zip(tile_bounds, tile_bounds[1:]))
+
+        shared_canvas = shared_memory.SharedMemory(create=True, size=canvas.nbytes)
+        try:
+            shared_array = np.ndarray(
+                canvas.shape, dtype=canvas.dtype, buffer=shared_canvas.buf
             )
+            shared_array[:] = canvas
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_tile_worker,
+                initargs=(
+                    self.config,
+                    dot_clusters,
+                    shared_canvas.name,
+                    canvas.shape,
+                    chunk_states,
+                    chunk_rows,
+                    self.scatter_patterns,
+                ),
+            ) as executor:
+                for _ in executor.map(_render_tile, tasks):
+                    pass
+            canvas = shared_array.copy()
+            del shared_array
+        finally:
+            shared_canvas.close()
+            shared_canvas.unlink()
+        return canvas
+
+    def _compute_dot_margins(self):
+        """
+        Number of canvas rows above and below a cluster center that its dots can
+        still reach, from the scatter distribution and the brushstroke radius.
+        Offsets beyond DOT_REACH_STDS standard deviations are not accounted for.
+        """
+        mean = self.config.scatter_distribution_mean
+        spread = self.DOT_REACH_STDS * self.config.scatter_distribution_std
+        radius = self.config.brushstroke_radius
+        # Dots land around center + mean, so centers reach further down than up
+        margin_above = int(np.ceil(max(0, mean + spread) + radius))
+        margin_below = int(np.ceil(max(0, spread - mean) + radius))
+        return margin_above, margin_below
+
+    def render_region(
+        self,
+        dot_clusters: DotClusterBatch,
+        region: np.ndarray,
+        top: int,
+        left: int,
+        rng,
+        start: int = 0,
+        stop: int = None,
+    ):
+        """
+        Draw the dots of clusters [start, stop) into a region of the canvas, in place.
+        Dots are clipped to the region, whose top-left pixel sits at (top, left) in
+        canvas coordinates.
+
+        Args:
+            dot_clusters: Clusters to draw, positioned on the full cluster grid
+            region: RGB array of shape (height, width, 3), e.g. a view into the canvas
+            top: Canvas row of the first region row
+            left: Canvas column of the first region column
+            rng: Random generator the dot offsets are drawn from
+        """
+        if self.scatter_patterns is not None and self.config.opacity >= 1:
+            self._stamp_dot_runs(dot_clusters, region, top, left, rng, start, stop)
+            return
+
+        def shifted_dot_chunks():
+            for points, colors in self._generate_dot_points(
+                dot_clusters, rng, start, stop
+            ):
+                points[:, 0] -= left
+                points[:, 1] -= top
+                yield points, colors
+
+        self._draw_dot_chunks(region, shifted_dot_chunks())
+
+    def _draw_dot_chunks(self, canvas: np.ndarray, dot_chunks):
+        """
+        Draw (points, colors) chunks of dots onto the canvas in order, in place.
+        Opaque dots (opacity 1) are drawn by the rasterizer backend, translucent
+        ones are alpha-composited in bulk by an AlphaCompositor and resolved once.
+        """
+        if self.config.opacity >= 1:
+            try:
+                for points, colors in dot_chunks:
+                    self.rasterizer.draw_dots(canvas, points, colors)
+            finally:
+                self.rasterizer.release_scratch()
+            return
+        compositor = AlphaCompositor(
+            canvas, self.config.brushstroke_radius, self.config.opacity
+        )
+        for points, colors in dot_chunks:
+            compositor.add_dots(points, colors)
+        compositor.resolve()
+
+    def compute_dot_reach(self) -> int:
+        """
+        Largest distance in canvas pixels, along either axis, from a cluster center to
+        a pixel its dots can cover, see _compute_dot_margins.
+        """
+        return max(self._compute_dot_margins())
+
+    def _generate_dot_points(
+        self,
+        dot_clusters: DotClusterBatch,
+        rng,
+        start: int = 0,
+        stop: int = None,
+        first_chunk: int = 0,
+    ):
+        """
+        Generate the dots of clusters [start, stop), in cluster order and color order within a cluster.
+        Each dot is positioned around its cluster center by sampling from a Gaussian distribution.
+        The offsets of up to dot_chunk_size dots are sampled in a single draw from the
+        np.random.Generator `rng`, or taken from the scatter pattern bank when
+        configured. Chunks before first_chunk are skipped without drawing from rng.
+
+        Yields:
+            Tuple of an (n, 2) int array of (x, y) dot positions and an (n, 3) uint8
+            array of dot colors, for consecutive chunks of dots
+        """
+        for centers, colors, counts in self._generate_dot_runs(
+            dot_clusters, start, stop, first_chunk
+        ):
+            if self.scatter_patterns is not None:
+                centers, colors, counts = self._split_dot_runs(centers, colors, counts)
+            dot_centers = np.repeat(centers, counts, axis=0)
+            dot_colors = np.repeat(colors, counts, axis=0)
+            if self.scatter_patterns is None:
+                offsets = rng.normal(
+                    loc=self.config.scatter_distribution_mean,
+                    scale=self.config.scatter_distribution_std,
+                    size=(len(dot_centers), 2),
+                )
+            else:
+                patterns = rng.integers(self.scatter_patterns.size, size=len(counts))
+                offsets = self.scatter_patterns.dot_offsets(patterns, counts)
+            points = (dot_centers + offsets).astype(np.int64)
+            yield points, dot_colors
 
-    def _generate_dot_points(self, center, num_dots: int):
+    def _generate_dot_runs(
+        self,
+        dot_clusters: DotClusterBatch,
+        start: int = 0,
+        stop: int = None,
+        first_chunk: int = 0,
+    ):
         """
-        Generate a dot cluster around a center point.
-        Each dot is positioned by sampling from a Gaussian distribution.
+        Split the dots of clusters [start, stop) into chunks of up to dot_chunk_size
+        dots, starting at chunk first_chunk. Within a chunk the dots form runs of one
+        (cluster, color) entry each; an entry crossing a chunk boundary is split.
+
+        Yields:
+            Tuple of the (r, 2) run centers, the (r, 3) uint8 run colors and the (r,)
+            run dot counts of every chunk, runs in drawing order
         """
-        if num_dots <= 0:
-            return []
-        dots = []
-        x_offsets = np.random.normal(
-            loc=self.config.scatter_distribution_mean,
-            scale=self.config.scatter_distribution_std,
-            size=num_dots,
+        stop = len(dot_clusters) if stop is None else stop
+        clusters = slice(start, stop)
+        # One entry per (cluster, color) pair, in drawing order
+        # Colors are drawn in the channel order passed to cv2.circle
+        entry_colors = dot_clusters.color_palette[:, ::-1][
+            dot_clusters.color_indices[clusters].reshape(-1)
+        ]
+        entry_centers = np.repeat(
+            dot_clusters.positions[clusters] * self.config.cluster_distance, 3, axis=0
         )
-        y_offsets = np.random.normal(
-            loc=self.config.scatter_distribution_mean,
-            scale=self.config.scatter_distribution_std,
-            size=num_dots,
+        entry_counts = self.drawn_dot_counts(dot_clusters.dot_counts[clusters])
+        entry_counts = entry_counts.reshape(-1)
+        entry_ends = np.cumsum(entry_counts)
+        entry_starts = entry_ends - entry_counts
+        num_dots = int(entry_ends[-1]) if len(entry_ends) else 0
+
+        for dot_start in range(
+            first_chunk * self.dot_chunk_size, num_dots, self.dot_chunk_size
+        ):
+            dot_stop = min(dot_start + self.dot_chunk_size, num_dots)
+            # Entries with dots in [dot_start, dot_stop), the first and last partially
+            first = np.searchsorted(entry_ends, dot_start, side="right")
+            last = np.searchsorted(entry_starts, dot_stop, side="left")
+            counts = np.minimum(entry_ends[first:last], dot_stop) - np.maximum(
+                entry_starts[first:last], dot_start
+            )
+            yield entry_centers[first:last], entry_colors[first:last], counts
+
+    def drawn_dot_counts(self, dot_counts: np.ndarray) -> np.ndarray:
+        """
+        Number of dots drawn for the dot counts of a DotClusterBatch: the int()
+        truncation of every count, none for non-positive counts and at most
+        MAX_DOTS_PER_PIXEL times the canvas pixels of a cluster cell. The cap covers
+        the scatter area of a cluster many times over with the default settings, and
+        keeps near-cancelled color weights from producing unbounded dot counts.
+        """
+        max_dots = self.MAX_DOTS_PER_PIXEL * self.config.cluster_distance**2
+        return np.clip(dot_counts, 0, max_dots).astype(np.int64)
+
+    def _split_dot_runs(self, centers, colors, counts):
+        """Split runs longer than the scatter patterns into runs of pattern length."""
+        length = self.scatter_patterns.length
+        pieces = np.maximum(-(-counts // length), 1)
+        if np.all(pieces == 1):
+            return centers, colors, counts
+        piece_counts = np.full(pieces.sum(), length, dtype=np.int64)
+        # The last piece of every run holds the remainder
+        piece_counts[np.cumsum(pieces) - 1] = counts - (pieces - 1) * length
+        return (
+            np.repeat(centers, pieces, axis=0),
+            np.repeat(colors, pieces, axis=0),
+            piece_counts,
         )
-        dots = np.stack((center[0] + x_offsets, center[1] + y_offsets), axis=-1)
-        return dots
+
+    def _stamp_dot_runs(
+        self,
+        dot_clusters: DotClusterBatch,
+        region: np.ndarray,
+        top: int,
+        left: int,
+        rng,
+        start: int = 0,
+        stop: int = None,
+        first_chunk: int = 0,
+        num_chunks: int = None,
+    ):
+        """
+        Draw opaque dots by stamping the footprint of every run from the scatter
+        pattern bank, see ScatterPatternBank. Draws the same pixels as drawing the
+        dots of _generate_dot_points one by one, with the same rng. Only num_chunks
+        chunks from first_chunk on are drawn, all of them when it is None.
+        """
+        height, width = region.shape[:2]
+        top_run = np.full((height, width), -1, dtype=np.int32)
+        dot_runs = itertools.islice(
+            self._generate_dot_runs(dot_clusters, start, stop, first_chunk), num_chunks
+        )
+        for centers, colors, counts in dot_runs:
+            centers, colors, counts = self._split_dot_runs(centers, colors, counts)
+            patterns = rng.integers(self.scatter_patterns.size, size=len(counts))
+            runs, offset_y, offset_x = self.scatter_patterns.footprints(
+                patterns, counts
+            )
+            # Same truncation as the dot positions of _generate_dot_points
+            centers = centers.astype(np.int64)
+            ys = centers[runs, 1] + offset_y - top
+            xs = centers[runs, 0] + offset_x - left
+            inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+            paint_topmost(
+                region,
+                top_run,
+                (ys * width + xs)[inside],
+                runs[inside].astype(np.int32),
+                colors,
+            )
 
     def _validate_cluster_and_image(
-        self, dot_clusters: List[DotCluster], preprocessed_image: np.ndarray
+        self, dot_clusters: DotClusterBatch, preprocessed_image: np.ndarray
     ):
         row, col, _ = preprocessed_image.shape
         assert row * col == len(dot_clusters)
 
-        for cluster in dot_clusters:
-            x, y = cluster.position[0], cluster.position[1]
-            assert 0 <= x < col
-            assert 0 <= y < row
+        x, y = dot_clusters.positions[:, 0], dot_clusters.positions[:, 1]
+        assert np.all((0 <= x) & (x < col))
+        assert np.all((0 <= y) & (y < row))
+
+
+_tile_worker_state = {}
+
+
+def _init_tile_worker(
+    config,
+    dot_clusters,
+    shared_canvas_name,
+    canvas_shape,
+    chunk_states,
+    chunk_rows,
+    scatter_patterns,
+):
+    shared_canvas = shared_memory.SharedMemory(name=shared_canvas_name)
+    _tile_worker_state["shared_canvas"] = shared_canvas
+    _tile_worker_state["canvas"] = np.ndarray(
+        canvas_shape, dtype=np.uint8, buffer=shared_canvas.buf
+    )
+    # The parent's bank, an unseeded config would draw a different one per worker
+    _tile_worker_state["generator"] = ImageGenerator(
+        config, scatter_patterns=scatter_patterns
+    )
+    _tile_worker_state["dot_clusters"] = dot_clusters
+    _tile_worker_state["chunk_states"] = chunk_states
+    _tile_worker_state["chunk_rows"] = chunk_rows
+    # Run when the worker process exits, atexit handlers are not
+    multiprocessing.util.Finalize(None, _close_tile_worker, exitpriority=0)
+
+
+def _close_tile_worker():
+    # The canvas view exports the shared buffer, which cannot be closed before it
+    _tile_worker_state.pop("canvas", None)
+    shared_canvas = _tile_worker_state.pop("shared_canvas", None)
+    if shared_canvas is not None:
+        shared_canvas.close()
+
+
+def _render_tile(task):
+    tile_top, tile_bottom = task
+    _tile_worker_state["generator"]._replay_dot_chunks(
+        _tile_worker_state["dot_clusters"],
+        _tile_worker_state["canvas"][tile_top:tile_bottom],
+        tile_top,
+        _tile_worker_state["chunk_states"],
+        _tile_worker_state["chunk_rows"],
+    )
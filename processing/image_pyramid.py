@@ -0,0 +1,103 @@
+import math
+import cv2
+import numpy as np
+
+
+class ImagePyramid:
+    """Gaussian pyramid of a source image, built once with cv2.pyrDown.
+
+    Level 0 is the source itself and every further level halves the previous one
+    after smoothing it with the 5x5 binomial kernel of pyrDown, whose variance is
+    one pixel squared at that level. Level l therefore carries a blur of variance
+    (4**l - 1) / 3 source pixels squared, and its pixel i is centered on source
+    pixel i * 2**l.
+
+    A blurred and downsampled image (see PreProcessor) is served from a level that
+    carries part of the requested blur: the remaining blur is applied at the
+    level's resolution, which is 4**l times fewer pixels than the source, and the
+    result is resampled to the output grid.
+    """
+
+    MIN_LEVEL_SIZE = 8  # no level is smaller than this along either axis
+    # Share of the requested blur variance a level may carry. The rest is a true
+    # Gaussian, so the combined kernel stays close to the one of GaussianBlur
+    MAX_LEVEL_VARIANCE_SHARE = 0.25
+
+    def __init__(self, image: np.ndarray, coarse_levels=None):
+        """
+        Args:
+            image: Source image
+            coarse_levels: Levels 1 and up of an earlier pyramid of the same image,
+                which are then not recomputed
+        """
+        self.levels = [image]
+        if coarse_levels is not None:
+            self.levels.extend(coarse_levels)
+            return
+        while min(self.levels[-1].shape[:2]) >= 2 * self.MIN_LEVEL_SIZE:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+
+    @staticmethod
+    def level_variance(level: int) -> float:
+        """Blur variance of a level, in source pixels squared."""
+        return (4**level - 1) / 3
+
+    def select_level(self, sigma: float, downsample_factor: float) -> int:
+        """Deepest level that is no coarser than the output grid and carries at most
+        MAX_LEVEL_VARIANCE_SHARE of a Gaussian blur of standard deviation sigma."""
+        max_variance = self.MAX_LEVEL_VARIANCE_SHARE * sigma**2
+        level = 0
+        while (
+            level + 1 < len(self.levels)
+            and 2 ** (level + 1) <= downsample_factor
+            and self.level_variance(level + 1) <= max_variance
+        ):
+            level += 1
+        return level
+
+    def blur_and_resize(
+        self,
+        level: int,
+        sigma: float,
+        kernel_radius: int,
+        new_width: int,
+        new_height: int,
+    ) -> np.ndarray:
+        """Blur the source with a Gaussian of standard deviation sigma and resample it
+        to (new_width, new_height) like cv2.resize with INTER_LINEAR, served from a
+        pyramid level.
+
+        Args:
+            level: Pyramid level, see select_level
+            sigma: Standard deviation of the blur, in source pixels
+            kernel_radius: Radius the blur kernel is cut off at, in source pixels
+            new_width: Output width
+            new_height: Output height
+        """
+        scale = 2**level
+        image = self.levels[level]
+        residual_sigma = math.sqrt(max(sigma**2 - self.level_variance(level), 0))
+        residual_sigma /= scale
+        radius = max(1, round(kernel_radius / scale))
+        if residual_sigma > 0:
+            image = cv2.GaussianBlur(
+                image, (2 * radius + 1, 2 * radius + 1), residual_sigma
+            )
+
+        # cv2.resize samples output pixel x at source position (x + 0.5) * step - 0.5,
+        # which is at that position divided by the scale on this level
+        height, width = self.levels[0].shape[:2]
+        step_x, step_y = width / new_width, height / new_height
+        transform = np.array(
+            [
+                [step_x / scale, 0, (0.5 * step_x - 0.5) / scale],
+                [0, step_y / scale, (0.5 * step_y - 0.5) / scale],
+            ]
+        )
+        return cv2.warpAffine(
+            image,
+            transform,
+            (new_width, new_height),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+            borderMode=cv2.BORDER_REPLICATE,
+        )
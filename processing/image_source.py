@@ -0,0 +1,70 @@
+import os
+import numpy as np
+from PIL import Image
+
+
+def open_image_source(path: str) -> np.ndarray:
+    """Open an RGB image as an array, memory-mapping it when the format allows.
+
+    - .npy files holding a (height, width, 3) uint8 array are opened with mmap_mode="r"
+    - Binary PPM (P6) files with 8-bit samples are memory-mapped past their header
+    - Every other format is decoded in memory with Pillow
+
+    Memory-mapped sources are only read when sliced, so PreProcessor's strip mode
+    keeps just the strip being processed in memory.
+
+    Args:
+        path: Path to the image file
+
+    Returns:
+        Array (or np.memmap) of shape (height, width, 3) with dtype uint8
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return np.load(path, mmap_mode="r")
+    if extension in (".ppm", ".pnm"):
+        header = _read_ppm_header(path)
+        if header is not None:
+            width, height, offset = header
+            return np.memmap(
+                path, dtype=np.uint8, mode="r", offset=offset, shape=(height, width, 3)
+            )
+
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def _read_ppm_header(path: str):
+    """Parse a binary PPM header, returning (width, height, data offset).
+
+    Returns None for anything that is not an 8-bit P6 file, which Pillow then decodes.
+    """
+    with open(path, "rb") as file:
+        data = file.read(1024)
+
+    fields = []
+    position = 0
+    while len(fields) < 4:
+        # Skip whitespace and comments between header fields
+        while position < len(data) and data[position : position + 1].isspace():
+            position += 1
+        if data[position : position + 1] == b"#":
+            position = data.find(b"\n", position)
+            if position < 0:
+                return None
+            continue
+        end = position
+        while end < len(data) and not data[end : end + 1].isspace():
+            end += 1
+        if end >= len(data):
+            return None
+        fields.append(data[position:end])
+        position = end
+
+    magic, width, height, max_value = fields
+    if magic != b"P6" or not (width.isdigit() and height.isdigit()):
+        return None
+    if max_value != b"255":
+        return None
+    # A single whitespace character separates the header from the pixel data
+    return int(width), int(height), position + 1
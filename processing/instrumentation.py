@@ -0,0 +1,75 @@
+import abc
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+class MetricsSink(abc.ABC):
+    """Receives one metrics dict per measured pipeline stage.
+
+    Every dict holds the "stage" name, its "wall_time" and "cpu_time" in seconds
+    and the stage-specific sizes and counts, see Processor.apply_pointillism.
+    Subclass and override record to forward metrics anywhere.
+    """
+
+    @abc.abstractmethod
+    def record(self, metrics: Dict):
+        pass
+
+
+class InMemoryMetricsSink(MetricsSink):
+    """Keeps every record in a list, e.g. for tests or notebooks."""
+
+    def __init__(self):
+        self.records: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, metrics: Dict):
+        with self._lock:
+            self.records.append(metrics)
+
+
+class LoggingMetricsSink(MetricsSink):
+    """Logs every record as a single line of JSON."""
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("pointillism.metrics")
+        self.level = level
+
+    def record(self, metrics: Dict):
+        self.logger.log(self.level, json.dumps(metrics, default=str))
+
+
+class JsonLinesMetricsSink(MetricsSink):
+    """Appends every record to a JSON Lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, metrics: Dict):
+        line = json.dumps(metrics, default=str) + "\n"
+        with self._lock, open(self.path, "a") as file:
+            file.write(line)
+
+
+@contextmanager
+def measure_stage(sink: MetricsSink, stage: str):
+    """Time the enclosed block and send its metrics to sink.
+
+    Yields a dict the block can add its sizes and counts to. Without a sink
+    nothing is timed or recorded.
+    """
+    metrics = {"stage": stage}
+    if sink is None:
+        yield metrics
+        return
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    yield metrics
+    metrics["wall_time"] = time.perf_counter() - wall_start
+    metrics["cpu_time"] = time.process_time() - cpu_start
+    sink.record(metrics)
@@ -1,53 +1,225 @@
+import threading
+import weakref
+from collections import OrderedDict
 import cv2
 import numpy as np
 from configs.config import PointillismConfig
-from PIL import Image
+from processing.debug_writer import DebugArtifactWriter
+from processing.disk_cache import content_hash
+from processing.image_pyramid import ImagePyramid
 
 
 class PreProcessor:
+    PREPROCESS_ENGINES = ("direct", "pyramid")
+    # Pyramids kept for the most recent source images, shared by all PreProcessors
+    # so configs that only differ in kernel_size or cluster_distance reuse them
+    PYRAMID_CACHE_SIZE = 4
+    _pyramid_cache = OrderedDict()
+    _pyramid_cache_lock = threading.Lock()
 
-    def __init__(self, config: PointillismConfig = None):
+    def __init__(
+        self, config: PointillismConfig = None, debug_writer: DebugArtifactWriter = None
+    ):
         self.config = config or PointillismConfig()
+        if debug_writer is None and self.config.debug_mode:
+            debug_writer = DebugArtifactWriter.from_config(self.config)
+        self.debug_writer = debug_writer
 
-    def preprocess_image(self, image: np.ndarray) -> np.ndarray:
+    def preprocess_image(self, image: np.ndarray, image_key: str = None) -> np.ndarray:
         """Preprocesses input image by applying Gaussian filtering and downsampling.
 
+        With config.preprocess_strip_height > 0 the image is processed in strips of
+        about that many source rows (see _preprocess_image_strips), so it can be a
+        memory-mapped array that is larger than memory.
+
+        With config.preprocess_engine == "pyramid" the image is served from an
+        ImagePyramid of the source that is built once and reused by later calls
+        with the same source (see _preprocess_image_pyramid). The result then
+        differs slightly from the direct path.
+
         Args:
             img: Input image as numpy array (height, width, channels)
+            image_key: Content hash of the image (see content_hash) when the caller
+                has it, only used by the pyramid engine, which hashes the image
+                otherwise
         Returns:
             Processed image as numpy array
         """
         if self.config.debug_mode:
             print("--Starting image preprocessing--")
 
-        # create image copy
-        preprocessed_image = image.copy()
-        preprocessed_image = self._apply_low_pass_filter(preprocessed_image)
-        preprocessed_image = self._downsample_image(preprocessed_image)
+        if self.config.preprocess_engine not in self.PREPROCESS_ENGINES:
+            raise ValueError(
+                f"Unknown preprocess engine: {self.config.preprocess_engine}. "
+                f"Expected one of {self.PREPROCESS_ENGINES}"
+            )
+
+        if self.config.preprocess_strip_height > 0:
+            if self.config.preprocess_engine == "pyramid":
+                raise ValueError(
+                    "The pyramid preprocess engine needs the whole image, "
+                    "set preprocess_strip_height to 0."
+                )
+            preprocessed_image = self._preprocess_image_strips(image)
+        elif self.config.preprocess_engine == "pyramid":
+            preprocessed_image = self._preprocess_image_pyramid(image, image_key)
+        else:
+            # Neither step modifies its input, so the image is not copied
+            preprocessed_image = self._apply_low_pass_filter(image)
+            preprocessed_image = self._downsample_image(preprocessed_image)
 
         if self.config.debug_mode:
             print("--Finished image preprocessing--")
 
         return preprocessed_image
 
-    def _apply_low_pass_filter(self, image: np.ndarray):
+    def _preprocess_image_pyramid(
+        self, image: np.ndarray, image_key: str = None
+    ) -> np.ndarray:
+        """Blur and downsample the image from a pyramid level.
+
+        The level is the deepest one that carries at most part of the blur of
+        kernel_size (see ImagePyramid.select_level). On level 0, for small kernels,
+        the output is that of the direct path. On coarser levels the remaining blur
+        and the resampling run at the level's resolution, which matches the direct
+        path up to a mean absolute difference below 0.5 and a 99.9th percentile
+        difference of at most 6 intensity levels on images of 480x640 and larger
+        (see benchmarks/pyramid_preprocess_check.py). Smaller images differ more,
+        as a larger share of their pixels lies near the borders.
+        """
+        self._validate_kernel_size()
+        pyramid = self._get_pyramid(image, image_key or content_hash(image))
+        kernel_size = self.config.kernel_size
+        # Standard deviation GaussianBlur derives from the kernel size
+        sigma = 0.3 * ((kernel_size - 1) * 0.5 - 1) + 0.8
+        level = pyramid.select_level(sigma, self.config.cluster_distance)
+
+        if self.config.debug_mode:
+            print(f"Serving kernel size {kernel_size} from pyramid level {level}")
+
+        if level == 0:
+            return self._downsample_image(self._apply_low_pass_filter(image))
+
+        height, width = image.shape[:2]
+        new_width = int(width // self.config.cluster_distance)
+        new_height = int(height // self.config.cluster_distance)
+        down_sampled_image = pyramid.blur_and_resize(
+            level, sigma, kernel_size // 2, new_width, new_height
+        )
+        if self.config.debug_mode:
+            self.debug_writer.write("downsampled", down_sampled_image)
+        return down_sampled_image
+
+    def _get_pyramid(self, image: np.ndarray, image_key: str) -> ImagePyramid:
+        """Pyramid of the image, from the pyramid cache when it holds one.
+
+        Entries are keyed by the content hash of the source and hold a weak
+        reference to it. Entries whose source was freed are dropped, so the cache
+        never keeps the levels of an image nobody uses anymore.
+        """
+        cache = PreProcessor._pyramid_cache
+        with PreProcessor._pyramid_cache_lock:
+            for key in [key for key, (source, _) in cache.items() if source() is None]:
+                del cache[key]
+            if image_key in cache:
+                cache.move_to_end(image_key)
+                return ImagePyramid(image, cache[image_key][1])
+
+        pyramid = ImagePyramid(image)
+        with PreProcessor._pyramid_cache_lock:
+            cache[image_key] = (weakref.ref(image), pyramid.levels[1:])
+            while len(cache) > self.PYRAMID_CACHE_SIZE:
+                cache.popitem(last=False)
+        return pyramid
+
+    def _preprocess_image_strips(self, image: np.ndarray) -> np.ndarray:
+        """Blur and downsample the image strip by strip, producing the same output as
+        the in-memory path.
+
+        Each strip covers a run of output rows. The source rows they interpolate from
+        are read together with a halo of kernel_size // 2 rows on each side, so the
+        Gaussian blur of those rows matches blurring the whole image. Only the
+        downsampled image is assembled in memory.
+
+        When the image height is a multiple of cluster_distance every strip maps to
+        whole blocks of source rows and is resized with cv2.resize directly. Otherwise
+        the rows are resampled with _resize_linear_rows, which reproduces the
+        fixed-point arithmetic of cv2.resize(..., interpolation=cv2.INTER_LINEAR).
+        """
+        self._validate_kernel_size()
+        height, width = image.shape[:2]
+        new_width = int(width // self.config.cluster_distance)
+        new_height = int(height // self.config.cluster_distance)
+        halo = self.config.kernel_size // 2
+        rows_per_strip = max(
+            1, self.config.preprocess_strip_height // self.config.cluster_distance
+        )
+        integer_scale = height == new_height * self.config.cluster_distance
+
+        if self.config.debug_mode:
+            print(
+                f"Preprocessing {(width, height)} image in strips of {rows_per_strip} output rows"
+            )
+
+        row_coefficients = _linear_resize_coefficients(new_height, height)
+        column_coefficients = _linear_resize_coefficients(new_width, width)
+        down_sampled_image = np.empty((new_height, new_width, 3), dtype=np.uint8)
+        for strip_start in range(0, new_height, rows_per_strip):
+            strip_stop = min(strip_start + rows_per_strip, new_height)
+            if integer_scale:
+                first_row = strip_start * self.config.cluster_distance
+                last_row = strip_stop * self.config.cluster_distance
+            else:
+                first_row = row_coefficients[0][strip_start]
+                last_row = row_coefficients[1][strip_stop - 1] + 1
+
+            # Blur the needed source rows together with their halo
+            read_start = max(0, first_row - halo)
+            read_stop = min(height, last_row + halo)
+            strip = np.ascontiguousarray(image[read_start:read_stop])
+            blurred_strip = cv2.GaussianBlur(
+                strip, (self.config.kernel_size, self.config.kernel_size), 0
+            )
+            blurred_strip = blurred_strip[
+                first_row - read_start : last_row - read_start
+            ]
+
+            if integer_scale:
+                down_sampled_image[strip_start:strip_stop] = cv2.resize(
+                    blurred_strip,
+                    (new_width, strip_stop - strip_start),
+                    interpolation=cv2.INTER_LINEAR,
+                )
+            else:
+                strip_rows = tuple(
+                    coefficients[strip_start:strip_stop]
+                    for coefficients in row_coefficients
+                )
+                down_sampled_image[strip_start:strip_stop] = _resize_linear_rows(
+                    blurred_strip, first_row, strip_rows, column_coefficients
+                )
+
+        return down_sampled_image
+
+    def _validate_kernel_size(self):
         if self.config.kernel_size <= 0 or self.config.kernel_size % 2 == 0:
             raise ValueError("Kernel size must be a positive odd integer.")
 
+    def _apply_low_pass_filter(self, image: np.ndarray):
+        self._validate_kernel_size()
+
         if self.config.debug_mode:
             print(
                 f"Applying low pass filter with kernel size: {self.config.kernel_size}"
             )
 
-        bgr_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-        bgr_blurred_image = cv2.GaussianBlur(
-            bgr_image, (self.config.kernel_size, self.config.kernel_size), 0
+        # The blur treats every channel alike, so the image stays in RGB order
+        rgb_blurred_image = cv2.GaussianBlur(
+            image, (self.config.kernel_size, self.config.kernel_size), 0
         )
-        rgb_blurred_image = cv2.cvtColor(bgr_blurred_image, cv2.COLOR_BGR2RGB)
 
         if self.config.debug_mode:
-            debug_image = Image.fromarray(rgb_blurred_image, "RGB")
-            debug_image.save("images/output/low_pass_filter.jpg")
+            self.debug_writer.write("low_pass_filter", rgb_blurred_image)
         return rgb_blurred_image
 
     def _downsample_image(self, image: np.ndarray):
@@ -66,6 +238,61 @@ class PreProcessor:
             print(
                 f"Image downsampled from {(width, height)} to {(new_width, new_height)}"
             )
-            debug_image = Image.fromarray(down_sampled_image, "RGB")
-            debug_image.save("images/output/downsampled.jpg")
+            self.debug_writer.write("downsampled", down_sampled_image)
         return down_sampled_image
+
+
+def _linear_resize_coefficients(dst_size: int, src_size: int):
+    """Source indices and fixed-point weights cv2.resize uses for INTER_LINEAR.
+
+    Returns:
+        Tuple of (first source index, second source index, first weight, second weight)
+        arrays of length dst_size, with weights summing to 2048
+    """
+    scale = 1.0 / (dst_size / src_size)
+    positions = ((np.arange(dst_size) + 0.5) * scale - 0.5).astype(np.float32)
+    first = np.floor(positions).astype(np.int64)
+    fractions = (positions - first).astype(np.float32)
+    # Positions past either border are clamped to the border pixel
+    before = first < 0
+    after = first >= src_size - 1
+    fractions[before | after] = 0
+    first[before] = 0
+    first[after] = src_size - 1
+    second = np.minimum(first + 1, src_size - 1)
+    first_weights = np.round((np.float32(1) - fractions) * 2048).astype(np.int32)
+    second_weights = np.round(fractions * 2048).astype(np.int32)
+    return first, second, first_weights, second_weights
+
+
+def _resize_linear_rows(
+    rows: np.ndarray, first_row: int, row_coefficients, column_coefficients
+) -> np.ndarray:
+    """Resample uint8 rows like cv2.resize with INTER_LINEAR.
+
+    Args:
+        rows: Source rows starting at source row index first_row
+        first_row: Source row index of rows[0]
+        row_coefficients: _linear_resize_coefficients entries of the output rows
+        column_coefficients: _linear_resize_coefficients of the output columns
+    """
+    first_column, second_column, first_column_weights, second_column_weights = (
+        column_coefficients
+    )
+    first_row_index, second_row_index, first_row_weights, second_row_weights = (
+        row_coefficients
+    )
+    rows = rows.astype(np.int32)
+    horizontal = (
+        rows[:, first_column] * first_column_weights[None, :, None]
+        + rows[:, second_column] * second_column_weights[None, :, None]
+    )
+    # Vertical pass with the same rounding steps as OpenCV's 8-bit linear resize
+    top = (horizontal[first_row_index - first_row] >> 4) * first_row_weights[
+        :, None, None
+    ]
+    bottom = (horizontal[second_row_index - first_row] >> 4) * second_row_weights[
+        :, None, None
+    ]
+    resized = ((top >> 16) + (bottom >> 16) + 2) >> 2
+    return np.clip(resized, 0, 255).astype(np.uint8)
@@ -1,21 +1,74 @@
+import cProfile
+import dataclasses
+import os
+import pstats
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
 import numpy as np
 from configs.config import PointillismConfig
+from models.dot_cluster_batch import DotClusterBatch
 from processing.color_palette import ColorPalette
 from processing.color_transformer import ColorTransformer
+from processing.debug_writer import DebugArtifactWriter
+from processing.disk_cache import DiskArrayCache, content_hash
 from processing.image_generator import ImageGenerator
+from processing.instrumentation import MetricsSink, measure_stage
+from processing.stage_cache import PIPELINE_STAGES, StageCache, stage_keys
+from processing.strip_writers import open_strip_writer
 from .preprocessor import PreProcessor
 from PIL import Image
 
 
 class Processor:
-    def __init__(self, config: PointillismConfig = None):
+    # Config fields that never change the rendered image, left out of the render cache key
+    RENDER_CACHE_IGNORED_FIELDS = (
+        "preprocess_strip_height",
+        "render_strip_height",
+        "rasterizer",
+        "palette_cache_dir",
+        "palette_cache_size",
+        "render_cache_dir",
+        "render_cache_size",
+        "debug_mode",
+    )
+    NUM_STAGE_RNGS = 3  # palette, transform and render streams
+
+    def __init__(
+        self,
+        config: PointillismConfig = None,
+        workers: int = 1,
+        metrics_sink: MetricsSink = None,
+        stage_cache: StageCache = None,
+    ):
         self.config = config or PointillismConfig()
+        # Receives per-stage timings and counts, None disables instrumentation
+        self.metrics_sink = metrics_sink
+        # Memoizes the stages before rendering, may be shared by several Processors
+        self.stage_cache = stage_cache
         if self.config.debug_mode:
             print("Initializing PreProcessor with config:", self.config)
-        self.preprocessor = PreProcessor(self.config)
+        # Saves the debug artifacts of every stage off the rendering path
+        self.debug_writer = None
+        if self.config.debug_mode:
+            self.debug_writer = DebugArtifactWriter.from_config(self.config)
+        self.preprocessor = PreProcessor(self.config, self.debug_writer)
         self.color_palette = ColorPalette(self.config)
         self.color_transformer = ColorTransformer(self.config)
-        self.image_generator = ImageGenerator(self.config)
+        self.image_generator = ImageGenerator(
+            self.config, workers=workers, debug_writer=self.debug_writer
+        )
+        self.palette_cache = None
+        if self.config.palette_cache_dir is not None:
+            self.palette_cache = DiskArrayCache(
+                self.config.palette_cache_dir, self.config.palette_cache_size
+            )
+        self.palette_cache_stats = {"hits": 0, "misses": 0}
+        self.render_cache = None
+        if self.config.render_cache_dir is not None:
+            self.render_cache = DiskArrayCache(
+                self.config.render_cache_dir, self.config.render_cache_size
+            )
+        self.render_cache_stats = {"hits": 0, "misses": 0}
 
     def apply_pointillism(self, image: np.ndarray) -> np.ndarray:
         """Applies the pointillism effect to the input image.
@@ -27,6 +80,9 @@ class Processor:
 
         Returns:
             A NumPy array representing the pointillism-rendered image.
+            With config.seed set, the same image and config always give the
+            same result, which is then served from the render cache when
+            configured.
 
         Raises:
             ValueError: If the input image is not a valid NumPy array
@@ -35,25 +91,366 @@ class Processor:
         if self.config.debug_mode:
             print("Starting pointillism effect application")
 
-        self._validate_image_input(image)
-        preprocessed_image = self.preprocessor.preprocess_image(image)
-        self._validate_image_input(preprocessed_image)
+        sink = self.metrics_sink
+        with measure_stage(sink, "apply_pointillism") as total_metrics:
+            total_metrics["image_shape"] = image.shape
+            self.validate_image_input(image)
+            render_key = None
+            if self.render_cache is not None and self.config.seed is not None:
+                with measure_stage(sink, "render_cache") as metrics:
+                    render_key = self.render_cache_key(image)
+                    canvas = self.render_cache.get(render_key)
+                    metrics["cache_hit"] = canvas is not None
+                if canvas is not None:
+                    self.render_cache_stats["hits"] += 1
+                    total_metrics["canvas_shape"] = canvas.shape
+                    return canvas
+                self.render_cache_stats["misses"] += 1
+            palette_rng, transform_rng, render_rng = self.create_stage_rngs()
+            image_key = None if self.stage_cache is None else content_hash(image)
+
+            preprocessed_image, dot_clusters = self._compute_dot_clusters(
+                image, palette_rng, transform_rng, image_key
+            )
+
+            with measure_stage(sink, "render") as metrics:
+                canvas = self.image_generator.generate(
+                    dot_clusters, preprocessed_image, render_rng
+                )
+                metrics["num_clusters"] = len(dot_clusters)
+                if sink is not None:
+                    metrics["num_dots"] = int(
+                        self.image_generator.drawn_dot_counts(
+                            dot_clusters.dot_counts
+                        ).sum()
+                    )
+                metrics["canvas_shape"] = canvas.shape
+                metrics["canvas_bytes"] = canvas.nbytes
+            total_metrics["canvas_shape"] = canvas.shape
+            if render_key is not None:
+                self.render_cache.put(render_key, canvas)
+        return canvas
+
+    def _compute_dot_clusters(
+        self,
+        image: np.ndarray,
+        palette_rng: np.random.Generator,
+        transform_rng: np.random.Generator,
+        image_key: str = None,
+    ) -> Tuple[np.ndarray, DotClusterBatch]:
+        """Runs every stage before rendering: preprocessing, the color palette and
+        the dot clusters.
+
+        With a stage cache and the image's content hash every stage goes through
+        the cache (see PIPELINE_STAGES), so it only runs when no earlier config with
+        the same stage fields computed it for this image.
+
+        Returns:
+            Tuple of the preprocessed image and its dot clusters
+        """
+        sink = self.metrics_sink
+        keys = {}
+        if self.stage_cache is not None and image_key is not None:
+            keys = stage_keys(self.config, image_key)
+        with measure_stage(sink, "preprocess") as metrics:
+            preprocessed_image = self._run_stage(
+                keys,
+                "preprocess",
+                lambda: self.preprocessor.preprocess_image(image, image_key),
+            )
+            metrics["input_shape"] = image.shape
+            metrics["output_shape"] = preprocessed_image.shape
+        self.validate_image_input(preprocessed_image)
         if self.config.debug_mode:
-            debug_image = Image.fromarray(preprocessed_image, "RGB")
-            debug_image.save("images/output/preprocessed_image.jpg")
+            self.debug_writer.write("preprocessed_image", preprocessed_image)
+
+        with measure_stage(sink, "palette") as metrics:
+            hits = self.palette_cache_stats["hits"]
+            color_palette = self._run_stage(
+                keys,
+                "palette",
+                lambda: self.compute_color_palette(preprocessed_image, palette_rng),
+            )
+            metrics["num_colors"] = len(color_palette)
+            if self.palette_cache is not None:
+                metrics["cache_hit"] = self.palette_cache_stats["hits"] > hits
+        assert len(color_palette) == self.config.palette_size
+        if self.config.debug_mode:
+            self.debug_writer.write(
+                "color_palette", self.color_palette_swatches(color_palette)
+            )
+        with measure_stage(sink, "inverses") as metrics:
+            color_triple_inverses = self._run_stage(
+                keys,
+                "inverses",
+                lambda: self.color_palette.compute_color_triple_inverses(color_palette),
+            )
+            metrics["num_triples"] = (
+                0
+                if color_triple_inverses is None
+                else len(color_triple_inverses.inverses)
+            )
+        with measure_stage(sink, "transform") as metrics:
+            dot_clusters = self._run_stage(
+                keys,
+                "transform",
+                lambda: self.color_transformer.transform(
+                    preprocessed_image,
+                    color_palette,
+                    color_triple_inverses,
+                    rng=transform_rng,
+                ),
+            )
+            metrics["num_clusters"] = len(dot_clusters)
+            if sink is not None:
+                metrics["num_singular_clusters"] = int(dot_clusters.singular.sum())
+        return preprocessed_image, dot_clusters
+
+    def _run_stage(self, keys: Dict, name: str, compute: Callable):
+        """Result of a stage, from the stage cache when the stage has a key."""
+        key = keys.get(name)
+        if key is None:
+            return compute()
+        return self.stage_cache.get_or_compute(key, compute)
+
+    def sweep(
+        self,
+        image: np.ndarray,
+        configs: Sequence[PointillismConfig],
+        max_workers: int = None,
+    ) -> List[np.ndarray]:
+        """Applies the pointillism effect to one image with every config in configs.
+
+        The configs share the results of the stages before rendering they agree on
+        (see PIPELINE_STAGES), e.g. a sweep over brushstroke_radius preprocesses,
+        computes the palette and transforms the image once. These stages run on up
+        to max_workers threads, where each shared stage runs once and the others in
+        parallel. The renders, which do not depend on each other, then run on up to
+        max_workers processes. Stages that draw random numbers are only shared
+        between seeded configs.
+
+        Stage results go through this Processor's stage cache, so later sweeps of
+        the same image reuse them, or through a cache that lives for this sweep
+        when the Processor has none. Every config renders with this Processor's
+        worker count, and seeded results equal those of apply_pointillism. The
+        render cache is not used.
+
+        Args:
+            image: Input RGB image, see apply_pointillism
+            configs: Configs to render the image with
+            max_workers: Number of threads and processes, the number of CPUs by
+                default
+
+        Returns:
+            The canvas of every config, in the order of configs
+        """
+        self.validate_image_input(image)
+        max_workers = min(max_workers or os.cpu_count() or 1, max(1, len(configs)))
+        sink = self.metrics_sink
+        image_key = content_hash(image)
+        stage_cache = self.stage_cache
+        if stage_cache is None:
+            stage_cache = StageCache(max(1, len(PIPELINE_STAGES) * len(configs)))
+        workers = self.image_generator.workers
+
+        def compute_stages(config: PointillismConfig):
+            processor = Processor(config, workers, sink, stage_cache)
+            palette_rng, transform_rng, render_rng = processor.create_stage_rngs()
+            preprocessed_image, dot_clusters = processor._compute_dot_clusters(
+                image, palette_rng, transform_rng, image_key
+            )
+            return config, workers, dot_clusters, preprocessed_image, render_rng
+
+        with measure_stage(sink, "sweep") as metrics:
+            metrics["image_shape"] = image.shape
+            metrics["num_configs"] = len(configs)
+            with ThreadPoolExecutor(max_workers) as executor:
+                leaves = list(executor.map(compute_stages, configs))
+            if max_workers == 1:
+                return [_render_sweep_leaf(*leaf) for leaf in leaves]
+            with ProcessPoolExecutor(max_workers) as executor:
+                futures = [
+                    executor.submit(_render_sweep_leaf, *leaf) for leaf in leaves
+                ]
+                return [future.result() for future in futures]
+
+    def apply_pointillism_progressive(
+        self, image: np.ndarray, preview_passes=None
+    ) -> Iterator[np.ndarray]:
+        """Applies the pointillism effect, yielding quick previews before the result.
+
+        The previews are rendered at a reduced scale from a subsample of the dots,
+        see ImageGenerator.generate_progressive. The last canvas yielded equals the
+        output of apply_pointillism for the same image and config. Stopping the
+        iteration early skips the remaining passes.
+
+        Args:
+            image: Input RGB image, see apply_pointillism
+            preview_passes: Optional (scale divisor, dot fraction) pairs of the
+                preview passes, ImageGenerator.PREVIEW_PASSES by default
+
+        Yields:
+            Canvases of the final shape, coarsest first
+        """
+        self.validate_image_input(image)
+        render_key = None
+        if self.render_cache is not None and self.config.seed is not None:
+            render_key = self.render_cache_key(image)
+            canvas = self.render_cache.get(render_key)
+            if canvas is not None:
+                self.render_cache_stats["hits"] += 1
+                yield canvas
+                return
+            self.render_cache_stats["misses"] += 1
+        palette_rng, transform_rng, render_rng = self.create_stage_rngs()
+        image_key = None if self.stage_cache is None else content_hash(image)
+        preprocessed_image, dot_clusters = self._compute_dot_clusters(
+            image, palette_rng, transform_rng, image_key
+        )
 
-        color_palette = self.color_palette.compute_pointillism_color_palette(
-            preprocessed_image
+        canvas = None
+        for canvas in self.image_generator.generate_progressive(
+            dot_clusters, preprocessed_image, render_rng, preview_passes
+        ):
+            yield canvas
+        # Only reached after the final pass
+        if render_key is not None:
+            self.render_cache.put(render_key, canvas)
+
+    def render_to_file(
+        self, image: np.ndarray, output_path: str, extension: str = None
+    ) -> Tuple[int, int, int]:
+        """Applies the pointillism effect and writes the result strip by strip.
+
+        The canvas is rendered in strips of config.render_strip_height rows (see
+        ImageGenerator.generate_strips) that go straight into a strip writer, so the
+        full canvas is never held in memory. The strips are rendered in this process
+        only, whatever the worker count, and the file holds the same image as the
+        output of apply_pointillism. The render cache, which stores whole canvases,
+        is not used.
+
+        Args:
+            image: Input RGB image, see apply_pointillism
+            output_path: PNG or .npy file to write
+            extension: Extension that picks the format, the one of output_path when
+                omitted
+
+        Returns:
+            Shape of the written image
+
+        Raises:
+            ValueError: If config.render_strip_height is not positive or the format
+                cannot be written in strips
+        """
+        if self.config.render_strip_height < 1:
+            raise ValueError("config.render_strip_height must be a positive integer.")
+        sink = self.metrics_sink
+        with measure_stage(sink, "render_to_file") as total_metrics:
+            total_metrics["image_shape"] = image.shape
+            self.validate_image_input(image)
+            palette_rng, transform_rng, render_rng = self.create_stage_rngs()
+            image_key = None if self.stage_cache is None else content_hash(image)
+            preprocessed_image, dot_clusters = self._compute_dot_clusters(
+                image, palette_rng, transform_rng, image_key
+            )
+
+            with measure_stage(sink, "render_strips") as metrics:
+                height, width = preprocessed_image.shape[:2]
+                canvas_shape = (
+                    int(self.config.cluster_distance * height),
+                    int(self.config.cluster_distance * width),
+                    3,
+                )
+                num_strips = 0
+                with open_strip_writer(
+                    output_path, canvas_shape[0], canvas_shape[1], extension
+                ) as writer:
+                    for _, strip in self.image_generator.generate_strips(
+                        dot_clusters, preprocessed_image, render_rng
+                    ):
+                        writer.write(strip)
+                        num_strips += 1
+                metrics["num_strips"] = num_strips
+                metrics["canvas_shape"] = canvas_shape
+            total_metrics["canvas_shape"] = canvas_shape
+        return canvas_shape
+
+    def create_stage_rngs(self):
+        """Independent random generators for the palette, transform and render stages.
+
+        All three are spawned from config.seed, so every stage draws the same numbers
+        for a given seed no matter how many draws another stage makes.
+        """
+        seed_sequence = np.random.SeedSequence(self.config.seed)
+        return tuple(
+            np.random.default_rng(child)
+            for child in seed_sequence.spawn(self.NUM_STAGE_RNGS)
         )
-        assert len(color_palette) == 16
-        self.visualize_color_palette(color_palette)
-        dot_clusters = self.color_transformer.transform(
-            preprocessed_image, color_palette
+
+    def render_cache_key(self, image: np.ndarray) -> str:
+        """Render cache key of an input image: its content hash and every config field
+        that affects the result, including the seed."""
+        fields = ",".join(
+            f"{field.name}={getattr(self.config, field.name)!r}"
+            for field in dataclasses.fields(self.config)
+            if field.name not in self.RENDER_CACHE_IGNORED_FIELDS
         )
+        return content_hash(image, np.frombuffer(fields.encode(), dtype=np.uint8))
+
+    def profile(
+        self, image: np.ndarray, output_path: str = None
+    ) -> Tuple[np.ndarray, pstats.Stats]:
+        """Runs apply_pointillism once under cProfile.
+
+        Args:
+            image: Input RGB image, see apply_pointillism
+            output_path: Optional path the raw profile is dumped to, readable with
+                pstats or snakeviz
 
-        self.image_generator.generate(dot_clusters, preprocessed_image)
+        Returns:
+            Tuple of the rendered image and the profile statistics
+        """
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            canvas = self.apply_pointillism(image)
+        finally:
+            profiler.disable()
+        if output_path is not None:
+            profiler.dump_stats(output_path)
+        return canvas, pstats.Stats(profiler)
+
+    def compute_color_palette(
+        self, preprocessed_image: np.ndarray, rng: np.random.Generator
+    ) -> np.ndarray:
+        """Computes the color palette, going through the palette cache when configured.
+
+        Cache hits and misses are counted in palette_cache_stats.
+        """
+        if self.palette_cache is None:
+            return self.color_palette.compute_pointillism_color_palette(
+                preprocessed_image, rng
+            )
 
-    def _validate_image_input(self, image: np.ndarray):
+        key = self.color_palette.cache_key(preprocessed_image)
+        color_palette = self.palette_cache.get(key)
+        cache_hit = color_palette is not None
+        if cache_hit:
+            self.color_palette.validate_color_palette(color_palette)
+            self.palette_cache_stats["hits"] += 1
+        else:
+            color_palette = self.color_palette.compute_pointillism_color_palette(
+                preprocessed_image, rng
+            )
+            self.palette_cache.put(key, color_palette)
+            self.palette_cache_stats["misses"] += 1
+        if self.config.debug_mode:
+            print(
+                f"Palette cache {'hit' if cache_hit else 'miss'}: {self.palette_cache_stats}"
+            )
+        return color_palette
+
+    def validate_image_input(self, image: np.ndarray):
         """Validates the input image array meets the required specifications.
 
         Args:
@@ -64,7 +461,6 @@ class Processor:
                 - Is not a NumPy array
                 - Does not have shape (height, width, 3)
                 - Does not have data type np.uint8
-                - Contains pixel values outside the range [0, 255]
         """
         if not isinstance(image, np.ndarray):
             raise ValueError("Input image must be a NumPy array.")
@@ -72,8 +468,8 @@ class Processor:
             raise ValueError("Input image must have shape (height, width, 3).")
         if image.dtype != np.uint8:
             raise ValueError("Input image must have data type np.uint8.")
-        if np.any(image < 0) or np.any(image > 255):
-            raise ValueError("Pixel values must be in the range [0, 255].")
+        # uint8 values are always within [0, 255], so the pixels are not scanned,
+        # which would read a memory-mapped image in full
 
     def visualize_color_palette(
         self,
@@ -83,12 +479,24 @@ class Processor:
         """Visualize the color palette as a grid of color swatches.
 
         Args:
-            color_palette: Array of RGB colors of shape (16, 3)
+            color_palette: Array of RGB colors of shape (m, 3)
             output_path: Path to save the visualization
         """
-        # Create a 4x4 grid of color swatches
-        swatch_size = 100  # Size of each color swatch in pixels
-        grid_size = 4  # 4x4 grid for 16 colors
+        visualization = self.color_palette_swatches(color_palette)
+        Image.fromarray(visualization, "RGB").save(output_path)
+
+    def color_palette_swatches(self, color_palette: np.ndarray) -> np.ndarray:
+        """Render the color palette as a grid of color swatches.
+
+        Args:
+            color_palette: Array of RGB colors of shape (m, 3)
+
+        Returns:
+            RGB image of the swatch grid
+        """
+        # Create a square grid of color swatches, 4x4 for 16 colors
+        grid_size = max(1, int(np.ceil(np.sqrt(len(color_palette)))))
+        swatch_size = max(1, 400 // grid_size)  # Size of each color swatch in pixels
         image_size = swatch_size * grid_size
 
         # Create a blank image
@@ -106,5 +514,16 @@ class Processor:
                     x_end = (j + 1) * swatch_size
                     visualization[y_start:y_end, x_start:x_end] = color
 
-        # Convert to PIL Image and save
-        Image.fromarray(visualization, "RGB").save(output_path)
+        return visualization
+
+
+def _render_sweep_leaf(
+    config: PointillismConfig,
+    workers: int,
+    dot_clusters: DotClusterBatch,
+    preprocessed_image: np.ndarray,
+    render_rng: np.random.Generator,
+) -> np.ndarray:
+    return ImageGenerator(config, workers=workers).generate(
+        dot_clusters, preprocessed_image, render_rng
+    )
@@ -0,0 +1,200 @@
+import abc
+import warnings
+import cv2
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # optional dependency, the numba backend is then unavailable
+    numba = None
+
+
+def compute_disc_offsets(radius: int):
+    """Pixel offsets (dy, dx) covered by a filled cv2.circle of the given radius."""
+    size = 2 * radius + 1
+    disc = np.zeros((size, size), dtype=np.uint8)
+    cv2.circle(disc, (radius, radius), radius, 1, -1)
+    offset_y, offset_x = np.nonzero(disc)
+    return offset_y - radius, offset_x - radius
+
+
+class Rasterizer(abc.ABC):
+    """Draws filled discs of a fixed radius onto a canvas.
+
+    Every backend draws exactly the pixels of a filled cv2.circle and, where dots
+    overlap, leaves the dot that comes last in `points` on top, so all backends give
+    pixel-identical canvases.
+    """
+
+    name = None
+
+    def __init__(self, radius: int):
+        self.radius = radius
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return True
+
+    @abc.abstractmethod
+    def draw_dots(self, canvas: np.ndarray, points: np.ndarray, colors: np.ndarray):
+        """
+        Draw filled discs at the given points, in place.
+
+        Args:
+            canvas: RGB canvas of shape (height, width, 3)
+            points: (n, 2) int array of (x, y) dot centers
+            colors: (n, 3) uint8 array of dot colors
+        """
+
+    def release_scratch(self):
+        """Free the buffers kept between draw_dots calls, once a canvas is done."""
+
+
+class OpenCVRasterizer(Rasterizer):
+    """One cv2.circle call per dot, the reference every other backend matches."""
+
+    name = "opencv"
+
+    def draw_dots(self, canvas: np.ndarray, points: np.ndarray, colors: np.ndarray):
+        for (x, y), color in zip(points.tolist(), colors.tolist()):
+            cv2.circle(canvas, (x, y), self.radius, color, -1)
+
+
+class NumpyRasterizer(Rasterizer):
+    """Vectorized drawing of a whole batch of dots with NumPy."""
+
+    name = "numpy"
+
+    def __init__(self, radius: int):
+        super().__init__(radius)
+        self._disc_offsets = compute_disc_offsets(radius)
+        # Index of the topmost dot per canvas pixel, kept filled with -1 between calls
+        # until release_scratch
+        self._top_dot = None
+
+    def release_scratch(self):
+        self._top_dot = None
+
+    def draw_dots(self, canvas: np.ndarray, points: np.ndarray, colors: np.ndarray):
+        height, width = canvas.shape[:2]
+        if self._top_dot is None or self._top_dot.shape != (height, width):
+            self._top_dot = np.full((height, width), -1, dtype=np.int32)
+        offset_y, offset_x = self._disc_offsets
+        ys = points[:, 1:2] + offset_y
+        xs = points[:, 0:1] + offset_x
+        inside = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+
+        pixel_indices = (ys * width + xs)[inside]
+        dot_indices = np.broadcast_to(
+            np.arange(len(points), dtype=np.int32)[:, None], inside.shape
+        )[inside]
+        paint_topmost(canvas, self._top_dot, pixel_indices, dot_indices, colors)
+
+
+def paint_topmost(
+    canvas: np.ndarray,
+    top_index: np.ndarray,
+    pixel_indices: np.ndarray,
+    indices: np.ndarray,
+    colors: np.ndarray,
+):
+    """
+    Paint every listed pixel with the color of the highest index listed for it.
+
+    Args:
+        canvas: RGB canvas of shape (height, width, 3)
+        top_index: int32 scratch array of shape (height, width) filled with -1, left
+            filled with -1 again
+        pixel_indices: Flat canvas indices of the painted pixels
+        indices: Index into colors of every painted pixel, later ones end up on top
+        colors: (n, 3) uint8 array of colors
+    """
+    # Keep the highest index on every pixel, then write each pixel's color once
+    flat_top_index = top_index.reshape(-1)
+    np.maximum.at(flat_top_index, pixel_indices, indices)
+    on_top = flat_top_index[pixel_indices] == indices
+    pixel_indices = pixel_indices[on_top]
+    flat_canvas = canvas.reshape(-1, 3)
+    flat_canvas[pixel_indices] = colors[indices[on_top]]
+    flat_top_index[pixel_indices] = -1
+
+
+if numba is not None:
+
+    @numba.njit(cache=True, nogil=True)
+    def _draw_dots_kernel(canvas, points, colors, offset_y, offset_x):
+        height, width = canvas.shape[0], canvas.shape[1]
+        for dot in range(points.shape[0]):
+            x = points[dot, 0]
+            y = points[dot, 1]
+            for offset in range(offset_y.shape[0]):
+                pixel_y = y + offset_y[offset]
+                pixel_x = x + offset_x[offset]
+                if 0 <= pixel_y < height and 0 <= pixel_x < width:
+                    canvas[pixel_y, pixel_x, 0] = colors[dot, 0]
+                    canvas[pixel_y, pixel_x, 1] = colors[dot, 1]
+                    canvas[pixel_y, pixel_x, 2] = colors[dot, 2]
+
+
+class NumbaRasterizer(Rasterizer):
+    """Compiled loop over the dots, drawn in order. Needs the optional numba package."""
+
+    name = "numba"
+
+    def __init__(self, radius: int):
+        if numba is None:
+            raise ImportError("The numba rasterizer needs the numba package.")
+        super().__init__(radius)
+        offset_y, offset_x = compute_disc_offsets(radius)
+        self._offset_y = offset_y.astype(np.int64)
+        self._offset_x = offset_x.astype(np.int64)
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return numba is not None
+
+    def draw_dots(self, canvas: np.ndarray, points: np.ndarray, colors: np.ndarray):
+        _draw_dots_kernel(
+            canvas,
+            points.astype(np.int64, copy=False),
+            colors,
+            self._offset_y,
+            self._offset_x,
+        )
+
+
+RASTERIZERS = {
+    rasterizer.name: rasterizer
+    for rasterizer in (NumbaRasterizer, NumpyRasterizer, OpenCVRasterizer)
+}
+# Backends tried by "auto", fastest first
+AUTO_RASTERIZERS = ("numba", "numpy")
+
+
+def available_rasterizers():
+    """Names of the backends usable in this environment."""
+    return [
+        name for name, rasterizer in RASTERIZERS.items() if rasterizer.is_available()
+    ]
+
+
+def create_rasterizer(name: str, radius: int) -> Rasterizer:
+    """Create the rasterizer backend called name, or the fastest available for "auto".
+
+    A known backend that is unavailable here falls back to "auto" with a warning.
+
+    Raises:
+        ValueError: If name is neither "auto" nor a known backend
+    """
+    if name != "auto" and name not in RASTERIZERS:
+        raise ValueError(
+            f"Unknown rasterizer: {name}. Expected 'auto' or one of {tuple(RASTERIZERS)}"
+        )
+    if name != "auto":
+        if RASTERIZERS[name].is_available():
+            return RASTERIZERS[name](radius)
+        warnings.warn(f"The {name} rasterizer is not available, falling back to auto")
+    for auto_name in AUTO_RASTERIZERS:
+        if RASTERIZERS[auto_name].is_available():
+            return RASTERIZERS[auto_name](radius)
+    return NumpyRasterizer(radius)
@@ -0,0 +1,403 @@
+"""HTTP service applying the pointillism filter on a pool of warm worker processes.
+
+Endpoints:
+    POST /render  Body: encoded image bytes (any format Pillow reads). Query
+                  parameters override PointillismConfig fields, e.g.
+                  /render?seed=3&opacity=0.8, and "format" picks the output
+                  encoding (png, jpg or npy, png by default). Fields that drive
+                  the cost of a render are limited to RenderService.OVERRIDE_RANGES,
+                  other values get a 400.
+    GET /stats    JSON with the queue depth, request counts and latency percentiles.
+    GET /health   200 once the worker pool is up.
+
+Usage:
+    python -m processing.render_service [--port 8080] [--workers 4] [--max-queue 8]
+"""
+
+import argparse
+import dataclasses
+import io
+import json
+import os
+import threading
+import time
+import typing
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from configs.config import PointillismConfig
+from PIL import Image, UnidentifiedImageError
+from processing.processor import Processor
+
+
+class ServiceBusy(Exception):
+    """Raised when a request arrives while every worker and queue slot is taken."""
+
+
+class RenderService:
+    """Runs render requests on a pool of worker processes, each keeping warm
+    Processors for the configs it has seen.
+
+    At most `workers` requests render at once and at most `max_queue` more wait
+    for a free worker. Requests beyond that are rejected with ServiceBusy right
+    away, so a burst cannot pile up unbounded work and latency.
+    """
+
+    # Config fields clients may not override: paths on the server and debug output
+    PROTECTED_FIELDS = (
+        "palette_cache_dir",
+        "palette_cache_size",
+        "render_cache_dir",
+        "render_cache_size",
+        "debug_mode",
+        "debug_output_dir",
+        "debug_format",
+        "debug_queue_size",
+    )
+    # Inclusive (min, max) of the overridable fields that drive the cost of a render,
+    # so a single request cannot tie up a worker for an unbounded time
+    OVERRIDE_RANGES = {
+        "kernel_size": (1, 63),
+        "cluster_distance": (1, 16),
+        "intensity_alpha": (0, 400),
+        "preprocess_strip_height": (0, 8192),
+        "palette_size": (4, 64),
+        "palette_histogram_bits": (1, 8),
+        "color_lut_bits": (0, 8),
+        "scatter_distribution_mean": (-64, 64),
+        "scatter_distribution_std": (0, 64),
+        "scatter_pattern_bank_size": (0, 1024),
+        "brushstroke_radius": (0, 16),
+        "render_strip_height": (0, 8192),
+    }
+    OUTPUT_FORMATS = {"png": "PNG", "jpg": "JPEG", "npy": None}
+    CONTENT_TYPES = {
+        "png": "image/png",
+        "jpg": "image/jpeg",
+        "npy": "application/octet-stream",
+    }
+
+    def __init__(
+        self,
+        config: PointillismConfig = None,
+        workers: int = None,
+        max_queue: int = 8,
+        latency_window: int = 1024,
+    ):
+        self.config = config or PointillismConfig()
+        self.workers = workers or os.cpu_count() or 1
+        if self.workers < 1:
+            raise ValueError("workers must be a positive integer.")
+        if max_queue < 0:
+            raise ValueError("max_queue must be a non-negative integer.")
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._counts = {"completed": 0, "failed": 0, "rejected": 0}
+        # Latencies in seconds of the most recent requests, admission to result
+        self._latencies = deque(maxlen=latency_window)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_render_worker,
+            initargs=(self.config,),
+        )
+        # Start every worker process now, each builds a Processor for the base
+        # config, so the first requests do not pay for process start and imports
+        for future in [
+            self._executor.submit(_warm_up_worker) for _ in range(self.workers)
+        ]:
+            future.result()
+
+    def parse_overrides(self, query: Dict[str, List[str]]) -> Dict:
+        """Convert query parameters to typed PointillismConfig overrides.
+
+        Raises:
+            ValueError: If a parameter is not an overridable config field, its value
+                does not parse as the field's type or is outside OVERRIDE_RANGES
+        """
+        field_types = typing.get_type_hints(PointillismConfig)
+        overrides = {}
+        for name, values in query.items():
+            if name not in field_types or name in self.PROTECTED_FIELDS:
+                raise ValueError(f"Unknown or protected config field: {name}")
+            value = _parse_value(name, values[-1], field_types[name])
+            if name in self.OVERRIDE_RANGES:
+                low, high = self.OVERRIDE_RANGES[name]
+                if not low <= value <= high:
+                    raise ValueError(
+                        f"{name} must be between {low} and {high}, got {value}"
+                    )
+            overrides[name] = value
+        return overrides
+
+    def submit(
+        self, image_bytes: bytes, overrides: Dict = None, output_format: str = "png"
+    ) -> Future:
+        """Queue a render request.
+
+        Returns:
+            Future of the encoded output bytes
+
+        Raises:
+            ServiceBusy: If all workers are busy and the queue is full
+            ValueError: If output_format is unknown
+        """
+        if output_format not in self.OUTPUT_FORMATS:
+            raise ValueError(
+                f"Unknown output format: {output_format}. Expected one of "
+                f"{tuple(self.OUTPUT_FORMATS)}"
+            )
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._counts["rejected"] += 1
+                raise ServiceBusy("All workers are busy and the queue is full.")
+            self._pending += 1
+        start = time.perf_counter()
+        try:
+            future = self._executor.submit(
+                _render_request, image_bytes, overrides or {}, output_format
+            )
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        def done(future: Future):
+            with self._lock:
+                self._pending -= 1
+                if future.exception() is None:
+                    self._counts["completed"] += 1
+                    self._latencies.append(time.perf_counter() - start)
+                else:
+                    self._counts["failed"] += 1
+
+        future.add_done_callback(done)
+        return future
+
+    def stats(self) -> Dict:
+        """Queue depth, request counts and latency percentiles in seconds."""
+        with self._lock:
+            pending = self._pending
+            counts = dict(self._counts)
+            latencies = np.array(self._latencies)
+        stats = {
+            "workers": self.workers,
+            "in_flight": min(pending, self.workers),
+            "queue_depth": max(0, pending - self.workers),
+            "max_queue": self.max_queue,
+            **counts,
+        }
+        if len(latencies):
+            for percentile in (50, 90, 99):
+                stats[f"latency_p{percentile}"] = float(
+                    np.percentile(latencies, percentile)
+                )
+            stats["latency_max"] = float(latencies.max())
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of the RenderService in server.service."""
+
+    CHUNK_SIZE = 1 << 16  # bytes written per chunk of a response body
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/stats":
+            self._send_json(200, self.server.service.stats())
+        else:
+            self._send_json(404, {"error": f"Unknown path: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/render":
+            self._send_json(404, {"error": f"Unknown path: {url.path}"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length <= 0:
+            self._send_json(411, {"error": "The image must be sent as the body."})
+            return
+        if length > self.server.max_body_size:
+            # The body is left unread, so the connection cannot be reused
+            self.close_connection = True
+            self._send_json(413, {"error": "The image is too large."})
+            return
+        image_bytes = self.rfile.read(length)
+
+        service = self.server.service
+        query = parse_qs(url.query)
+        output_format = query.pop("format", ["png"])[-1]
+        try:
+            overrides = service.parse_overrides(query)
+            future = service.submit(image_bytes, overrides, output_format)
+        except ValueError as error:
+            self._send_json(400, {"error": str(error)})
+            return
+        except ServiceBusy as error:
+            self._send_json(503, {"error": str(error)}, {"Retry-After": "1"})
+            return
+
+        try:
+            output = future.result()
+        except ValueError as error:
+            self._send_json(400, {"error": str(error)})
+            return
+        except Exception as error:
+            self._send_json(500, {"error": f"{type(error).__name__}: {error}"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", service.CONTENT_TYPES[output_format])
+        self.send_header("Content-Length", str(len(output)))
+        self.end_headers()
+        view = memoryview(output)
+        for start in range(0, len(view), self.CHUNK_SIZE):
+            self.wfile.write(view[start : start + self.CHUNK_SIZE])
+
+    def _send_json(self, status: int, body: Dict, headers: Dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(
+    service: RenderService,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    max_body_size: int = 64 << 20,
+    verbose: bool = False,
+) -> ThreadingHTTPServer:
+    """Create the HTTP server of a RenderService. Call serve_forever to run it."""
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.max_body_size = max_body_size
+    server.verbose = verbose
+    return server
+
+
+def _parse_value(name: str, value: str, field_type):
+    if typing.get_origin(field_type) is typing.Union:
+        if value.lower() == "none":
+            return None
+        field_type = next(
+            argument
+            for argument in typing.get_args(field_type)
+            if argument is not type(None)
+        )
+    try:
+        if field_type is bool:
+            if value.lower() not in ("1", "0", "true", "false", "yes", "no"):
+                raise ValueError
+            return value.lower() in ("1", "true", "yes")
+        return field_type(value)
+    except ValueError:
+        raise ValueError(
+            f"Invalid value for {name}: {value!r}, expected {field_type.__name__}"
+        ) from None
+
+
+_render_worker_state = {}
+
+
+def _init_render_worker(config: PointillismConfig):
+    _render_worker_state["config"] = config
+    # Processors by config overrides, least recently used first
+    _render_worker_state["processors"] = OrderedDict()
+    _get_processor({})
+
+
+def _warm_up_worker():
+    return os.getpid()
+
+
+def _get_processor(overrides: Dict, max_processors: int = 8) -> Processor:
+    processors = _render_worker_state["processors"]
+    key = tuple(sorted(overrides.items()))
+    if key in processors:
+        processors.move_to_end(key)
+        return processors[key]
+    processor = Processor(
+        dataclasses.replace(_render_worker_state["config"], **overrides)
+    )
+    processors[key] = processor
+    if len(processors) > max_processors:
+        processors.popitem(last=False)
+    return processor
+
+
+def _render_request(image_bytes: bytes, overrides: Dict, output_format: str) -> bytes:
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image = np.asarray(image.convert("RGB"))
+    except UnidentifiedImageError:
+        raise ValueError("The body is not an image Pillow can decode.") from None
+    canvas = _get_processor(overrides).apply_pointillism(image)
+
+    output = io.BytesIO()
+    if output_format == "npy":
+        np.save(output, canvas, allow_pickle=False)
+    else:
+        Image.fromarray(canvas, "RGB").save(
+            output, format=RenderService.OUTPUT_FORMATS[output_format]
+        )
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=8,
+        help="requests waiting for a worker before new ones get 503 (default: 8)",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="default random seed")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    service = RenderService(
+        PointillismConfig(seed=args.seed), args.workers, args.max_queue
+    )
+    server = create_server(service, args.host, args.port, verbose=args.verbose)
+    print(
+        f"Serving on http://{args.host}:{server.server_port} with "
+        f"{service.workers} workers"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
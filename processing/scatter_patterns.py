@@ -0,0 +1,101 @@
+import numpy as np
+from processing.rasterizers import compute_disc_offsets
+
+
+class ScatterPatternBank:
+    """Bank of precomputed Gaussian dot offset patterns.
+
+    Every pattern is a sequence of `length` integer (dx, dy) dot offsets drawn
+    from the scatter distribution, rounded down to whole pixels. A run of n <=
+    length dots around a center uses the first n offsets of one pattern, and a
+    prefix of i.i.d. samples is itself an i.i.d. sample, so one bank serves every
+    dot count. Longer runs are split over several patterns by the caller.
+
+    Because the dots of a run share their color, an opaque run only needs the union
+    of its discs. For every pattern the bank keeps that union as pixel offsets
+    sorted by the first dot covering them, so the footprint of the first n dots is
+    a prefix too, and a run is stamped with far fewer pixel writes than drawing
+    each of its dots.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        mean: float,
+        std: float,
+        radius: int,
+        seed: int = None,
+        length: int = 1024,
+    ):
+        """
+        Args:
+            size: Number of patterns
+            mean: Mean of the Gaussian dot offsets, see scatter_distribution_mean
+            std: Standard deviation of the offsets, see scatter_distribution_std
+            radius: Brushstroke radius of the footprints
+            seed: Seed of the offsets, None draws fresh entropy
+            length: Dots per pattern
+        """
+        if size < 1 or length < 1:
+            raise ValueError("The pattern bank size and length must be positive.")
+        self.size = size
+        self.length = length
+        self.radius = radius
+        offsets = np.random.default_rng(seed).normal(
+            loc=mean, scale=std, size=(length, size, 2)
+        )
+        # (length, size, 2) int16 (dx, dy) offsets, position-major
+        self.offsets = np.floor(offsets).astype(np.int16)
+        self._compute_footprints(compute_disc_offsets(radius))
+
+    def dot_offsets(self, patterns: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        """Offsets of runs of counts[i] <= length dots using patterns[i], concatenated.
+
+        Returns:
+            (counts.sum(), 2) int array of (dx, dy) offsets
+        """
+        ends = np.cumsum(counts)
+        positions = np.arange(ends[-1] if len(ends) else 0)
+        positions -= np.repeat(ends - counts, counts)
+        return self.offsets[positions, np.repeat(patterns, counts)]
+
+    def footprints(self, patterns: np.ndarray, counts: np.ndarray):
+        """Pixels covered by runs of counts[i] <= length dots using patterns[i].
+
+        Returns:
+            Tuple of the run index, dy and dx of every covered pixel, runs in order
+        """
+        pattern_keys = patterns.astype(np.int64) * (self.length + 1)
+        starts = np.searchsorted(self._footprint_keys, pattern_keys)
+        stops = np.searchsorted(self._footprint_keys, pattern_keys + counts)
+        sizes = stops - starts
+        ends = np.cumsum(sizes)
+        indices = np.arange(ends[-1] if len(ends) else 0)
+        indices += np.repeat(starts - (ends - sizes), sizes)
+        runs = np.repeat(np.arange(len(patterns)), sizes)
+        return runs, self._footprint_dy[indices], self._footprint_dx[indices]
+
+    def _compute_footprints(self, disc_offsets):
+        disc_y, disc_x = disc_offsets
+        # Every covered pixel gets a key local to its pattern's bounding box
+        low = self.offsets.min(axis=(0, 1)) - self.radius
+        span = int((self.offsets.max(axis=(0, 1)) + self.radius - low).max()) + 1
+        box_size = span * span
+        pattern_bases = np.arange(self.size, dtype=np.int64) * box_size
+
+        first_dot = np.full(self.size * box_size, self.length, dtype=np.int32)
+        disc_keys = (disc_y - low[1]) * span + (disc_x - low[0])
+        # Latest dots first, so every pixel ends up with the first dot covering it
+        for position in range(self.length - 1, -1, -1):
+            dx, dy = self.offsets[position].T.astype(np.int64)
+            centers = pattern_bases + dy * span + dx
+            first_dot[(centers[:, None] + disc_keys).reshape(-1)] = position
+
+        covered = np.flatnonzero(first_dot < self.length)
+        patterns, local = np.divmod(covered, box_size)
+        keys = patterns * (self.length + 1) + first_dot[covered]
+        order = np.argsort(keys, kind="stable")
+        self._footprint_keys = keys[order]
+        local = local[order]
+        self._footprint_dy = (local // span + low[1]).astype(np.int32)
+        self._footprint_dx = (local % span + low[0]).astype(np.int32)
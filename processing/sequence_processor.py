@@ -0,0 +1,274 @@
+from typing import Iterable, Iterator
+import cv2
+import numpy as np
+from configs.config import PointillismConfig
+from processing.processor import Processor
+
+
+class SequenceProcessor:
+    """Applies the pointillism filter to a stream of video frames.
+
+    The first frame and every frame after a scene change are rendered in full and
+    become the keyframe. In between, the keyframe palette is reused and the
+    downsampled frame is compared block by block against the pixels the current
+    clusters were computed from: only blocks that changed by more than
+    block_tolerance get new dot clusters, and only the canvas around them is
+    redrawn. The rest of the canvas is carried over, which also keeps static areas
+    from flickering.
+
+    Frames are pulled from the input iterable and yielded one at a time, so a clip
+    is never held in memory as a whole.
+    """
+
+    HISTOGRAM_BITS = 4  # bits per channel of the scene-change color histogram
+
+    def __init__(
+        self,
+        config: PointillismConfig = None,
+        scene_change_threshold: float = 0.3,
+        block_size: int = 8,
+        block_tolerance: float = 6.0,
+    ):
+        """
+        Args:
+            config: Filter configuration, shared by all frames
+            scene_change_threshold: Distance in [0, 1] between the color histograms of
+                the keyframe and a frame above which the palette is recomputed and the
+                frame rendered in full
+            block_size: Side in downsampled pixels of the blocks compared between frames
+            block_tolerance: Mean absolute channel difference above which a block counts
+                as changed
+        """
+        self.config = config or PointillismConfig()
+        if not 0 <= scene_change_threshold <= 1:
+            raise ValueError("scene_change_threshold must be between 0 and 1.")
+        if block_size < 1:
+            raise ValueError("block_size must be a positive integer.")
+        if block_tolerance < 0:
+            raise ValueError("block_tolerance must not be negative.")
+        self.scene_change_threshold = scene_change_threshold
+        self.block_size = block_size
+        self.block_tolerance = block_tolerance
+        self.processor = Processor(self.config)
+        self.stats = {"keyframes": 0, "updated_frames": 0, "unchanged_frames": 0}
+        self.reset()
+
+    def reset(self):
+        """Forget the current keyframe, so the next frame is rendered in full."""
+        self._palette = None
+        self._color_triple_inverses = None
+        self._keyframe_histogram = None
+        self._reference = None
+        self._dot_clusters = None
+        self._canvas = None
+        self._palette_rng, self._transform_rng, self._render_rng = (
+            self.processor.create_stage_rngs()
+        )
+
+    def process(self, frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """Render every frame of `frames`, yielding the canvases in order.
+
+        Args:
+            frames: Iterable of RGB uint8 frames of shape (height, width, 3)
+
+        Yields:
+            The pointillism-rendered frame. Each canvas is a new array, so it may be
+            kept or modified by the caller.
+        """
+        for frame in frames:
+            yield self.process_frame(frame)
+
+    def process_frame(self, frame: np.ndarray) -> np.ndarray:
+        """Render the next frame of the sequence."""
+        self.processor.validate_image_input(frame)
+        preprocessed_image = self.processor.preprocessor.preprocess_image(frame)
+        histogram = self._color_histogram(preprocessed_image)
+
+        if (
+            self._reference is None
+            or self._reference.shape != preprocessed_image.shape
+            or self._histogram_distance(histogram, self._keyframe_histogram)
+            > self.scene_change_threshold
+        ):
+            self._render_keyframe(preprocessed_image, histogram)
+            self.stats["keyframes"] += 1
+        else:
+            changed_blocks = self._find_changed_blocks(preprocessed_image)
+            if changed_blocks.any():
+                self._update_blocks(preprocessed_image, changed_blocks)
+                self.stats["updated_frames"] += 1
+            else:
+                self.stats["unchanged_frames"] += 1
+        return self._canvas.copy()
+
+    def _render_keyframe(self, preprocessed_image: np.ndarray, histogram: np.ndarray):
+        if self.config.debug_mode:
+            print("Scene change, rendering keyframe")
+        processor = self.processor
+        self._palette = processor.compute_color_palette(
+            preprocessed_image, self._palette_rng
+        )
+        self._color_triple_inverses = (
+            processor.color_palette.compute_color_triple_inverses(self._palette)
+        )
+        self._dot_clusters = processor.color_transformer.transform(
+            preprocessed_image,
+            self._palette,
+            self._color_triple_inverses,
+            rng=self._transform_rng,
+        )
+        self._keyframe_histogram = histogram
+        self._reference = np.array(preprocessed_image)
+
+        height, width = preprocessed_image.shape[:2]
+        cluster_distance = self.config.cluster_distance
+        self._canvas = np.full(
+            (height * cluster_distance, width * cluster_distance, 3),
+            255,
+            dtype=np.uint8,
+        )
+        processor.image_generator.render_region(
+            self._dot_clusters, self._canvas, 0, 0, self._render_rng
+        )
+
+    def _find_changed_blocks(self, preprocessed_image: np.ndarray) -> np.ndarray:
+        """Boolean (block rows, block columns) grid of blocks whose mean absolute
+        difference from the reference exceeds block_tolerance."""
+        difference = cv2.absdiff(preprocessed_image, self._reference)
+        difference = difference.sum(axis=2, dtype=np.float64)
+
+        height, width = difference.shape
+        size = self.block_size
+        block_rows, block_cols = -(-height // size), -(-width // size)
+        padded = np.zeros((block_rows * size, block_cols * size))
+        padded[:height, :width] = difference
+        block_sums = padded.reshape(block_rows, size, block_cols, size).sum(axis=(1, 3))
+
+        # Edge blocks may be cut short by the image border
+        row_counts = np.minimum(size, height - np.arange(block_rows) * size)
+        col_counts = np.minimum(size, width - np.arange(block_cols) * size)
+        pixel_counts = np.outer(row_counts, col_counts) * 3
+        return block_sums / pixel_counts > self.block_tolerance
+
+    def _update_blocks(
+        self, preprocessed_image: np.ndarray, changed_blocks: np.ndarray
+    ):
+        """Recompute the clusters of the changed blocks and redraw the canvas around them.
+
+        Dots of a cluster land up to compute_dot_reach() canvas pixels from its center,
+        so the canvas is redrawn over the changed blocks grown by that reach, from
+        every cluster (changed or not) whose dots can land there.
+        """
+        processor = self.processor
+        height, width = preprocessed_image.shape[:2]
+        size = self.block_size
+        cluster_distance = self.config.cluster_distance
+
+        changed_pixels = self._expand_blocks(changed_blocks, size, height, width)
+        cluster_indices = np.flatnonzero(changed_pixels)
+        updated_clusters = processor.color_transformer.transform(
+            preprocessed_image,
+            self._palette,
+            self._color_triple_inverses,
+            cluster_indices,
+            self._transform_rng,
+        )
+        self._dot_clusters.replace(cluster_indices, updated_clusters)
+        self._reference[changed_pixels] = preprocessed_image[changed_pixels]
+
+        reach = processor.image_generator.compute_dot_reach()
+        reach_blocks = -(-reach // (cluster_distance * size))
+        kernel = np.ones((2 * reach_blocks + 1, 2 * reach_blocks + 1), dtype=np.uint8)
+        dirty_blocks = cv2.dilate(changed_blocks.astype(np.uint8), kernel)
+        source_blocks = cv2.dilate(dirty_blocks, kernel).astype(bool)
+        dirty_blocks = dirty_blocks.astype(bool)
+
+        # Redraw the bounding box of the dirty blocks, then copy back only dirty pixels
+        block_rows = np.flatnonzero(dirty_blocks.any(axis=1))
+        block_cols = np.flatnonzero(dirty_blocks.any(axis=0))
+        block_pixels = size * cluster_distance
+        top, bottom = block_rows[0] * block_pixels, (block_rows[-1] + 1) * block_pixels
+        left, right = block_cols[0] * block_pixels, (block_cols[-1] + 1) * block_pixels
+        bottom = min(bottom, self._canvas.shape[0])
+        right = min(right, self._canvas.shape[1])
+
+        region = np.full((bottom - top, right - left, 3), 255, dtype=np.uint8)
+        source_pixels = self._expand_blocks(source_blocks, size, height, width)
+        processor.image_generator.render_region(
+            self._dot_clusters.select(np.flatnonzero(source_pixels)),
+            region,
+            top,
+            left,
+            self._render_rng,
+        )
+
+        dirty_pixels = self._expand_blocks(
+            dirty_blocks, block_pixels, *self._canvas.shape[:2]
+        )[top:bottom, left:right]
+        self._canvas[top:bottom, left:right][dirty_pixels] = region[dirty_pixels]
+
+    @staticmethod
+    def _expand_blocks(blocks: np.ndarray, size: int, height: int, width: int):
+        """Boolean (height, width) pixel mask of a block grid with blocks of size x size."""
+        return np.repeat(np.repeat(blocks, size, axis=0), size, axis=1)[:height, :width]
+
+    def _color_histogram(self, image: np.ndarray) -> np.ndarray:
+        """Normalized joint RGB histogram with HISTOGRAM_BITS bits per channel."""
+        bits = self.HISTOGRAM_BITS
+        quantized = (image >> (8 - bits)).astype(np.int64).reshape(-1, 3)
+        bins = (
+            (quantized[:, 0] << (2 * bits))
+            | (quantized[:, 1] << bits)
+            | quantized[:, 2]
+        )
+        histogram = np.bincount(bins, minlength=1 << (3 * bits)).astype(np.float64)
+        return histogram / max(histogram.sum(), 1)
+
+    @staticmethod
+    def _histogram_distance(histogram1: np.ndarray, histogram2: np.ndarray) -> float:
+        """Total variation distance between two normalized histograms, in [0, 1]."""
+        return 0.5 * float(np.abs(histogram1 - histogram2).sum())
+
+
+def read_video_frames(path: str) -> Iterator[np.ndarray]:
+    """Yield the frames of a video file as RGB uint8 arrays, one at a time."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    try:
+        while True:
+            success, frame = capture.read()
+            if not success:
+                return
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    finally:
+        capture.release()
+
+
+def write_video_frames(
+    frames: Iterable[np.ndarray], path: str, fps: float, fourcc: str = "mp4v"
+) -> int:
+    """Write RGB uint8 frames to a video file as they arrive.
+
+    The frame size is taken from the first frame.
+
+    Returns:
+        Number of frames written
+    """
+    writer = None
+    count = 0
+    try:
+        for frame in frames:
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(
+                    path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height)
+                )
+                if not writer.isOpened():
+                    raise ValueError(f"Could not open video writer for {path}")
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            count += 1
+    finally:
+        if writer is not None:
+            writer.release()
+    return count
@@ -0,0 +1,131 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+from configs.config import PointillismConfig
+from processing.color_palette import ColorPalette
+
+
+@dataclass(frozen=True)
+class PipelineStage:
+    """A stage of the pipeline before rendering, see PIPELINE_STAGES.
+
+    A stage's result depends only on the source image, the config fields it lists
+    and the results of its input stages, so two configs that agree on all of these
+    share the result.
+    """
+
+    name: str
+    fields: Tuple[str, ...]  # PointillismConfig fields the result depends on
+    inputs: Tuple[str, ...] = ()  # stages whose results it consumes
+    # Draws from a stage random generator, so the result is only reproducible,
+    # and memoized, for seeded configs
+    random: bool = False
+
+
+# Stages in dependency order. Rendering, the leaf every config ends in, is not
+# memoized: whole canvases are kept by the on-disk render cache instead
+PIPELINE_STAGES = (
+    PipelineStage(
+        "preprocess", ("kernel_size", "cluster_distance", "preprocess_engine")
+    ),
+    PipelineStage(
+        "palette", ColorPalette.CACHE_KEY_FIELDS, ("preprocess",), random=True
+    ),
+    PipelineStage("inverses", (), ("palette",)),
+    PipelineStage(
+        "transform",
+        (
+            "intensity_alpha",
+            "gamma_distortion",
+            "color_lut_bits",
+            "color_lut_exact",
+            "color_search_space",
+            "seed",
+        ),
+        ("preprocess", "palette", "inverses"),
+        random=True,
+    ),
+)
+
+
+def stage_keys(config: PointillismConfig, image_key: str) -> Dict[str, Optional[str]]:
+    """Memoization key of every stage in PIPELINE_STAGES for a config.
+
+    Args:
+        config: Pipeline config
+        image_key: Content hash of the source image, see content_hash
+
+    Returns:
+        Dict from stage name to its key, None for stages that draw random numbers
+        without a seed and for the stages that consume their results
+    """
+    keys = {}
+    for stage in PIPELINE_STAGES:
+        input_keys = [keys[name] for name in stage.inputs]
+        if (stage.random and config.seed is None) or None in input_keys:
+            keys[stage.name] = None
+            continue
+        digest = hashlib.blake2b(digest_size=20)
+        fields = ",".join(
+            f"{field}={getattr(config, field)!r}" for field in stage.fields
+        )
+        digest.update(f"{stage.name}|{image_key}|{fields}".encode())
+        for key in input_keys:
+            digest.update(key.encode())
+        keys[stage.name] = digest.hexdigest()
+    return keys
+
+
+class StageCache:
+    """In-process LRU cache of pipeline stage results with a size cap.
+
+    Results are shared with every caller and must not be modified. Processors
+    sharing a StageCache compute every stage result at most once at a time:
+    callers asking for a result that is being computed wait for it instead of
+    computing it again, so concurrent configs with a shared prefix of stages run
+    that prefix once.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key: str, compute: Callable):
+        """The result cached under key, computed with compute() on a miss."""
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return self._entries[key]
+                done = self._in_flight.get(key)
+                if done is None:
+                    done = self._in_flight[key] = threading.Event()
+                    self.stats["misses"] += 1
+                    break
+            # Another caller computes the result, wait and look it up again. When
+            # that caller failed, or the result was evicted, this one computes it
+            done.wait()
+
+        try:
+            value = compute()
+            with self._lock:
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            done.set()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,144 @@
+import abc
+import os
+import struct
+import zlib
+import numpy as np
+
+
+class StripWriter(abc.ABC):
+    """Writes an RGB uint8 image of a known size strip by strip, top to bottom.
+
+    Only the strip being written is held in memory, so an image can be written
+    without ever materializing it whole.
+    """
+
+    def __init__(self, path: str, height: int, width: int):
+        self.path = path
+        self.height = height
+        self.width = width
+        self.rows_written = 0
+
+    def write(self, strip: np.ndarray):
+        """Append the next rows of the image, an array of shape (rows, width, 3)."""
+        if strip.shape[1:] != (self.width, 3) or strip.dtype != np.uint8:
+            raise ValueError(
+                f"Strips must have shape (rows, {self.width}, 3) and dtype uint8."
+            )
+        if self.rows_written + len(strip) > self.height:
+            raise ValueError("Strips exceed the image height.")
+        self._write_rows(strip)
+        self.rows_written += len(strip)
+
+    def close(self):
+        """Finish the file. Raises ValueError if rows are missing."""
+        if self.rows_written != self.height:
+            raise ValueError(
+                f"Only {self.rows_written} of {self.height} rows were written."
+            )
+
+    @abc.abstractmethod
+    def _write_rows(self, strip: np.ndarray):
+        """Write the rows of a validated strip."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def abort(self):
+        """Release the file after a failure, leaving it incomplete."""
+
+
+class PngStripWriter(StripWriter):
+    """Streams a PNG, compressing every strip into IDAT chunks as it arrives.
+
+    Rows are stored unfiltered with zlib at compression_level, Pillow's default.
+    """
+
+    SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+    def __init__(self, path: str, height: int, width: int, compression_level: int = 6):
+        super().__init__(path, height, width)
+        self._file = open(path, "wb")
+        self._compressor = zlib.compressobj(compression_level)
+        self._file.write(self.SIGNATURE)
+        # 8 bits per sample, truecolor, default compression, filter and interlacing
+        self._write_chunk(
+            b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+        )
+
+    def _write_rows(self, strip: np.ndarray):
+        # Every row starts with its filter type byte, 0 for no filter
+        rows = np.zeros((len(strip), 1 + self.width * 3), dtype=np.uint8)
+        rows[:, 1:] = strip.reshape(len(strip), -1)
+        self._write_chunk(b"IDAT", self._compressor.compress(rows.tobytes()))
+
+    def close(self):
+        super().close()
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes):
+        if chunk_type == b"IDAT" and not data:
+            return
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(chunk_type + data)))
+
+
+class NpyStripWriter(StripWriter):
+    """Writes the strips into a .npy file through np.memmap, readable with np.load
+    and by open_image_source."""
+
+    def __init__(self, path: str, height: int, width: int):
+        super().__init__(path, height, width)
+        self._image = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.uint8, shape=(height, width, 3)
+        )
+
+    def _write_rows(self, strip: np.ndarray):
+        self._image[self.rows_written : self.rows_written + len(strip)] = strip
+        # Write the rows out so dirty pages do not pile up over the whole image
+        self._image.flush()
+
+    def close(self):
+        super().close()
+        self.abort()
+
+    def abort(self):
+        if self._image is not None:
+            self._image.flush()
+            self._image = None
+
+
+STRIP_WRITERS = {".png": PngStripWriter, ".npy": NpyStripWriter}
+
+
+def open_strip_writer(path: str, height: int, width: int, extension: str = None):
+    """Create the strip writer for the file extension of path.
+
+    Args:
+        path: Output path
+        height: Image height in rows
+        width: Image width in columns
+        extension: Extension that picks the format, the one of path when omitted
+
+    Raises:
+        ValueError: If the format cannot be written in strips
+    """
+    extension = (extension or os.path.splitext(path)[1]).lower()
+    if extension not in STRIP_WRITERS:
+        raise ValueError(
+            f"Cannot write {extension} images in strips. Expected one of "
+            f"{tuple(STRIP_WRITERS)}"
+        )
+    return STRIP_WRITERS[extension](path, height, width)
@@ -0,0 +1,3 @@
+from .color_space import hsv_distance, hsv_to_rgb, lab_to_rgb, rgb_to_hsv, rgb_to_lab
+
+__all__ = ["rgb_to_hsv", "hsv_to_rgb", "hsv_distance", "rgb_to_lab", "lab_to_rgb"]
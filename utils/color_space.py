@@ -0,0 +1,150 @@
+import numpy as np
+
+# sRGB (D65) to CIE XYZ
+_RGB_TO_XYZ = np.array(
+    [
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ]
+)
+_XYZ_TO_RGB = np.linalg.inv(_RGB_TO_XYZ)
+_D65_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+
+def rgb_to_hsv(rgb: np.ndarray, max_value: float = 255.0) -> np.ndarray:
+    """Convert RGB colors to HSV color space.
+
+    Works on arrays of any shape whose last axis holds the (r, g, b) channels and
+    follows colorsys.rgb_to_hsv exactly.
+
+    Args:
+        rgb: RGB colors with channel values in [0, max_value]
+        max_value: Value of a full channel, 255 for 8-bit colors
+
+    Returns:
+        Float array of the same shape with (h, s, v) in [0, 1]
+    """
+    rgb = np.asarray(rgb).astype(float) / max_value
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+
+    max_val = np.max(rgb, axis=-1)
+    min_val = np.min(rgb, axis=-1)
+    diff = max_val - min_val
+    gray = diff == 0
+    safe_diff = np.where(gray, 1.0, diff)
+    safe_max = np.where(max_val == 0, 1.0, max_val)
+
+    rc = (max_val - r) / safe_diff
+    gc = (max_val - g) / safe_diff
+    bc = (max_val - b) / safe_diff
+    h = np.where(
+        r == max_val, bc - gc, np.where(g == max_val, 2.0 + rc - bc, 4.0 + gc - rc)
+    )
+    h = np.where(gray, 0.0, (h / 6.0) % 1.0)
+    s = np.where(gray, 0.0, diff / safe_max)
+    return np.stack((h, s, max_val), axis=-1)
+
+
+def hsv_to_rgb(hsv: np.ndarray, max_value: float = 255.0) -> np.ndarray:
+    """Convert HSV colors to RGB color space.
+
+    Works on arrays of any shape whose last axis holds the (h, s, v) channels and
+    follows colorsys.hsv_to_rgb exactly. Values are not clipped, so saturations or
+    values above 1 give channels outside [0, max_value] as with colorsys.
+
+    Args:
+        hsv: HSV colors with (h, s, v) in [0, 1]
+        max_value: Value of a full channel, 255 for 8-bit colors
+
+    Returns:
+        Float array of the same shape with (r, g, b) scaled to max_value
+    """
+    hsv = np.asarray(hsv, dtype=float)
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+
+    i = (h * 6.0).astype(np.int64)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i % 6
+
+    # Channel sources per hue sector: (v, t, p), (q, v, p), (p, v, t), ...
+    candidates = np.stack((v, t, p, q), axis=-1)
+    sectors = np.array(
+        [[0, 1, 2], [3, 0, 2], [2, 0, 1], [2, 3, 0], [1, 2, 0], [0, 2, 3]]
+    )
+    rgb = np.take_along_axis(candidates, sectors[i], axis=-1)
+    rgb = np.where((s == 0.0)[..., None], v[..., None], rgb)
+    return rgb * max_value
+
+
+def hsv_distance(hsv1: np.ndarray, hsv2: np.ndarray) -> np.ndarray:
+    """Calculate distance between HSV colors, broadcasting over leading axes.
+
+    Hue is compared on the circle and weighted twice as much as saturation and value.
+    """
+    hsv1 = np.asarray(hsv1, dtype=float)
+    hsv2 = np.asarray(hsv2, dtype=float)
+
+    # Calculate circular distance for hue
+    h_abs = np.abs(hsv1[..., 0] - hsv2[..., 0])
+    h_diff = np.minimum(h_abs, 1 - h_abs)
+
+    # Calculate Euclidean distance for saturation and value
+    s_diff = hsv1[..., 1] - hsv2[..., 1]
+    v_diff = hsv1[..., 2] - hsv2[..., 2]
+
+    # Weighted distance (giving more importance to hue)
+    return np.sqrt(2 * h_diff**2 + s_diff**2 + v_diff**2)
+
+
+def rgb_to_lab(rgb: np.ndarray, max_value: float = 255.0) -> np.ndarray:
+    """Convert sRGB colors to CIE L*a*b* (D65 white point).
+
+    Args:
+        rgb: RGB colors with channel values in [0, max_value], last axis (r, g, b)
+        max_value: Value of a full channel, 255 for 8-bit colors
+
+    Returns:
+        Float array of the same shape with (L, a, b), L in [0, 100]
+    """
+    rgb = np.asarray(rgb).astype(float) / max_value
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ.T / _D65_WHITE
+
+    epsilon = 216 / 24389
+    kappa = 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+    L = 116 * f[..., 1] - 16
+    a = 500 * (f[..., 0] - f[..., 1])
+    b = 200 * (f[..., 1] - f[..., 2])
+    return np.stack((L, a, b), axis=-1)
+
+
+def lab_to_rgb(lab: np.ndarray, max_value: float = 255.0) -> np.ndarray:
+    """Convert CIE L*a*b* (D65 white point) colors to sRGB.
+
+    Args:
+        lab: L*a*b* colors, last axis (L, a, b)
+        max_value: Value of a full channel, 255 for 8-bit colors
+
+    Returns:
+        Float array of the same shape with (r, g, b) scaled to max_value, clipped
+        to the sRGB gamut
+    """
+    lab = np.asarray(lab, dtype=float)
+    fy = (lab[..., 0] + 16) / 116
+    fx = fy + lab[..., 1] / 500
+    fz = fy - lab[..., 2] / 200
+    f = np.stack((fx, fy, fz), axis=-1)
+
+    epsilon = 216 / 24389
+    kappa = 24389 / 27
+    xyz = np.where(f**3 > epsilon, f**3, (116 * f - 16) / kappa) * _D65_WHITE
+    linear = np.clip(xyz @ _XYZ_TO_RGB.T, 0, 1)
+    rgb = np.where(
+        linear <= 0.0031308, 12.92 * linear, 1.055 * linear ** (1 / 2.4) - 0.055
+    )
+    return rgb * max_value